@@ -1,22 +1,152 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from app.models.database import Base
+from sqlalchemy.schema import CreateIndex
+from app.metrics import instrument_engine
+from app.models.database import Base, CategorySpend
+from app.services.budget_service import rebuild_category_spend
+from app.services.search_service import install_search_index
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./shopsense.db")
+# Optional read replica for read-only analytics sessions
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+# "auto" picks the sqlite profile for sqlite URLs and the server profile otherwise
+DB_ENGINE_PROFILE = os.getenv("DB_ENGINE_PROFILE", "auto").lower()
+
+# SQLite profile settings
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+
+# Server (Postgres/MySQL) profile settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+
+def _resolve_profile(url: str) -> str:
+    if DB_ENGINE_PROFILE in ("sqlite", "server"):
+        return DB_ENGINE_PROFILE
+    return "sqlite" if url.startswith("sqlite") else "server"
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while a writer is active
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    # Negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def _async_url(url: str) -> str:
+    """Swap the sync driver for its asyncio counterpart"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith(("postgresql:", "postgres:")):
+        return "postgresql+asyncpg:" + url.split(":", 1)[1]
+    return url
+
+
+def build_engine(url: str):
+    """Create an engine tuned for the configured profile"""
+    if _resolve_profile(url) == "sqlite":
+        is_sqlite = url.startswith("sqlite")
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False} if is_sqlite else {}
+        )
+        if is_sqlite:
+            event.listen(engine, "connect", _apply_sqlite_pragmas)
+        return engine
+
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+def build_async_engine(url: str):
+    """Async counterpart of build_engine (aiosqlite / asyncpg)"""
+    async_url = _async_url(url)
+    if _resolve_profile(url) == "sqlite":
+        engine = create_async_engine(async_url)
+        if url.startswith("sqlite"):
+            event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        return engine
+
+    return create_async_engine(
+        async_url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+engine = build_engine(DATABASE_URL)
+read_engine = build_engine(DATABASE_READ_URL) if DATABASE_READ_URL else engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+async_engine = build_async_engine(DATABASE_URL)
+async_read_engine = build_async_engine(DATABASE_READ_URL) if DATABASE_READ_URL else async_engine
+
+instrument_engine(engine, "primary")
+instrument_engine(async_engine.sync_engine, "primary_async")
+if DATABASE_READ_URL:
+    instrument_engine(read_engine, "replica")
+    instrument_engine(async_read_engine.sync_engine, "replica_async")
+
+# expire_on_commit=False so ORM objects stay readable after commit without lazy I/O
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, expire_on_commit=False, autoflush=False)
+
+def _add_missing_columns():
+    """create_all never alters existing tables, so add new nullable columns by hand"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
 
 def init_db():
+    seed_counters = not inspect(engine).has_table(CategorySpend.__tablename__)
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    # create_all skips tables that already exist, so add any indexes they're missing
+    # (IF NOT EXISTS rather than checkfirst: reflection can't see expression indexes)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+    install_search_index(engine)
+    # Budget counters are kept up to date at ingest; seed them once from existing receipts
+    if seed_counters:
+        with SessionLocal() as session:
+            rebuild_category_spend(session)
 
 def get_db():
     db = SessionLocal()
@@ -24,3 +154,20 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    """Session for read-only queries — uses the replica when DATABASE_READ_URL is set"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    """Async session for read-only queries — uses the replica when DATABASE_READ_URL is set"""
+    async with AsyncReadSessionLocal() as db:
+        yield db
@@ -1,20 +1,42 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from app.database import init_db
+from app.responses import default_response_class
+from app.middleware.compression import CompressionMiddleware
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.tracing import TracingMiddleware
+from app.metrics import render_metrics
 from app.routers import auth
 from app.routers import recurring 
-from app.routers import receipts, analytics, insights, exports
+from app.routers import receipts, analytics, insights, exports, media, events
+from app.services.insight_service import INSIGHT_COMPACTION_INTERVAL_SECONDS, run_insight_compaction
+from app.services.storage_service import UploadStaticFiles
 import os
 
 # Initialize database
 init_db()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Dedup and retention for spending insights, in batches in the background
+    compaction = None
+    if INSIGHT_COMPACTION_INTERVAL_SECONDS > 0:
+        compaction = asyncio.create_task(run_insight_compaction())
+    yield
+    if compaction is not None:
+        compaction.cancel()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="ShopSense AI",
     description="AI-powered shopping behavior tracker and analyzer",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=default_response_class(),
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -26,10 +48,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negotiated brotli/gzip for JSON, CSV and other text payloads
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+)
+
+# Request ids, Server-Timing and per-request span logs
+app.add_middleware(TracingMiddleware)
+
+# Added last, so it is outermost (Starlette wraps in reverse order) and the recorded
+# latency includes tracing and compression
+app.add_middleware(MetricsMiddleware)
+
 # Mount uploads directory for serving images
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+app.mount("/uploads", UploadStaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 # Include routers
 app.include_router(receipts.router)
@@ -38,6 +73,8 @@ app.include_router(insights.router)
 app.include_router(exports.router)
 app.include_router(auth.router)
 app.include_router(recurring.router)
+app.include_router(media.router)
+app.include_router(events.router)
 
 @app.get("/")
 async def root():
@@ -51,6 +88,11 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
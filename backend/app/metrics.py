@@ -0,0 +1,190 @@
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Buckets in seconds: HTTP/DB are mostly sub-second, model calls take seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+AI_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template, method and status",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being served",
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled DB connection",
+    ["engine"],
+    buckets=DB_BUCKETS,
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "DB statement execution time by statement type",
+    ["engine", "statement"],
+    buckets=DB_BUCKETS,
+)
+
+AI_REQUEST_DURATION = Histogram(
+    "ai_request_duration_seconds",
+    "AI provider call latency",
+    ["provider", "model", "operation"],
+    buckets=AI_BUCKETS,
+)
+AI_REQUESTS = Counter(
+    "ai_requests_total",
+    "AI provider calls by outcome",
+    ["provider", "model", "operation", "outcome"],
+)
+AI_RETRIES = Counter(
+    "ai_retries_total",
+    "AI provider calls retried against another model",
+    ["provider", "model", "operation"],
+)
+AI_TOKENS = Counter(
+    "ai_tokens_total",
+    "Tokens reported by the AI provider (estimated for the local provider)",
+    ["provider", "model", "operation", "kind"],
+)
+AI_COST = Counter(
+    "ai_cost_usd_total",
+    "Estimated AI provider spend in USD",
+    ["provider", "model", "operation"],
+)
+AI_CACHE_LOOKUPS = Counter(
+    "ai_cache_lookups_total",
+    "Prompt cache lookups by result",
+    ["operation", "result"],
+)
+
+QUEUE_IN_FLIGHT = Gauge(
+    "queue_in_flight",
+    "Jobs running or waiting in in-process executors",
+    ["queue"],
+    multiprocess_mode="livesum",
+)
+QUEUE_REJECTED = Counter(
+    "queue_rejected_total",
+    "Jobs rejected because an in-process queue was full",
+    ["queue"],
+)
+
+EVENT_SUBSCRIBERS = Gauge(
+    "event_subscribers",
+    "Open per-user event streams",
+    multiprocess_mode="livesum",
+)
+EVENTS_PUBLISHED = Counter(
+    "events_published_total",
+    "Dashboard events published to subscribers",
+    ["event"],
+)
+EVENTS_DROPPED = Counter(
+    "events_dropped_total",
+    "Events dropped because a subscriber fell too far behind",
+)
+INSIGHTS_COMPACTED = Counter(
+    "insights_compacted_total",
+    "Insight rows removed by compaction (merged duplicates or pruned by retention)",
+    ["action"],
+)
+
+
+def _statement_type(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def instrument_engine(engine: Engine, name: str):
+    """Record pool checkout wait and statement duration for a (sync) engine"""
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.labels(name).observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_DURATION.labels(name, _statement_type(statement)).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # after_cursor_execute never fires for a failed statement
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+class AICall:
+    """Handle yielded by track_ai_call; set token counts once the response is in"""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+
+@contextmanager
+def track_ai_call(provider: str, model: str, operation: str):
+    call = AICall()
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        AI_REQUESTS.labels(provider, model, operation, "error").inc()
+        raise
+    else:
+        AI_REQUESTS.labels(provider, model, operation, "success").inc()
+        if call.prompt_tokens:
+            AI_TOKENS.labels(provider, model, operation, "prompt").inc(call.prompt_tokens)
+        if call.completion_tokens:
+            AI_TOKENS.labels(provider, model, operation, "completion").inc(call.completion_tokens)
+    finally:
+        AI_REQUEST_DURATION.labels(provider, model, operation).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def track_queue(queue: str):
+    QUEUE_IN_FLIGHT.labels(queue).inc()
+    try:
+        yield
+    finally:
+        QUEUE_IN_FLIGHT.labels(queue).dec()
+
+
+def render_metrics():
+    """Exposition body and content type; aggregates all workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,52 @@
+import re
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.tracing import log_trace, otel_tracer, start_trace
+
+# Accept a caller's request id only if it's a sane token (it ends up in logs and headers)
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class TracingMiddleware:
+    """
+    Gives every request an id (X-Request-ID, generated unless the caller sent one),
+    collects the spans opened while serving it, and reports them as a Server-Timing
+    header plus one structured log line. Scrapes and event streams (quiet_paths and
+    anything under them) get the id and header but no log line.
+    """
+
+    def __init__(self, app: ASGIApp, quiet_paths=("/metrics", "/api/events")):
+        self.app = app
+        self.quiet_paths = tuple(quiet_paths)
+
+    def _quiet(self, path: str) -> bool:
+        return any(path == p or path.startswith(p + "/") for p in self.quiet_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = Headers(scope=scope).get("x-request-id", "")
+        trace = start_trace(incoming if REQUEST_ID_RE.match(incoming) else None)
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(raw=message["headers"])
+                headers["X-Request-ID"] = trace.request_id
+                headers.append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        root = otel_tracer.start_as_current_span(f"{scope['method']} {scope['path']}") if otel_tracer else None
+        if root:
+            root.__enter__().set_attribute("request.id", trace.request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if root:
+                root.__exit__(None, None, None)
+            if not self._quiet(scope["path"]):
+                log_trace(trace, scope["method"], scope["path"], status_code)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Text, Boolean, Index, UniqueConstraint, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -28,6 +28,7 @@ class Receipt(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)   
     filename = Column(String, nullable=False)
+    original_filename = Column(String, nullable=True)
     upload_date = Column(DateTime, default=datetime.utcnow)
     store_name = Column(String, nullable=True)
     purchase_date = Column(DateTime, nullable=True)
@@ -37,18 +38,62 @@ class Receipt(Base):
     owner = relationship("User", back_populates="receipts")             
     items = relationship("Item", back_populates="receipt", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Keyset pagination cursor: (upload_date, id) within a user
+        Index("ix_receipts_user_upload_date_id", "user_id", "upload_date", "id"),
+        Index("ix_receipts_user_purchase_date", "user_id", "purchase_date"),
+        # Price history dates receipts without a purchase date by their upload
+        Index("ix_receipts_user_effective_date", "user_id", func.coalesce(purchase_date, upload_date)),
+    )
+
+
+class StoredFile(Base):
+    """Content-addressed upload blob, shared by every receipt with identical bytes"""
+    __tablename__ = "stored_files"
+
+    key = Column(String, primary_key=True)
+    size = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=True)
+    ref_count = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Uploads that matched this content and haven't committed or abandoned their receipt
+    # yet; the blob isn't deleted under them (claims older than the grace period are
+    # treated as abandoned by a crashed worker)
+    pending_claims = Column(Integer, nullable=True, default=0)
+    claimed_at = Column(DateTime, nullable=True)
+
 
 class Item(Base):
     __tablename__ = "items"
 
     id = Column(Integer, primary_key=True, index=True)
-    receipt_id = Column(Integer, ForeignKey("receipts.id"))
+    receipt_id = Column(Integer, ForeignKey("receipts.id"), index=True)
     name = Column(String, nullable=False)
     price = Column(Float, nullable=False)
     quantity = Column(Integer, default=1)
     category = Column(String, nullable=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True, index=True)
 
     receipt = relationship("Receipt", back_populates="items")
+    product = relationship("Product", back_populates="items")
+
+    __table_args__ = (
+        # Price history: a user's receipts by date, then their items for one product
+        Index("ix_items_receipt_product", "receipt_id", "product_id", "price"),
+    )
+
+
+class Product(Base):
+    """Canonical product that free-text item names are normalized onto"""
+    __tablename__ = "products"
+
+    id = Column(Integer, primary_key=True, index=True)
+    canonical_name = Column(String, nullable=False)
+    normalized_key = Column(String, unique=True, index=True, nullable=False)
+    category = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    items = relationship("Item", back_populates="product")
 
 
 class SpendingInsight(Base):
@@ -62,9 +107,21 @@ class SpendingInsight(Base):
     description = Column(Text, nullable=False)
     category = Column(String, nullable=True)
     amount = Column(Float, nullable=True)
+    # How unusual a detected anomaly is (robust z-score); null for model-written insights
+    score = Column(Float, nullable=True)
+    # Dedup key with user_id and insight_type; null only on rows written before
+    # it existed, until the compaction job fills it in
+    subject = Column(String, nullable=True)
+    period = Column(Date, nullable=True)
 
     owner = relationship("User", back_populates="insights")             
 
+    __table_args__ = (
+        Index("ix_spending_insights_user_date_id", "user_id", "insight_date", "id"),
+        Index("uq_spending_insights_key", "user_id", "insight_type", "subject", "period", unique=True),
+        Index("ix_spending_insights_date", "insight_date"),
+    )
+
 
 class Budget(Base):
     __tablename__ = "budgets"
@@ -76,4 +133,59 @@ class Budget(Base):
     current_spent = Column(Float, default=0.0)
     last_reset = Column(DateTime, default=datetime.utcnow)
 
-    owner = relationship("User", back_populates="budgets")              
\ No newline at end of file
+    owner = relationship("User", back_populates="budgets")              
+
+
+class AIUsage(Base):
+    """Provider calls, tokens and estimated cost per user, operation and model, rolled up by day"""
+    __tablename__ = "ai_usage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    day = Column(Date, nullable=False)
+    operation = Column(String, nullable=False)
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    requests = Column(Integer, default=0, nullable=False)
+    prompt_tokens = Column(Integer, default=0, nullable=False)
+    completion_tokens = Column(Integer, default=0, nullable=False)
+    cost_usd = Column(Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", "operation", "provider", "model", name="uq_ai_usage_rollup"),
+    )
+
+
+class CategorySpend(Base):
+    """Running item spend per user, calendar month and category, maintained at ingest"""
+    __tablename__ = "category_spend"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    period = Column(Date, nullable=False)  # first day of the month
+    category = Column(String, nullable=False)
+    amount = Column(Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "period", "category", name="uq_category_spend_period"),
+    )
+
+
+class BudgetAlert(Base):
+    """A budget moving up into "warning" (over 80%) or "over" (over 100%) for a month"""
+    __tablename__ = "budget_alerts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    budget_id = Column(Integer, ForeignKey("budgets.id", ondelete="SET NULL"), nullable=True)
+    receipt_id = Column(Integer, nullable=True)  # the upload that crossed the threshold, if any
+    category = Column(String, nullable=False)
+    period = Column(Date, nullable=False)
+    status = Column(String, nullable=False)
+    spent = Column(Float, nullable=False)
+    monthly_limit = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_budget_alerts_user_created_id", "user_id", "created_at", "id"),
+    )
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
-from datetime import datetime
+from pydantic import BaseModel, Field, computed_field
+from typing import List, Optional, Union
+from datetime import date, datetime
+from app.services.image_service import has_derivatives, media_url
 
 class ItemBase(BaseModel):
     name: str
@@ -26,15 +27,62 @@ class ReceiptBase(BaseModel):
 class ReceiptCreate(ReceiptBase):
     filename: str
 
-class ReceiptResponse(ReceiptBase):
+class ReceiptMediaMixin(BaseModel):
+    """Cacheable image URLs derived from the stored file key"""
+    filename: str
+
+    @computed_field
+    @property
+    def image_url(self) -> str:
+        return media_url(self.filename)
+
+    @computed_field
+    @property
+    def thumbnail_url(self) -> Optional[str]:
+        return media_url(self.filename, "thumb") if has_derivatives(self.filename) else None
+
+    @computed_field
+    @property
+    def preview_url(self) -> Optional[str]:
+        return media_url(self.filename, "preview") if has_derivatives(self.filename) else None
+
+class ReceiptResponse(ReceiptMediaMixin, ReceiptBase):
     id: int
     filename: str
+    original_filename: Optional[str] = None
     upload_date: datetime
     items: List[ItemResponse] = []
     
     class Config:
         from_attributes = True
 
+class ReceiptSummary(ReceiptMediaMixin, ReceiptBase):
+    id: int
+    filename: str
+    original_filename: Optional[str] = None
+    upload_date: datetime
+    item_count: int = 0
+
+class ReceiptPage(BaseModel):
+    receipts: List[Union[ReceiptResponse, ReceiptSummary]]
+    next_cursor: Optional[str] = None
+
+class ReceiptSearchHit(BaseModel):
+    receipt_id: int
+    store_name: Optional[str] = None
+    purchase_date: Optional[datetime] = None
+    total_amount: Optional[float] = None
+    score: float
+    snippet: Optional[str] = None
+
+class ReceiptSearchPage(BaseModel):
+    results: List[ReceiptSearchHit]
+    next_offset: Optional[int] = None
+
+class PriceHistoryPage(BaseModel):
+    series: List[dict]
+    next_offset: Optional[int] = None
+
 class SpendingAnalytics(BaseModel):
     total_spent: float
     transaction_count: int
@@ -45,6 +93,28 @@ class SpendingAnalytics(BaseModel):
     spending_by_store: dict
     monthly_trend: List[dict]
 
+class TimeSeriesPoint(BaseModel):
+    period: date  # first day of the period
+    label: str
+    total: float
+    count: int  # receipts in the period
+
+class TimeSeriesResponse(BaseModel):
+    granularity: str
+    start: date
+    end: date
+    category: Optional[str] = None
+    store: Optional[str] = None
+    total: float
+    count: int
+    points: List[TimeSeriesPoint]
+
+class DashboardResponse(BaseModel):
+    """Only the sections asked for with ?fields= are present"""
+    spending: Optional[SpendingAnalytics] = None
+    categories: Optional[dict] = None
+    budgets: Optional[List[dict]] = None
+
 class InsightResponse(BaseModel):
     id: int
     insight_type: str
@@ -52,11 +122,16 @@ class InsightResponse(BaseModel):
     description: str
     category: Optional[str]
     amount: Optional[float]
+    score: Optional[float] = None
     insight_date: datetime
     
     class Config:
         from_attributes = True
 
+class InsightPage(BaseModel):
+    insights: List[InsightResponse]
+    next_cursor: Optional[str] = None
+
 class BudgetCreate(BaseModel):
     category: str
     monthly_limit: float
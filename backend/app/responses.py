@@ -0,0 +1,25 @@
+import json
+import os
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Opt-in: FAST_JSON=true renders every route with orjson instead of the stdlib json module
+FAST_JSON = os.getenv("FAST_JSON", "false").lower() in ("1", "true", "yes")
+
+
+def sse_event(event: str, data) -> str:
+    """One Server-Sent Events frame; data is JSON so clients can parse every event the same way"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def default_response_class():
+    if FAST_JSON and orjson is not None:
+        return ORJSONResponse
+    if FAST_JSON:
+        print("⚠️ FAST_JSON is set but orjson is not installed; using the default JSON encoder")
+    return JSONResponse
+
@@ -1,68 +1,159 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models.schemas import SpendingAnalytics, BudgetCreate, BudgetResponse
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, get_async_read_db
+from app.models.schemas import SpendingAnalytics, BudgetCreate, BudgetResponse, DashboardResponse, PriceHistoryPage, TimeSeriesResponse
 from app.models.database import Budget, User
-from app.services.analytics_service import analytics_service
+from app.services.analytics_service import analytics_service, DASHBOARD_SECTIONS, GRANULARITIES, period_start
+from app.services.event_service import publish_update
+from app.services.budget_service import alert_payload, apply_budget_limit, recent_alerts
+from app.services.cache_service import invalidate_user
 from app.dependencies import get_current_user
-from typing import List
+from typing import List, Optional
+from datetime import date, datetime, timedelta
 
 router = APIRouter(prefix="/api/analytics", tags=["analytics"])
 
 
+@router.get("/dashboard", response_model=DashboardResponse, response_model_exclude_unset=True)
+async def get_dashboard(
+    fields: Optional[str] = Query(None, description="Comma-separated sections: spending,categories,budgets (default all)"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Spending, category breakdown and budget status in one request, computed from a single scan"""
+    sections = DASHBOARD_SECTIONS
+    if fields:
+        sections = tuple(f.strip() for f in fields.split(",") if f.strip())
+        unknown = set(sections) - set(DASHBOARD_SECTIONS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return await analytics_service.get_dashboard_cached(db, current_user.id, sections)
+
+
 @router.get("/spending", response_model=SpendingAnalytics)
 async def get_spending_analytics(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)  # 👈 added
 ):
     """Get comprehensive spending analytics for logged-in user"""
-    return analytics_service.calculate_spending_analytics(db, current_user.id)  # 👈 pass user_id
+    return await db.run_sync(analytics_service.calculate_spending_analytics, current_user.id)
 
 
 @router.get("/categories")
 async def get_category_breakdown(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)  # 👈 added
 ):
     """Get detailed breakdown by category for logged-in user"""
-    return analytics_service.get_category_breakdown(db, current_user.id)  # 👈 pass user_id
+    return await db.run_sync(analytics_service.get_category_breakdown, current_user.id)
+
+
+@router.get("/timeseries", response_model=TimeSeriesResponse)
+async def get_timeseries(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: str = Query("month", pattern=f"^({'|'.join(GRANULARITIES)})$"),
+    category: Optional[str] = None,
+    store: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Spending per day/week/month/quarter over any date range (default: the last 12 months)"""
+    end = end or datetime.utcnow().date()
+    if start is None:
+        start = period_start(end, "month")
+        for _ in range(11):
+            start = period_start(start - timedelta(days=1), "month")
+    try:
+        return await db.run_sync(
+            analytics_service.get_timeseries,
+            current_user.id,
+            start,
+            end,
+            granularity,
+            category=category,
+            store=store
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/price-history", response_model=PriceHistoryPage)
+async def get_price_history(
+    product_id: Optional[int] = None,
+    product: Optional[str] = None,
+    store: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    jump_threshold: float = Query(0.2, gt=0),
+    limit: int = Query(50, ge=1, le=200, description="Products per page when no product is given"),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Price paid over time for each product and store, with min/max/median and flagged jumps"""
+    page = await db.run_sync(
+        analytics_service.get_price_history,
+        current_user.id,
+        product_id=product_id,
+        product=product,
+        store=store,
+        start=start,
+        end=end,
+        jump_threshold=jump_threshold,
+        limit=limit,
+        offset=offset
+    )
+    return PriceHistoryPage(**page)
 
 
 @router.get("/budgets", response_model=List[dict])
 async def get_budgets(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)  # 👈 added
 ):
     """Get all budgets for logged-in user"""
-    return analytics_service.get_budget_status(db, current_user.id)  # 👈 pass user_id
+    return await db.run_sync(analytics_service.get_budget_status, current_user.id)
 
 
 @router.post("/budgets", response_model=BudgetResponse)
 async def create_budget(
     budget_data: BudgetCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)  # 👈 added
 ):
     """Create or update a budget for logged-in user"""
-    existing = db.query(Budget).filter(
+    result = await db.execute(select(Budget).where(
         Budget.category == budget_data.category,
         Budget.user_id == current_user.id  # 👈 filter by user
-    ).first()
+    ))
+    existing = result.scalars().first()
 
     if existing:
+        previous_limit = existing.monthly_limit
         existing.monthly_limit = budget_data.monthly_limit
-        db.commit()
-        db.refresh(existing)
         budget = existing
     else:
+        previous_limit = None
         budget = Budget(
             user_id=current_user.id,  # 👈 added
             category=budget_data.category,
             monthly_limit=budget_data.monthly_limit
         )
         db.add(budget)
-        db.commit()
-        db.refresh(budget)
+    await db.flush()
+    # Spend this month comes from the counters, so a new budget starts in step
+    alert = await apply_budget_limit(db, budget, previous_limit)
+    await db.commit()
+    await invalidate_user(current_user.id)
+    await db.refresh(budget)
+
+    event = {"budget_id": budget.id, "category": budget.category}
+    if alert is not None:
+        event["budget_alerts"] = [alert_payload(alert)]
+    background_tasks.add_task(publish_update, current_user.id, "budget_changed", event, budgets=True)
 
     percentage_used = (budget.current_spent / budget.monthly_limit * 100) if budget.monthly_limit > 0 else 0
 
@@ -76,21 +167,38 @@ async def create_budget(
     )
 
 
+@router.get("/budgets/alerts", response_model=List[dict])
+async def get_budget_alerts(
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Most recent budget threshold crossings (warning at 80%, over at 100%), newest first"""
+    return await db.run_sync(recent_alerts, current_user.id, limit)
+
+
 @router.delete("/budgets/{budget_id}")
 async def delete_budget(
     budget_id: int,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)  # 👈 added
 ):
     """Delete a budget — only if it belongs to logged-in user"""
-    budget = db.query(Budget).filter(
+    result = await db.execute(select(Budget).where(
         Budget.id == budget_id,
         Budget.user_id == current_user.id  # 👈 security check
-    ).first()
+    ))
+    budget = result.scalars().first()
 
     if not budget:
         raise HTTPException(status_code=404, detail="Budget not found")
 
-    db.delete(budget)
-    db.commit()
+    await db.delete(budget)
+    await db.commit()
+    await invalidate_user(current_user.id)
+    background_tasks.add_task(
+        publish_update, current_user.id, "budget_changed",
+        {"budget_id": budget_id, "category": budget.category, "deleted": True}, budgets=True
+    )
     return {"message": "Budget deleted successfully"}
\ No newline at end of file
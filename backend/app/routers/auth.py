@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
-from app.database import get_db
+from app.database import get_async_db
 from app.services.auth_service import (
     authenticate_user, create_user, create_access_token,
-    get_user_by_email, get_user_by_username
+    get_user_by_email, get_user_by_username, PasswordHasherBusy
 )
 from app.dependencies import get_current_user
 from app.models.database import User
@@ -33,20 +34,37 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 
+def _too_many_requests(e: PasswordHasherBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many authentication requests, please retry shortly",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
 # --- Endpoints ---
 @router.post("/register", response_model=UserResponse)
-def register(data: RegisterRequest, db: Session = Depends(get_db)):
-    if get_user_by_email(db, data.email):
+async def register(data: RegisterRequest, db: AsyncSession = Depends(get_async_db)):
+    if await get_user_by_email(db, data.email):
         raise HTTPException(status_code=400, detail="Email already registered")
-    if get_user_by_username(db, data.username):
+    if await get_user_by_username(db, data.username):
         raise HTTPException(status_code=400, detail="Username already taken")
-    user = create_user(db, data.email, data.username, data.password)
+    try:
+        user = await create_user(db, data.email, data.username, data.password)
+    except PasswordHasherBusy as e:
+        raise _too_many_requests(e)
+    except IntegrityError:
+        # A concurrent registration took the email or username after the checks above
+        raise HTTPException(status_code=400, detail="Email or username already registered")
     return user
 
 
 @router.post("/login")
-def login(data: LoginRequest, db: Session = Depends(get_db)):
-    user = authenticate_user(db, data.email, data.password)
+async def login(data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    try:
+        user = await authenticate_user(db, data.email, data.password)
+    except PasswordHasherBusy as e:
+        raise _too_many_requests(e)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,38 @@
+import os
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from app.dependencies import get_current_user
+from app.models.database import User
+from app.responses import sse_event
+from app.services.event_service import event_broker
+
+# A comment frame this often keeps proxies and load balancers from closing idle streams
+EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))
+
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+
+@router.get("")
+async def stream_events(current_user: User = Depends(get_current_user)):
+    """
+    Server-Sent Events for the logged-in user's dashboards: receipt_added,
+    receipt_deleted, budget_changed and insights_ready, each carrying the
+    aggregates that changed so the page can update without re-fetching.
+    """
+    user_id = current_user.id
+
+    async def events():
+        async with event_broker.subscribe(user_id) as subscription:
+            yield sse_event("ready", {"user_id": user_id})
+            while True:
+                message = await subscription.next(timeout=EVENT_KEEPALIVE_SECONDS)
+                if message is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield sse_event(message["event"], message["data"])
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -10,6 +10,10 @@ import os
 
 router = APIRouter(prefix="/api/exports", tags=["exports"])
 
+# Generated reports live apart from receipt uploads
+EXPORT_DIR = os.path.join(os.getenv("UPLOAD_DIR", "uploads"), "exports")
+os.makedirs(EXPORT_DIR, exist_ok=True)
+
 @router.get("/monthly-report-pdf")
 async def export_monthly_report_pdf(db: Session = Depends(get_db)):
     """Generate and download monthly spending report as PDF"""
@@ -38,7 +42,7 @@ async def export_monthly_report_pdf(db: Session = Depends(get_db)):
         # Generate PDF
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"ShopSense_Report_{timestamp}.pdf"
-        output_path = os.path.join("uploads", filename)
+        output_path = os.path.join(EXPORT_DIR, filename)
         
         pdf_service.generate_monthly_report(
             analytics=analytics.__dict__,
@@ -95,7 +99,7 @@ async def export_receipts_csv(db: Session = Depends(get_db)):
         # Save to file
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"ShopSense_Receipts_{timestamp}.csv"
-        filepath = os.path.join("uploads", filename)
+        filepath = os.path.join(EXPORT_DIR, filename)
         
         with open(filepath, 'w', newline='') as f:
             f.write(output.getvalue())
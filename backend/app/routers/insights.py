@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.database import get_async_db, get_async_read_db
 from app.models.database import Receipt, SpendingInsight, User
-from app.models.schemas import InsightResponse, RecommendationResponse
+from app.models.schemas import InsightPage, RecommendationResponse
 from app.services.ai_service import ai_service
+from app.services.anomaly_service import detect_anomalies
+from app.services.event_service import publish_update
+from app.services.insight_service import upsert_insight
 from app.dependencies import get_current_user
-from typing import List
+from app.tracing import span
+from app.services.pagination import encode_cursor, keyset_before
+from typing import List, Optional
 from datetime import datetime
 
 router = APIRouter(prefix="/api/insights", tags=["insights"])
@@ -13,15 +20,21 @@ router = APIRouter(prefix="/api/insights", tags=["insights"])
 
 @router.post("/generate")
 async def generate_insights(
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)  # 👈 added
 ):
     """Generate AI-powered spending insights for logged-in user"""
 
     # Get only this user's receipts
-    receipts = db.query(Receipt).filter(
-        Receipt.user_id == current_user.id             # 👈 filter by user
-    ).order_by(Receipt.upload_date.desc()).limit(50).all()
+    result = await db.execute(
+        select(Receipt)
+        .options(selectinload(Receipt.items))
+        .where(Receipt.user_id == current_user.id)     # 👈 filter by user
+        .order_by(Receipt.upload_date.desc())
+        .limit(50)
+    )
+    receipts = result.scalars().all()
 
     if not receipts:
         raise HTTPException(status_code=400, detail="No receipts found. Upload some receipts first.")
@@ -44,78 +57,100 @@ async def generate_insights(
         }
         receipts_data.append(receipt_dict)
 
-    analysis = await ai_service.analyze_spending_behavior(receipts_data)
+    analysis = await ai_service.analyze_spending_behavior(receipts_data, user_id=current_user.id)
 
+    # Impulse buys, unusual stores and spikes come from the user's whole recent
+    # history with scored baselines, not the model's read of the last 50 receipts
+    with span("anomaly_detect"):
+        anomalies = await db.run_sync(detect_anomalies, current_user.id)
+    analysis["impulse_buys"] = [
+        {"item": a.subject, "reason": a.explanation, "amount": a.amount, "score": a.score}
+        for a in anomalies["purchases"]
+    ]
+
+    # Re-generating refreshes this month's insight about the same item, category
+    # or pattern instead of appending another copy
     insights_created = []
 
-    for impulse in analysis.get("impulse_buys", []):
-        insight = SpendingInsight(
-            user_id=current_user.id,                   # 👈 added
-            insight_type="impulse",
-            title=f"Impulse Purchase: {impulse.get('item', 'Unknown')}",
-            description=impulse.get("reason", "Detected impulse buying pattern"),
-            amount=impulse.get("amount", 0.0)
-        )
-        db.add(insight)
-        insights_created.append(insight)
+    def keep(insight):
+        if insight not in insights_created:
+            insights_created.append(insight)
+
+    for found in anomalies.values():
+        for anomaly in found:
+            keep(await upsert_insight(db, current_user.id, **anomaly.insight()))
 
     for trend in analysis.get("spending_trends", []):
-        insight = SpendingInsight(
-            user_id=current_user.id,                   # 👈 added
-            insight_type="trend",
+        keep(await upsert_insight(
+            db,
+            current_user.id,
+            "trend",
             title=f"{trend.get('category', 'General')} Spending Trend",
             description=f"{trend.get('trend', 'stable').capitalize()}: {trend.get('insight', 'No specific insight')}",
             category=trend.get("category")
-        )
-        db.add(insight)
-        insights_created.append(insight)
+        ))
 
     if analysis.get("peak_spending"):
         peak = analysis["peak_spending"]
-        insight = SpendingInsight(
-            user_id=current_user.id,                   # 👈 added
-            insight_type="pattern",
+        keep(await upsert_insight(
+            db,
+            current_user.id,
+            "pattern",
             title="Peak Spending Time",
             description=f"You spend most on {peak.get('day', 'weekdays')} {peak.get('time', 'evenings')}. {peak.get('reason', '')}"
-        )
-        db.add(insight)
-        insights_created.append(insight)
+        ))
+
+    await db.commit()
 
-    db.commit()
+    background_tasks.add_task(
+        publish_update, current_user.id, "insights_ready",
+        {"insights_count": len(insights_created), "insight_ids": [i.id for i in insights_created]}
+    )
 
     return {
         "message": "Insights generated successfully",
         "insights_count": len(insights_created),
-        "analysis": analysis
+        "analysis": analysis,
+        "anomalies": {kind: [a.to_dict() for a in found] for kind, found in anomalies.items()}
     }
 
 
-@router.get("/", response_model=List[InsightResponse])
+@router.get("/", response_model=InsightPage)
 async def get_insights(
-    skip: int = 0,
-    limit: int = 20,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)  # 👈 added
 ):
-    """Get insights for logged-in user"""
-    insights = db.query(SpendingInsight).filter(
-        SpendingInsight.user_id == current_user.id     # 👈 filter by user
-    ).order_by(
-        SpendingInsight.insight_date.desc()
-    ).offset(skip).limit(limit).all()
-    return insights
+    """Get insights for logged-in user, newest first, one keyset page at a time"""
+    try:
+        after_cursor = keyset_before(SpendingInsight.insight_date, SpendingInsight.id, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    stmt = select(SpendingInsight).where(SpendingInsight.user_id == current_user.id)     # 👈 filter by user
+    if after_cursor is not None:
+        stmt = stmt.where(after_cursor)
+    stmt = stmt.order_by(SpendingInsight.insight_date.desc(), SpendingInsight.id.desc()).limit(limit + 1)
+
+    insights = (await db.execute(stmt)).scalars().all()
+    next_cursor = None
+    if len(insights) > limit:
+        insights = insights[:limit]
+        next_cursor = encode_cursor(insights[-1].insight_date, insights[-1].id)
+    return InsightPage(insights=insights, next_cursor=next_cursor)
 
 
 @router.get("/recommendations", response_model=List[RecommendationResponse])
 async def get_recommendations(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)  # 👈 added
 ):
     """Get personalized recommendations for logged-in user"""
     from app.services.analytics_service import analytics_service
 
-    analytics = analytics_service.calculate_spending_analytics(db, current_user.id)  # 👈 pass user_id
-    categories = analytics_service.get_category_breakdown(db, current_user.id)       # 👈 pass user_id
+    dashboard = await db.run_sync(analytics_service.get_dashboard, current_user.id, ("spending", "categories"))
+    analytics, categories = dashboard["spending"], dashboard["categories"]
 
     spending_data = {
         "total_spent": analytics.total_spent,
@@ -124,25 +159,38 @@ async def get_recommendations(
         "average_transaction": analytics.average_transaction
     }
 
-    recommendations = await ai_service.generate_recommendations(spending_data)
+    recommendations = await ai_service.generate_recommendations(spending_data, user_id=current_user.id)
     return recommendations
 
 
+@router.get("/usage")
+async def get_ai_usage(
+    days: int = Query(30, ge=1, le=365),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """AI provider calls, tokens and estimated cost per feature for logged-in user"""
+    from app.services.usage_service import get_usage_summary
+
+    return await db.run_sync(get_usage_summary, current_user.id, days)
+
+
 @router.delete("/{insight_id}")
 async def delete_insight(
     insight_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)  # 👈 added
 ):
     """Delete an insight — only if it belongs to logged-in user"""
-    insight = db.query(SpendingInsight).filter(
+    result = await db.execute(select(SpendingInsight).where(
         SpendingInsight.id == insight_id,
         SpendingInsight.user_id == current_user.id     # 👈 security check
-    ).first()
+    ))
+    insight = result.scalars().first()
 
     if not insight:
         raise HTTPException(status_code=404, detail="Insight not found")
 
-    db.delete(insight)
-    db.commit()
+    await db.delete(insight)
+    await db.commit()
     return {"message": "Insight deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from app.services.image_service import IMAGE_VARIANTS, MEDIA_URL_PREFIX, derivative_key, ensure_derivative, has_derivatives
+from app.services.storage_service import is_private_upload, receipt_storage
+import os
+import posixpath
+
+router = APIRouter(prefix=MEDIA_URL_PREFIX, tags=["media"])
+
+# Keys are content hashes (or timestamped legacy names), so the bytes behind a URL never change
+IMMUTABLE_CACHE = {"Cache-Control": "public, max-age=31536000, immutable"}
+
+
+@router.get("/{variant}/{key:path}")
+async def get_media(variant: str, key: str):
+    """Serve an uploaded receipt image or one of its downscaled WebP derivatives"""
+    if variant != "original" and variant not in IMAGE_VARIANTS:
+        raise HTTPException(status_code=404, detail="Unknown image variant")
+
+    normalized = posixpath.normpath(key)
+    if normalized.startswith(("..", "/")) or normalized != key or is_private_upload(key):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    source_path = receipt_storage.local_path(key)
+    if not os.path.isfile(source_path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if variant == "original":
+        return FileResponse(source_path, headers=IMMUTABLE_CACHE)
+    if not has_derivatives(key):
+        raise HTTPException(status_code=404, detail="No image variants for this file")
+
+    # Rendered at ingest; anything older is rendered on first request
+    target_path = receipt_storage.local_path(derivative_key(key, variant))
+    try:
+        await ensure_derivative(source_path, target_path, variant)
+    except Exception:
+        raise HTTPException(status_code=415, detail="File is not a renderable image")
+
+    return FileResponse(target_path, media_type="image/webp", headers=IMMUTABLE_CACHE)
@@ -1,94 +1,373 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models.database import Receipt, Item
-from app.models.schemas import ReceiptResponse
+import asyncio
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.database import get_async_db, AsyncSessionLocal
+from app.models.database import Receipt, Item, BudgetAlert, Product
+from app.models.schemas import ReceiptResponse, ReceiptSummary, ReceiptPage, ReceiptSearchPage
 from app.dependencies import get_current_user
 from app.models.database import User
 from app.services.ai_service import ai_service
-from typing import List
-import os
-import shutil
+from app.services.pagination import encode_cursor, keyset_before
+from app.services.search_service import refresh_search_document, search_receipts
+from app.services.product_service import product_catalog
+from app.services.storage_service import receipt_storage, UploadTooLarge
+from app.services.image_service import generate_derivatives, probe_image
+from app.services.event_service import publish_update
+from app.services.budget_service import alert_payload, apply_receipt
+from app.services.cache_service import invalidate_user
+from app.services.document_service import DocumentError, extract_pdf_receipts
+from app.responses import sse_event
+from app.tracing import span
+from typing import List, Optional, Tuple
 from datetime import datetime
 
 router = APIRouter(prefix="/api/receipts", tags=["receipts"])
 
-UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+async def _persist_receipt(db: AsyncSession, stored, original_filename: Optional[str],
+                           extracted_data: dict, user_id: int) -> Tuple[Receipt, List[BudgetAlert]]:
+    """
+    Insert a receipt and its items from extracted data, linking each item to its
+    canonical product, and fold it into the budget counters (caller commits).
+    Returns the receipt and any budget alerts it raised.
+    """
+    receipt = Receipt(
+        filename=stored.key,
+        original_filename=original_filename,
+        store_name=extracted_data.get("store_name"),
+        purchase_date=datetime.fromisoformat(extracted_data["purchase_date"]) if extracted_data.get("purchase_date") else None,
+        total_amount=extracted_data.get("total_amount", 0.0),
+        extracted_text=extracted_data.get("raw_text"),
+        user_id=user_id
+    )
+    
+    with span("db_insert"):
+        db.add(receipt)
+        await receipt_storage.retain(db, stored)
+        await db.flush()
+    
+    items_data = extracted_data.get("items", [])
+    with span("product_resolve"):
+        product_ids = await db.run_sync(product_catalog.resolve_many, items_data)
+        # Text-parsed PDF items carry no category; use their product's, so they count towards budgets
+        uncategorized = {pid for item_data, pid in zip(items_data, product_ids) if pid and not item_data.get("category")}
+        known = {}
+        if uncategorized:
+            known = dict((await db.execute(
+                select(Product.id, Product.category).where(Product.id.in_(uncategorized), Product.category.isnot(None))
+            )).all())
+    with span("db_insert"):
+        items = [
+            Item(
+                receipt_id=receipt.id,
+                name=item_data["name"],
+                price=item_data["price"],
+                quantity=item_data.get("quantity", 1),
+                category=item_data.get("category") or known.get(product_id) or "other",
+                product_id=product_id
+            )
+            for item_data, product_id in zip(items_data, product_ids)
+        ]
+        db.add_all(items)
+        await db.flush()
+        await refresh_search_document(db, receipt.id)
+    with span("budget_update"):
+        alerts = await apply_receipt(db, receipt, items)
+        await db.flush()
+    return receipt, alerts
+
+
+def _receipt_event(receipt: Receipt, alerts: List[BudgetAlert]) -> dict:
+    return {
+        "receipt_id": receipt.id,
+        "store_name": receipt.store_name,
+        "total_amount": receipt.total_amount,
+        "budget_alerts": [alert_payload(alert) for alert in alerts],
+    }
+
+
+async def _load_receipt(db: AsyncSession, receipt_id: int, user_id: Optional[int] = None):
+    """Fetch a receipt with its items eagerly loaded (async sessions can't lazy-load), optionally only the user's"""
+    query = select(Receipt).options(selectinload(Receipt.items)).where(Receipt.id == receipt_id)
+    if user_id is not None:
+        query = query.where(Receipt.user_id == user_id)
+    result = await db.execute(query)
+    return result.scalar_one_or_none()
+
 
 @router.post("/upload", response_model=ReceiptResponse)
 async def upload_receipt(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Upload and process a receipt image"""
     
     # Validate file type
     if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Only image files are allowed")
-    
-    # Save file
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_{file.filename}"
-    filepath = os.path.join(UPLOAD_DIR, filename)
+        detail = "Upload PDFs to /api/receipts/upload/pdf" if file.content_type == "application/pdf" else "Only image files are allowed"
+        raise HTTPException(status_code=400, detail=detail)
     
-    with open(filepath, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Stream to content-addressed storage (identical files are stored once)
+    try:
+        with span("storage_write"):
+            stored = await receipt_storage.save_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
     try:
         # Extract data using AI
-        extracted_data = await ai_service.extract_receipt_data(filepath)
+        with span("extract"):
+            extracted_data = await ai_service.extract_receipt_data(
+                receipt_storage.local_path(stored.key), user_id=current_user.id
+            )
         
-        # Create receipt record
-        receipt = Receipt(
-            filename=filename,
-            store_name=extracted_data.get("store_name"),
-            purchase_date=datetime.fromisoformat(extracted_data["purchase_date"]) if extracted_data.get("purchase_date") else None,
-            total_amount=extracted_data.get("total_amount", 0.0),
-            user_id=current_user.id
-        )
+        receipt, alerts = await _persist_receipt(db, stored, file.filename, extracted_data, current_user.id)
+        await db.commit()
+        await invalidate_user(current_user.id)
         
-        db.add(receipt)
-        db.flush()
+        # Thumbnails are rendered after the response; the media route covers any gap
+        if stored.created:
+            background_tasks.add_task(generate_derivatives, receipt_storage, stored.key)
+        background_tasks.add_task(
+            publish_update, current_user.id, "receipt_added", _receipt_event(receipt, alerts), spending=True, budgets=True
+        )
         
-        # Create item records
-        for item_data in extracted_data.get("items", []):
-            item = Item(
-                receipt_id=receipt.id,
-                name=item_data["name"],
-                price=item_data["price"],
-                quantity=item_data.get("quantity", 1),
-                category=item_data.get("category", "Other")
+        with span("db_reload"):
+            return await _load_receipt(db, receipt.id)
+    
+    except Exception as e:
+        await db.rollback()
+        await receipt_storage.discard(stored)
+        raise HTTPException(status_code=500, detail=f"Error processing receipt: {str(e)}")
+
+@router.post("/upload/stream")
+async def upload_receipt_stream(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Upload a receipt and follow its processing as Server-Sent Events:
+    stored, preprocessed, extraction_started, item (one per line item, as the
+    model produces it), extracted, then persisted with the saved receipt - or error.
+    """
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Only image files are allowed")
+    
+    # The upload body must be consumed before the response starts streaming
+    try:
+        with span("storage_write"):
+            stored = await receipt_storage.save_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    user_id = current_user.id
+    original_filename = file.filename
+    outcome = {"persisted": False}
+    
+    async def events():
+        try:
+            yield sse_event("stored", {"key": stored.key, "size": stored.size, "duplicate": not stored.created})
+            
+            image_path = receipt_storage.local_path(stored.key)
+            probe = await asyncio.to_thread(probe_image, image_path)
+            yield sse_event("preprocessed", probe)
+            if not probe["decodable"]:
+                yield sse_event("error", {"stage": "preprocessed", "detail": "File is not a readable image"})
+                return
+            
+            yield sse_event("extraction_started", {"provider": ai_service.provider, "model": ai_service.model_name})
+            extracted_data = None
+            with span("extract"):
+                async for kind, payload in ai_service.stream_receipt_extraction(image_path, user_id=user_id):
+                    if kind == "item":
+                        yield sse_event("item", payload)
+                    elif kind == "error":
+                        # Items already sent belong to no receipt; nothing is saved
+                        yield sse_event("error", {"stage": "extracted", **payload})
+                        return
+                    else:
+                        extracted_data = payload
+            yield sse_event("extracted", {
+                "store_name": extracted_data.get("store_name"),
+                "purchase_date": extracted_data.get("purchase_date"),
+                "total_amount": extracted_data.get("total_amount", 0.0),
+                "item_count": len(extracted_data.get("items", [])),
+            })
+            
+            # The request's dependency session is closed once streaming starts; use our own
+            async with AsyncSessionLocal() as db:
+                try:
+                    receipt, alerts = await _persist_receipt(db, stored, original_filename, extracted_data, user_id)
+                    await db.commit()
+                    outcome["persisted"] = True
+                    await invalidate_user(user_id)
+                    with span("db_reload"):
+                        receipt = await _load_receipt(db, receipt.id)
+                    outcome["event"] = _receipt_event(receipt, alerts)
+                    yield sse_event("persisted", ReceiptResponse.model_validate(receipt).model_dump(mode="json"))
+                except Exception as e:
+                    await db.rollback()
+                    yield sse_event("error", {"stage": "persisted", "detail": f"Error processing receipt: {str(e)}"})
+        finally:
+            # Also runs when the client disconnects mid-stream, where after_stream never does
+            if not outcome["persisted"]:
+                await asyncio.shield(receipt_storage.discard(stored))
+    
+    async def after_stream():
+        if "event" not in outcome:
+            return
+        if stored.created:
+            await generate_derivatives(receipt_storage, stored.key)
+        await publish_update(user_id, "receipt_added", outcome["event"], spending=True, budgets=True)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Proxies (nginx) must pass events through as they are written
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(after_stream),
+    )
+
+@router.post("/upload/pdf", response_model=List[ReceiptResponse])
+async def upload_receipt_pdf(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Upload a PDF e-receipt or invoice. Pages with embedded text are parsed
+    directly; scanned pages go to the AI provider in parallel. Each receipt
+    found in the document becomes its own row, all sharing the stored PDF.
+    """
+    if file.content_type != "application/pdf":
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    
+    try:
+        with span("storage_write"):
+            stored = await receipt_storage.save_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    try:
+        with span("extract"):
+            receipts_data = await extract_pdf_receipts(
+                receipt_storage.local_path(stored.key), receipt_storage.tmp_dir, user_id=current_user.id
             )
-            db.add(item)
-        
-        db.commit()
-        db.refresh(receipt)
-        
-        return receipt
+    except DocumentError as e:
+        await receipt_storage.discard(stored)
+        raise HTTPException(status_code=400, detail=str(e))
     
+    if not receipts_data:
+        await receipt_storage.discard(stored)
+        raise HTTPException(status_code=422, detail="No receipts found in the PDF")
+    
+    try:
+        persisted = []
+        for extracted_data in receipts_data:
+            persisted.append(await _persist_receipt(db, stored, file.filename, extracted_data, current_user.id))
+        await db.commit()
+        await invalidate_user(current_user.id)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        await receipt_storage.discard(stored)
         raise HTTPException(status_code=500, detail=f"Error processing receipt: {str(e)}")
+    
+    for receipt, alerts in persisted:
+        background_tasks.add_task(
+            publish_update, current_user.id, "receipt_added", _receipt_event(receipt, alerts), spending=True, budgets=True
+        )
+    
+    with span("db_reload"):
+        result = await db.execute(
+            select(Receipt)
+            .options(selectinload(Receipt.items))
+            .where(Receipt.id.in_([receipt.id for receipt, _ in persisted]))
+            .order_by(Receipt.id)
+        )
+        return result.scalars().all()
 
-@router.get("/", response_model=List[ReceiptResponse])
+@router.get("/", response_model=ReceiptPage)
 async def get_receipts(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    summary: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
 ):
-    """Get all receipts"""
-    receipts = db.query(Receipt).order_by(Receipt.upload_date.desc()).offset(skip).limit(limit).all()
-    return receipts
+    """Get the logged-in user's receipts, newest first, one keyset page at a time"""
+    try:
+        after_cursor = keyset_before(Receipt.upload_date, Receipt.id, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    stmt = select(Receipt).where(Receipt.user_id == current_user.id)
+    if after_cursor is not None:
+        stmt = stmt.where(after_cursor)
+    if not summary:
+        stmt = stmt.options(selectinload(Receipt.items))
+    # Fetch one extra row to know whether another page exists
+    stmt = stmt.order_by(Receipt.upload_date.desc(), Receipt.id.desc()).limit(limit + 1)
+
+    receipts = (await db.execute(stmt)).scalars().all()
+    has_more = len(receipts) > limit
+    receipts = receipts[:limit]
+
+    if summary:
+        counts = {}
+        if receipts:
+            count_rows = await db.execute(
+                select(Item.receipt_id, func.count(Item.id))
+                .where(Item.receipt_id.in_([r.id for r in receipts]))
+                .group_by(Item.receipt_id)
+            )
+            counts = dict(count_rows.all())
+        page = [
+            ReceiptSummary(
+                id=r.id,
+                filename=r.filename,
+                original_filename=r.original_filename,
+                upload_date=r.upload_date,
+                store_name=r.store_name,
+                purchase_date=r.purchase_date,
+                total_amount=r.total_amount,
+                item_count=counts.get(r.id, 0)
+            )
+            for r in receipts
+        ]
+    else:
+        page = [ReceiptResponse.model_validate(r) for r in receipts]
+
+    next_cursor = encode_cursor(receipts[-1].upload_date, receipts[-1].id) if has_more else None
+    return ReceiptPage(receipts=page, next_cursor=next_cursor)
+
+@router.get("/search", response_model=ReceiptSearchPage)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Full-text search over store names, item names and extracted receipt text"""
+    hits = await search_receipts(db, current_user.id, q, limit=limit + 1, offset=offset)
+    next_offset = offset + limit if len(hits) > limit else None
+    return ReceiptSearchPage(results=hits[:limit], next_offset=next_offset)
 
 @router.get("/{receipt_id}", response_model=ReceiptResponse)
 async def get_receipt(
     receipt_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
 ):
-    """Get specific receipt by ID"""
-    receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
+    """Get specific receipt by ID — only if it belongs to logged-in user"""
+    receipt = await _load_receipt(db, receipt_id, current_user.id)
     if not receipt:
         raise HTTPException(status_code=404, detail="Receipt not found")
     return receipt
@@ -96,19 +375,27 @@ async def get_receipt(
 @router.delete("/{receipt_id}")
 async def delete_receipt(
     receipt_id: int,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
 ):
-    """Delete a receipt"""
-    receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
+    """Delete a receipt — only if it belongs to logged-in user"""
+    # Items must be loaded so the delete-orphan cascade runs without lazy I/O
+    receipt = await _load_receipt(db, receipt_id, current_user.id)
     if not receipt:
         raise HTTPException(status_code=404, detail="Receipt not found")
     
-    # Delete file
-    filepath = os.path.join(UPLOAD_DIR, receipt.filename)
-    if os.path.exists(filepath):
-        os.remove(filepath)
+    await apply_receipt(db, receipt, receipt.items, sign=-1)
+    await db.delete(receipt)
+    remaining = await receipt_storage.release(db, receipt.filename)
+    await db.commit()
+    await invalidate_user(receipt.user_id)
     
-    db.delete(receipt)
-    db.commit()
+    # The file goes once no other receipt shares its content, after the response is sent
+    if remaining == 0:
+        background_tasks.add_task(receipt_storage.remove, receipt.filename)
+    background_tasks.add_task(
+        publish_update, receipt.user_id, "receipt_deleted", {"receipt_id": receipt_id}, spending=True, budgets=True
+    )
     
     return {"message": "Receipt deleted successfully"}
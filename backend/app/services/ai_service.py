@@ -1,24 +1,130 @@
 import os
+import re
 import json
-from typing import Dict, List, Optional
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 import google.generativeai as genai
 from openai import OpenAI
 from PIL import Image
 import io
+from app.database import AsyncSessionLocal
+from app.metrics import AI_RETRIES, track_ai_call
+from app.services.local_ai_provider import LocalAIProvider, receipt_text
+from app.services.prompt_cache import prompt_cache
+from app.services.usage_service import record_usage
+from app.tracing import span
 
 load_dotenv()
 
+OPENAI_MODEL = "gpt-4o"
+LOCAL_MODEL = "local"
+
+EXTRACTION_PROMPT = """
+        Analyze this receipt image and extract the following information in JSON format:
+        {
+            "store_name": "store name",
+            "purchase_date": "YYYY-MM-DD",
+            "items": [
+                {"name": "item name", "price": 0.00, "quantity": 1, "category": "category"}
+            ],
+            "total_amount": 0.00
+        }
+        
+        For categories, use: groceries, electronics, clothing, dining, health, entertainment, home, transportation, other
+        Be accurate with prices and item names. If unclear, make best estimate.
+        """
+
+
+def record_gemini_usage(response, call):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        call.prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        call.completion_tokens = getattr(usage, "candidates_token_count", 0) or 0
+
+
+def record_openai_usage(response, call):
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        call.prompt_tokens = usage.prompt_tokens or 0
+        call.completion_tokens = usage.completion_tokens or 0
+
+
+def estimate_tokens(payload) -> int:
+    # ~4 characters per token, close enough for dashboards fed by the local provider
+    return len(payload if isinstance(payload, str) else json.dumps(payload, default=str)) // 4
+
+
+def strip_code_fence(text: str) -> str:
+    """The JSON inside a model reply, with any ```json / ``` markdown fence removed"""
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text.split("```json")[1].split("```")[0]
+    elif text.startswith("```"):
+        text = text.split("```")[1].split("```")[0]
+    return text.strip()
+
+
+class ItemStreamParser:
+    """
+    Pulls complete objects out of the "items" array of a receipt JSON document
+    while it is still streaming, so each line item can be shown as soon as the
+    model has finished writing it.
+    """
+
+    ITEMS_START = re.compile(r'"items"\s*:\s*\[')
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None
+        self.done = False
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, chunk: str) -> List[Dict]:
+        self.buffer += chunk
+        if self.pos is None:
+            match = self.ITEMS_START.search(self.buffer)
+            if not match:
+                return []
+            self.pos = match.end()
+
+        items = []
+        while not self.done:
+            i = self.pos
+            while i < len(self.buffer) and self.buffer[i] in " \t\r\n,":
+                i += 1
+            if i >= len(self.buffer):
+                break
+            if self.buffer[i] == "]":
+                self.done = True
+                break
+            try:
+                obj, end = self._decoder.raw_decode(self.buffer, i)
+            except json.JSONDecodeError:
+                break  # object not finished yet
+            self.pos = end
+            if isinstance(obj, dict):
+                items.append(obj)
+        return items
+
+
 class AIService:
     def __init__(self):
         self.provider = os.getenv("AI_PROVIDER", "gemini").lower()
         self.gemini_model = None
         self.gemini_vision_model = None
+        self.gemini_model_name = None
         self.openai_client = None
+        self.local_provider = None
         
         # Initialize Gemini with multiple fallback attempts
         gemini_key = os.getenv("GEMINI_API_KEY")
-        if gemini_key:
+        if self.provider == "local":
+            # Offline, deterministic provider for load tests; never touches the network
+            self.local_provider = LocalAIProvider.from_env()
+            print("✅ Local AI provider initialized (offline)")
+        elif gemini_key:
             genai.configure(api_key=gemini_key)
             
             # Try different model names in order of preference
@@ -38,10 +144,12 @@ class AIService:
                     # If we get here, the model works!
                     self.gemini_model = genai.GenerativeModel(model_name)
                     self.gemini_vision_model = genai.GenerativeModel(model_name)
+                    self.gemini_model_name = model_name
                     print(f"✅ Gemini AI initialized successfully (using {model_name})")
                     break
                 except Exception as e:
                     print(f"⚠️ Model {model_name} failed: {str(e)[:50]}...")
+                    AI_RETRIES.labels("gemini", model_name, "init").inc()
                     continue
             
             if not self.gemini_model:
@@ -56,88 +164,198 @@ class AIService:
                     except Exception as e:
                         print(f"❌ Failed to initialize OpenAI: {e}")
     
-    async def extract_receipt_data(self, image_path: str) -> Dict:
+    async def extract_receipt_data(self, image_path: str, user_id: Optional[int] = None) -> Dict:
         """Extract structured data from receipt image"""
-        prompt = """
-        Analyze this receipt image and extract the following information in JSON format:
-        {
-            "store_name": "store name",
-            "purchase_date": "YYYY-MM-DD",
-            "items": [
-                {"name": "item name", "price": 0.00, "quantity": 1, "category": "category"}
-            ],
-            "total_amount": 0.00
-        }
-        
-        For categories, use: groceries, electronics, clothing, dining, health, entertainment, home, transportation, other
-        Be accurate with prices and item names. If unclear, make best estimate.
-        """
+        prompt = EXTRACTION_PROMPT
         
         if self.provider == "gemini" and self.gemini_vision_model:
-            return await self._extract_with_gemini(image_path, prompt)
+            return await self._extract_with_gemini(image_path, prompt, user_id)
         elif self.provider == "openai" and self.openai_client:
-            return await self._extract_with_openai(image_path, prompt)
+            return await self._extract_with_openai(image_path, prompt, user_id)
+        elif self.provider == "local" and self.local_provider:
+            return await self._extract_with_local(image_path, user_id)
         else:
             print(f"❌ No AI provider available. Provider: {self.provider}")
             return self._get_fallback_data()
     
-    async def _extract_with_gemini(self, image_path: str, prompt: str) -> Dict:
+    async def _extract_with_gemini(self, image_path: str, prompt: str, user_id: Optional[int]) -> Dict:
         """Extract using Gemini Vision API"""
         try:
-            image = Image.open(image_path)
-            response = self.gemini_vision_model.generate_content([prompt, image])
-            
-            # Parse JSON from response
-            text = response.text.strip()
-            # Remove markdown code blocks if present
-            if text.startswith("```json"):
-                text = text.split("```json")[1].split("```")[0]
-            elif text.startswith("```"):
-                text = text.split("```")[1].split("```")[0]
-            
-            return json.loads(text.strip())
+            async with self._provider_call("gemini", self.gemini_model_name, "extract", user_id) as call:
+                def open_image():
+                    image = Image.open(image_path)
+                    # Decode now so the cost isn't hidden inside the provider call
+                    image.load()
+                    return image
+
+                with span("image_decode"):
+                    image = await asyncio.to_thread(open_image)
+                # The SDK call blocks; run it off the event loop so concurrent pages overlap
+                with span("provider_call"):
+                    response = await asyncio.to_thread(self.gemini_vision_model.generate_content, [prompt, image])
+                    record_gemini_usage(response, call)
+                
+                with span("json_parse"):
+                    result = json.loads(strip_code_fence(response.text))
+            result["raw_text"] = receipt_text(result)
+            return result
         except Exception as e:
             print(f"Gemini extraction error: {e}")
             return self._get_fallback_data()
     
-    async def _extract_with_openai(self, image_path: str, prompt: str) -> Dict:
+    async def _extract_with_openai(self, image_path: str, prompt: str, user_id: Optional[int]) -> Dict:
         """Extract using OpenAI GPT-4 Vision API"""
         try:
+            def encode_image():
+                with open(image_path, "rb") as image_file:
+                    import base64
+                    return base64.b64encode(image_file.read()).decode('utf-8')
+
+            with span("image_encode"):
+                image_data = await asyncio.to_thread(encode_image)
+            
+            async with self._provider_call("openai", OPENAI_MODEL, "extract", user_id) as call:
+                with span("provider_call"):
+                    response = await asyncio.to_thread(
+                        self.openai_client.chat.completions.create,
+                        model=OPENAI_MODEL,
+                        messages=[
+                            {
+                                "role": "user",
+                                "content": [
+                                    {"type": "text", "text": prompt},
+                                    {
+                                        "type": "image_url",
+                                        "image_url": {
+                                            "url": f"data:image/jpeg;base64,{image_data}"
+                                        }
+                                    }
+                                ]
+                            }
+                        ],
+                        max_tokens=1000
+                    )
+                    record_openai_usage(response, call)
+                
+                with span("json_parse"):
+                    result = json.loads(strip_code_fence(response.choices[0].message.content))
+            result["raw_text"] = receipt_text(result)
+            return result
+        except Exception as e:
+            print(f"OpenAI extraction error: {e}")
+            return self._get_fallback_data()
+    
+    async def _extract_with_local(self, image_path: str, user_id: Optional[int]) -> Dict:
+        """Extract using the offline provider"""
+        try:
+            async with self._provider_call("local", LOCAL_MODEL, "extract", user_id) as call:
+                with span("provider_call"):
+                    result = await self.local_provider.extract_receipt(image_path)
+                call.completion_tokens = estimate_tokens(result)
+            return result
+        except Exception as e:
+            print(f"Local extraction error: {e}")
+            return self._get_fallback_data()
+    
+    async def stream_receipt_extraction(
+        self, image_path: str, user_id: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Streaming variant of extract_receipt_data: yields ("item", item) for each line
+        item as the provider streams it, then ("result", data) with the full extraction,
+        or ("error", {"detail": ...}) if the provider fails part-way - items already
+        yielded belong to no receipt, so there is no fallback result to save.
+        """
+        if self.provider == "gemini" and self.gemini_vision_model:
+            stream = self._stream_gemini
+        elif self.provider == "openai" and self.openai_client:
+            stream = self._stream_openai
+        elif self.provider == "local" and self.local_provider:
+            stream = self._stream_local
+        else:
+            result = await self.extract_receipt_data(image_path, user_id)
+            for item in result.get("items", []):
+                yield "item", item
+            yield "result", result
+            return
+        
+        parser = ItemStreamParser()
+        chunks = []
+        try:
+            async with self._provider_call(self.provider, self.model_name, "extract", user_id) as call:
+                async for text in stream(image_path, call):
+                    chunks.append(text)
+                    for item in parser.feed(text):
+                        yield "item", item
+                raw_text = "".join(chunks)
+                with span("json_parse"):
+                    result = json.loads(strip_code_fence(raw_text))
+        except Exception as e:
+            print(f"Streaming extraction error: {e}")
+            yield "error", {"detail": f"Extraction failed: {e}"}
+            return
+        result.setdefault("raw_text", receipt_text(result))
+        yield "result", result
+    
+    async def _stream_gemini(self, image_path: str, call) -> AsyncIterator[str]:
+        def open_image():
+            image = Image.open(image_path)
+            image.load()
+            return image
+        
+        with span("image_decode"):
+            image = await asyncio.to_thread(open_image)
+        # The SDK's stream is a blocking iterator; pull each chunk off the event loop
+        with span("provider_call"):
+            response = await asyncio.to_thread(
+                self.gemini_vision_model.generate_content, [EXTRACTION_PROMPT, image], stream=True
+            )
+            chunks = iter(response)
+            while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                yield chunk.text
+            record_gemini_usage(response, call)
+    
+    async def _stream_openai(self, image_path: str, call) -> AsyncIterator[str]:
+        with span("image_encode"):
             with open(image_path, "rb") as image_file:
                 import base64
                 image_data = base64.b64encode(image_file.read()).decode('utf-8')
-            
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o",
+        
+        output = []
+        with span("provider_call"):
+            response = await asyncio.to_thread(
+                self.openai_client.chat.completions.create,
+                model=OPENAI_MODEL,
                 messages=[
                     {
                         "role": "user",
                         "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_data}"
-                                }
-                            }
+                            {"type": "text", "text": EXTRACTION_PROMPT},
+                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}}
                         ]
                     }
                 ],
-                max_tokens=1000
+                max_tokens=1000,
+                stream=True
             )
-            
-            text = response.choices[0].message.content.strip()
-            if text.startswith("```json"):
-                text = text.split("```json")[1].split("```")[0]
-            elif text.startswith("```"):
-                text = text.split("```")[1].split("```")[0]
-            
-            return json.loads(text.strip())
-        except Exception as e:
-            print(f"OpenAI extraction error: {e}")
-            return self._get_fallback_data()
+            chunks = iter(response)
+            while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    output.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        # Streamed completions don't report usage in this SDK version
+        call.prompt_tokens = estimate_tokens(EXTRACTION_PROMPT)
+        call.completion_tokens = estimate_tokens("".join(output))
     
-    async def analyze_spending_behavior(self, receipts_data: List[Dict]) -> Dict:
+    async def _stream_local(self, image_path: str, call) -> AsyncIterator[str]:
+        output = []
+        with span("provider_call"):
+            async for chunk in self.local_provider.stream_receipt(image_path):
+                output.append(chunk)
+                yield chunk
+        call.completion_tokens = estimate_tokens("".join(output))
+    
+    async def analyze_spending_behavior(self, receipts_data: List[Dict], user_id: Optional[int] = None) -> Dict:
         """Analyze spending patterns and generate insights"""
         
         # Return empty if no data
@@ -165,49 +383,69 @@ class AIService:
         Do not include any explanatory text, only return the JSON object.
         """
         
+        cache_key = prompt_cache.key("analyze", self.model_name, receipts_data[:20])
+        cached = await prompt_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         if self.provider == "gemini" and self.gemini_model:
-            return await self._analyze_with_gemini(prompt)
+            result = await self._analyze_with_gemini(prompt, user_id)
         elif self.provider == "openai" and self.openai_client:
-            return await self._analyze_with_openai(prompt)
+            result = await self._analyze_with_openai(prompt, user_id)
+        elif self.provider == "local" and self.local_provider:
+            result = await self._analyze_with_local(receipts_data, user_id)
         else:
             print(f"❌ No AI provider available for analysis")
             return {"impulse_buys": [], "spending_trends": [], "peak_spending": {}, "top_categories": []}
+        
+        # Failures come back as the empty structure; only real answers are cached
+        if any(result.get(k) for k in ("impulse_buys", "spending_trends", "peak_spending", "top_categories")):
+            await prompt_cache.set(cache_key, result)
+        return result
     
-    async def _analyze_with_gemini(self, prompt: str) -> Dict:
+    async def _analyze_with_gemini(self, prompt: str, user_id: Optional[int]) -> Dict:
         """Analyze using Gemini"""
         try:
-            response = self.gemini_model.generate_content(prompt)
-            text = response.text.strip()
-            
-            # Remove markdown code blocks if present
-            if text.startswith("```json"):
-                text = text.split("```json")[1].split("```")[0]
-            elif text.startswith("```"):
-                text = text.split("```")[1].split("```")[0]
-            
-            result = json.loads(text.strip())
+            async with self._provider_call("gemini", self.gemini_model_name, "analyze", user_id) as call:
+                response = self.gemini_model.generate_content(prompt)
+                record_gemini_usage(response, call)
+                result = json.loads(strip_code_fence(response.text))
             print(f"✅ Gemini analysis successful")
             return result
         except Exception as e:
             print(f"Gemini analysis error: {e}")
             return {"impulse_buys": [], "spending_trends": [], "peak_spending": {}, "top_categories": []}
     
-    async def _analyze_with_openai(self, prompt: str) -> Dict:
+    async def _analyze_with_openai(self, prompt: str, user_id: Optional[int]) -> Dict:
         """Analyze using OpenAI"""
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                response_format={"type": "json_object"}
-            )
-            result = json.loads(response.choices[0].message.content)
+            async with self._provider_call("openai", OPENAI_MODEL, "analyze", user_id) as call:
+                response = self.openai_client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    response_format={"type": "json_object"}
+                )
+                record_openai_usage(response, call)
+                result = json.loads(response.choices[0].message.content)
             print(f"✅ OpenAI analysis successful")
             return result
         except Exception as e:
             print(f"OpenAI analysis error: {e}")
             return {"impulse_buys": [], "spending_trends": [], "peak_spending": {}, "top_categories": []}
     
-    async def generate_recommendations(self, spending_data: Dict) -> List[Dict]:
+    async def _analyze_with_local(self, receipts_data: List[Dict], user_id: Optional[int]) -> Dict:
+        """Analyze using the offline provider"""
+        try:
+            async with self._provider_call("local", LOCAL_MODEL, "analyze", user_id) as call:
+                result = await self.local_provider.analyze_spending(receipts_data[:20])
+                call.prompt_tokens = estimate_tokens(receipts_data[:20])
+                call.completion_tokens = estimate_tokens(result)
+            return result
+        except Exception as e:
+            print(f"Local analysis error: {e}")
+            return {"impulse_buys": [], "spending_trends": [], "peak_spending": {}, "top_categories": []}
+    
+    async def generate_recommendations(self, spending_data: Dict, user_id: Optional[int] = None) -> List[Dict]:
         """Generate personalized shopping recommendations"""
         
         prompt = f"""
@@ -229,33 +467,59 @@ class AIService:
         Do not include any explanatory text, only return the JSON array.
         """
         
+        cache_key = prompt_cache.key("recommend", self.model_name, spending_data)
+        cached = await prompt_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             if self.provider == "gemini" and self.gemini_model:
-                response = self.gemini_model.generate_content(prompt)
-                text = response.text.strip()
+                async with self._provider_call("gemini", self.gemini_model_name, "recommend", user_id) as call:
+                    response = self.gemini_model.generate_content(prompt)
+                    record_gemini_usage(response, call)
+                    text = response.text.strip()
             elif self.provider == "openai" and self.openai_client:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                text = response.choices[0].message.content.strip()
+                async with self._provider_call("openai", OPENAI_MODEL, "recommend", user_id) as call:
+                    response = self.openai_client.chat.completions.create(
+                        model=OPENAI_MODEL,
+                        messages=[{"role": "user", "content": prompt}]
+                    )
+                    record_openai_usage(response, call)
+                    text = response.choices[0].message.content.strip()
+            elif self.provider == "local" and self.local_provider:
+                async with self._provider_call("local", LOCAL_MODEL, "recommend", user_id) as call:
+                    result = await self.local_provider.generate_recommendations(spending_data)
+                    call.prompt_tokens = estimate_tokens(spending_data)
+                    call.completion_tokens = estimate_tokens(result)
+                await prompt_cache.set(cache_key, result)
+                return result
             else:
                 print("❌ No AI provider available for recommendations")
                 return []
             
-            # Remove markdown code blocks if present
-            if text.startswith("```json"):
-                text = text.split("```json")[1].split("```")[0]
-            elif text.startswith("```"):
-                text = text.split("```")[1].split("```")[0]
-            
-            result = json.loads(text.strip())
+            result = json.loads(strip_code_fence(text))
             print(f"✅ Recommendations generated successfully")
+            await prompt_cache.set(cache_key, result)
             return result
         except Exception as e:
             print(f"Recommendations error: {e}")
             return []
     
+    @property
+    def model_name(self) -> Optional[str]:
+        return {"gemini": self.gemini_model_name, "openai": OPENAI_MODEL, "local": LOCAL_MODEL}.get(self.provider)
+    
+    @asynccontextmanager
+    async def _provider_call(self, provider: str, model: Optional[str], operation: str, user_id: Optional[int]):
+        """Metrics for every call, plus per-user token/cost accounting for the ones that succeed"""
+        with track_ai_call(provider, model, operation) as call:
+            yield call
+        try:
+            async with AsyncSessionLocal() as db:
+                await record_usage(db, user_id, operation, provider, model, call.prompt_tokens, call.completion_tokens)
+        except Exception as e:
+            print(f"⚠️ Failed to record AI usage: {e}")
+    
     def _get_fallback_data(self) -> Dict:
         """Fallback data structure if AI extraction fails"""
         return {
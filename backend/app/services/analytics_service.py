@@ -1,21 +1,105 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.models.database import Receipt, Item, SpendingInsight, Budget
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Integer, cast, func
+from app.models.database import Receipt, Item, SpendingInsight, Budget, Product
 from app.models.schemas import SpendingAnalytics
-from datetime import datetime, timedelta
-from typing import Dict, List
+from app.services.product_service import normalize_item_name
+from app.services.budget_service import budget_state, current_period, current_spend
+from app.services.cache_service import cache_backend, user_namespace
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
 from collections import defaultdict
+from statistics import median
+import os
+
+DASHBOARD_SECTIONS = ("spending", "categories", "budgets")
+GRANULARITIES = ("day", "week", "month", "quarter")
+# Upper bound on points per series (a little over 13 years of days)
+MAX_TIMESERIES_POINTS = 5000
+# Cached dashboards are dropped as soon as the user's data changes; the TTL only
+# bounds how long an untouched entry occupies the cache (0 disables caching)
+ANALYTICS_CACHE_TTL_SECONDS = int(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "300"))
+
+
+def period_start(day: date, granularity: str) -> date:
+    """First day of the calendar period containing `day` (weeks start on Monday, as ISO weeks do)"""
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+
+
+def next_period(start: date, granularity: str) -> date:
+    if granularity == "day":
+        return start + timedelta(days=1)
+    if granularity == "week":
+        return start + timedelta(days=7)
+    months = 1 if granularity == "month" else 3
+    month_index = start.year * 12 + start.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def period_label(start: date, granularity: str) -> str:
+    if granularity == "day":
+        return start.isoformat()
+    if granularity == "week":
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == "month":
+        return start.strftime("%b %Y")
+    return f"Q{(start.month - 1) // 3 + 1} {start.year}"
+
+
+def bucket_expression(column, granularity: str, dialect: str):
+    """SQL expression for the start date of the calendar period containing `column`"""
+    if dialect == "postgresql":
+        return func.date(func.date_trunc(granularity, column))
+    # SQLite: date modifiers and strftime
+    if granularity == "day":
+        return func.date(column)
+    if granularity == "week":
+        # Forward to Sunday (no-op on Sundays), then back to that week's Monday
+        return func.date(column, "weekday 0", "-6 days")
+    if granularity == "month":
+        return func.strftime("%Y-%m-01", column)
+    quarter_month = (cast(func.strftime("%m", column), Integer) - 1) // 3 * 3 + 1
+    return func.printf("%s-%02d-01", func.strftime("%Y", column), quarter_month)
+
 
 class AnalyticsService:
 
     @staticmethod
-    def calculate_spending_analytics(db: Session, user_id: int) -> SpendingAnalytics:
-        """Calculate comprehensive spending analytics for a specific user"""
+    def _scan_user_items(db: Session, user_id: int) -> List:
+        """
+        Every receipt of the user with its items in one query (receipts without
+        items appear once with NULL item columns). Spending, category and budget
+        figures are all derived from this single pass.
+        """
+        return db.query(
+            Receipt.id.label("receipt_id"),
+            Receipt.store_name,
+            Receipt.total_amount,
+            Receipt.purchase_date,
+            Item.id.label("item_id"),
+            Item.name,
+            Item.price,
+            Item.quantity,
+            Item.category
+        ).outerjoin(Item, Item.receipt_id == Receipt.id).filter(
+            Receipt.user_id == user_id
+        ).all()
 
-        # Get only this user's receipts and items
-        receipts = db.query(Receipt).filter(Receipt.user_id == user_id).all()  # 👈 filter
-        receipt_ids = [r.id for r in receipts]
-        items = db.query(Item).filter(Item.receipt_id.in_(receipt_ids)).all()  # 👈 filter
+    @staticmethod
+    def _spending_from_rows(rows: List) -> SpendingAnalytics:
+        receipts = {}
+        spending_by_category = defaultdict(float)
+        for row in rows:
+            receipts[row.receipt_id] = row
+            if row.item_id is not None:
+                spending_by_category[row.category or "Other"] += row.price * row.quantity
 
         if not receipts:
             return SpendingAnalytics(
@@ -29,25 +113,18 @@ class AnalyticsService:
                 monthly_trend=[]
             )
 
-        total_spent = sum(r.total_amount or 0 for r in receipts)
+        total_spent = sum(r.total_amount or 0 for r in receipts.values())
         transaction_count = len(receipts)
         average_transaction = total_spent / transaction_count if transaction_count > 0 else 0
 
-        spending_by_category = defaultdict(float)
-        for item in items:
-            category = item.category or "Other"
-            spending_by_category[category] += item.price * item.quantity
-
         spending_by_store = defaultdict(float)
-        for receipt in receipts:
+        for receipt in receipts.values():
             store = receipt.store_name or "Unknown"
             spending_by_store[store] += receipt.total_amount or 0
 
         top_category = max(spending_by_category.items(), key=lambda x: x[1])[0] if spending_by_category else None
         top_store = max(spending_by_store.items(), key=lambda x: x[1])[0] if spending_by_store else None
 
-        monthly_trend = AnalyticsService._calculate_monthly_trend(db, user_id)  # 👈 pass user_id
-
         return SpendingAnalytics(
             total_spent=round(total_spent, 2),
             transaction_count=transaction_count,
@@ -56,58 +133,41 @@ class AnalyticsService:
             top_store=top_store,
             spending_by_category=dict(spending_by_category),
             spending_by_store=dict(spending_by_store),
-            monthly_trend=monthly_trend
+            monthly_trend=AnalyticsService._monthly_trend(receipts.values())
         )
 
     @staticmethod
-    def _calculate_monthly_trend(db: Session, user_id: int) -> List[Dict]:
-        """Calculate spending trend for last 6 months for a specific user"""
-        now = datetime.utcnow()
-        six_months_ago = now - timedelta(days=180)
-
-        receipts = db.query(Receipt).filter(
-            Receipt.user_id == user_id,                    # 👈 filter
-            Receipt.purchase_date >= six_months_ago
-        ).all()
+    def _monthly_trend(receipts) -> List[Dict]:
+        """Spending per calendar month, for this month and the 5 before it"""
+        months = [period_start(datetime.utcnow().date(), "month")]
+        for _ in range(5):
+            months.insert(0, period_start(months[0] - timedelta(days=1), "month"))
 
         monthly_data = defaultdict(float)
         for receipt in receipts:
-            if receipt.purchase_date:
-                month_key = receipt.purchase_date.strftime("%Y-%m")
-                monthly_data[month_key] += receipt.total_amount or 0
-
-        trend = []
-        for i in range(5, -1, -1):
-            month_date = now - timedelta(days=30 * i)
-            month_key = month_date.strftime("%Y-%m")
-            trend.append({
-                "month": month_date.strftime("%b %Y"),
-                "amount": round(monthly_data.get(month_key, 0.0), 2)
-            })
-
-        return trend
+            if receipt.purchase_date and receipt.purchase_date.date() >= months[0]:
+                monthly_data[receipt.purchase_date.date().replace(day=1)] += receipt.total_amount or 0
 
-    @staticmethod
-    def get_category_breakdown(db: Session, user_id: int) -> Dict[str, Dict]:
-        """Get detailed breakdown by category for a specific user"""
-
-        # Get only this user's items via their receipts
-        receipt_ids = [
-            r.id for r in db.query(Receipt).filter(Receipt.user_id == user_id).all()  # 👈 filter
+        return [
+            {"month": month.strftime("%b %Y"), "amount": round(monthly_data.get(month, 0.0), 2)}
+            for month in months
         ]
-        items = db.query(Item).filter(Item.receipt_id.in_(receipt_ids)).all()  # 👈 filter
 
+    @staticmethod
+    def _categories_from_rows(rows: List) -> Dict[str, Dict]:
         category_data = defaultdict(lambda: {"total": 0.0, "count": 0, "items": []})
 
-        for item in items:
-            category = item.category or "Other"
-            amount = item.price * item.quantity
+        for row in rows:
+            if row.item_id is None:
+                continue
+            category = row.category or "Other"
+            amount = row.price * row.quantity
             category_data[category]["total"] += amount
             category_data[category]["count"] += 1
             category_data[category]["items"].append({
-                "name": item.name,
-                "price": item.price,
-                "quantity": item.quantity
+                "name": row.name,
+                "price": row.price,
+                "quantity": row.quantity
             })
 
         total = sum(cat["total"] for cat in category_data.values())
@@ -126,55 +186,270 @@ class AnalyticsService:
 
         return result
 
+    @staticmethod
+    def calculate_spending_analytics(db: Session, user_id: int) -> SpendingAnalytics:
+        """Calculate comprehensive spending analytics for a specific user"""
+        return AnalyticsService._spending_from_rows(AnalyticsService._scan_user_items(db, user_id))
+
+    @staticmethod
+    def get_category_breakdown(db: Session, user_id: int) -> Dict[str, Dict]:
+        """Get detailed breakdown by category for a specific user"""
+        return AnalyticsService._categories_from_rows(AnalyticsService._scan_user_items(db, user_id))
+
+    @staticmethod
+    def get_dashboard(db: Session, user_id: int, sections=DASHBOARD_SECTIONS) -> Dict:
+        """Spending and category breakdown (from one scan of the user's items) and budget status, any subset"""
+        rows = AnalyticsService._scan_user_items(db, user_id) if {"spending", "categories"} & set(sections) else []
+        result = {}
+        if "spending" in sections:
+            result["spending"] = AnalyticsService._spending_from_rows(rows)
+        if "categories" in sections:
+            result["categories"] = AnalyticsService._categories_from_rows(rows)
+        if "budgets" in sections:
+            result["budgets"] = AnalyticsService.get_budget_status(db, user_id)
+        return result
+
+    @staticmethod
+    async def get_dashboard_cached(db: AsyncSession, user_id: int, sections=DASHBOARD_SECTIONS) -> Dict:
+        """get_dashboard as plain JSON values, from the shared cache until invalidate_user() for this user"""
+        key = None
+        if ANALYTICS_CACHE_TTL_SECONDS > 0:
+            # The month is part of the key because budgets roll over with it
+            key = await cache_backend.versioned_key(
+                user_namespace(user_id), f"dashboard:{current_period().isoformat()}:{','.join(sorted(sections))}"
+            )
+            cached = await cache_backend.get(key)
+            if cached is not None:
+                return cached
+
+        dashboard = await db.run_sync(AnalyticsService.get_dashboard, user_id, sections)
+        if "spending" in dashboard:
+            dashboard["spending"] = dashboard["spending"].model_dump(mode="json")
+        if key is not None:
+            await cache_backend.set(key, dashboard, ANALYTICS_CACHE_TTL_SECONDS)
+        return dashboard
+
+    @staticmethod
+    def get_timeseries(
+        db: Session,
+        user_id: int,
+        start: date,
+        end: date,
+        granularity: str = "month",
+        category: Optional[str] = None,
+        store: Optional[str] = None
+    ) -> Dict:
+        """
+        Spending per calendar period between start and end (inclusive), bucketed
+        and summed in SQL, with empty periods filled in as zero. Filtering by
+        category sums matching line items; otherwise receipt totals are used.
+        Raises ValueError for an empty range or one with too many periods.
+        """
+        if start > end:
+            raise ValueError("start must not be after end")
+        periods = [period_start(start, granularity)]
+        while next_period(periods[-1], granularity) <= end:
+            periods.append(next_period(periods[-1], granularity))
+            if len(periods) > MAX_TIMESERIES_POINTS:
+                raise ValueError(f"Range has more than {MAX_TIMESERIES_POINTS} {granularity} periods")
+
+        bucket = bucket_expression(Receipt.purchase_date, granularity, db.get_bind().dialect.name).label("bucket")
+        if category:
+            amount = func.sum(Item.price * Item.quantity)
+            count = func.count(func.distinct(Receipt.id))
+        else:
+            amount = func.sum(Receipt.total_amount)
+            count = func.count(Receipt.id)
+
+        query = db.query(bucket, amount, count).filter(
+            Receipt.user_id == user_id,
+            Receipt.purchase_date >= datetime.combine(start, datetime.min.time()),
+            Receipt.purchase_date < datetime.combine(end + timedelta(days=1), datetime.min.time())
+        )
+        if category:
+            query = query.join(Item, Item.receipt_id == Receipt.id).filter(
+                func.lower(Item.category) == category.lower()
+            )
+        if store:
+            query = query.filter(Receipt.store_name == store)
+
+        buckets = {}
+        for period, total, receipts in query.group_by(bucket).all():
+            if isinstance(period, datetime):
+                period = period.date()
+            elif isinstance(period, str):
+                period = date.fromisoformat(period)
+            buckets[period] = (total or 0.0, receipts)
+
+        points = []
+        for period in periods:
+            total, receipts = buckets.get(period, (0.0, 0))
+            points.append({
+                "period": period,
+                "label": period_label(period, granularity),
+                "total": round(total, 2),
+                "count": receipts
+            })
+
+        return {
+            "granularity": granularity,
+            "start": start,
+            "end": end,
+            "category": category,
+            "store": store,
+            "total": round(sum(p["total"] for p in points), 2),
+            "count": sum(p["count"] for p in points),
+            "points": points
+        }
+
     @staticmethod
     def update_budgets(db: Session, user_id: int):
-        """Update budget tracking for a specific user"""
+        """Sync each budget's current_spent with this month's category counter"""
+        spend = current_spend(db, user_id)
         budgets = db.query(Budget).filter(Budget.user_id == user_id).all()  # 👈 filter
 
         for budget in budgets:
             if budget.last_reset.month != datetime.utcnow().month:
-                budget.current_spent = 0.0
                 budget.last_reset = datetime.utcnow()
+            budget.current_spent = spend.get(budget.category, 0.0)
 
-            start_of_month = datetime.utcnow().replace(
-                day=1, hour=0, minute=0, second=0, microsecond=0
-            )
-
-            # Only count items from this user's receipts
-            items = db.query(Item).join(Receipt).filter(
-                Receipt.user_id == user_id,                # 👈 filter
-                Item.category == budget.category,
-                Receipt.purchase_date >= start_of_month
-            ).all()
-
-            budget.current_spent = sum(item.price * item.quantity for item in items)
-
-        db.commit()
+        # Only write when a figure actually moved, so repeated reads stay read-only
+        if any(db.is_modified(budget) for budget in budgets):
+            db.commit()
+        return budgets
 
     @staticmethod
     def get_budget_status(db: Session, user_id: int) -> List[Dict]:
         """Get budget status for a specific user"""
-        AnalyticsService.update_budgets(db, user_id)  # 👈 pass user_id
+        budgets = AnalyticsService.update_budgets(db, user_id)  # 👈 pass user_id
+        return [AnalyticsService._budget_status(budget) for budget in budgets]
 
-        budgets = db.query(Budget).filter(Budget.user_id == user_id).all()  # 👈 filter
+    @staticmethod
+    def _budget_status(budget: Budget) -> Dict:
+        percentage_used = (
+            budget.current_spent / budget.monthly_limit * 100
+        ) if budget.monthly_limit > 0 else 0
+
+        return {
+            "id": budget.id,
+            "category": budget.category,
+            "monthly_limit": budget.monthly_limit,
+            "current_spent": round(budget.current_spent, 2),
+            "percentage_used": round(percentage_used, 1),
+            "remaining": round(budget.monthly_limit - budget.current_spent, 2),
+            "status": budget_state(budget.current_spent, budget.monthly_limit)
+        }
+
+    @staticmethod
+    def get_price_history(
+        db: Session,
+        user_id: int,
+        product_id: Optional[int] = None,
+        product: Optional[str] = None,
+        store: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        jump_threshold: float = 0.2,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> Dict:
+        """
+        Unit-price time series per product and store, with summary stats and price jumps.
+        Without a product, `limit` products (by id, after `offset`) are returned per page.
+        """
+        if product and not product_id:
+            product_id = db.query(Product.id).filter(
+                Product.normalized_key == normalize_item_name(product)
+            ).scalar()
+            if not product_id:
+                return {"series": [], "next_offset": None}
+
+        store_col = func.coalesce(Receipt.store_name, "Unknown")
+        date_col = func.coalesce(Receipt.purchase_date, Receipt.upload_date)
+        # Previous price at the same store, so jumps come straight out of the query
+        prev_price = func.lag(Item.price).over(
+            partition_by=(Item.product_id, store_col),
+            order_by=(date_col, Receipt.id)
+        )
+
+        # Same expression as ix_receipts_user_effective_date, so date ranges are index scans
+        filters = [Receipt.user_id == user_id]
+        if product_id:
+            filters.append(Item.product_id == product_id)
+        if store:
+            filters.append(Receipt.store_name == store)
+        if start:
+            filters.append(date_col >= start)
+        if end:
+            filters.append(date_col < end)
+
+        next_offset = None
+        if not product_id and limit:
+            page = [pid for (pid,) in db.query(Item.product_id).join(
+                Receipt, Receipt.id == Item.receipt_id
+            ).filter(*filters, Item.product_id.is_not(None)).distinct().order_by(
+                Item.product_id
+            ).limit(limit + 1).offset(offset)]
+            if len(page) > limit:
+                next_offset = offset + limit
+                page = page[:limit]
+            if not page:
+                return {"series": [], "next_offset": None}
+            # Whole products only, so each one's lag() window is unchanged
+            filters.append(Item.product_id.in_(page))
+
+        query = db.query(
+            Item.product_id,
+            Product.canonical_name,
+            store_col.label("store"),
+            date_col.label("date"),
+            Item.price,
+            prev_price.label("prev_price"),
+            Receipt.id.label("receipt_id")
+        ).join(Receipt, Receipt.id == Item.receipt_id).join(
+            Product, Product.id == Item.product_id
+        ).filter(*filters)
+
+        rows = query.order_by(Item.product_id, store_col, date_col, Receipt.id).all()
+
+        series = {}
+        for row in rows:
+            key = (row.product_id, row.store)
+            if key not in series:
+                series[key] = {
+                    "product_id": row.product_id,
+                    "product": row.canonical_name,
+                    "store": row.store,
+                    "points": [],
+                    "jumps": []
+                }
+            entry = series[key]
+            entry["points"].append({
+                "date": row.date,
+                "price": row.price,
+                "receipt_id": row.receipt_id
+            })
+            if row.prev_price and abs(row.price - row.prev_price) / row.prev_price >= jump_threshold:
+                entry["jumps"].append({
+                    "date": row.date,
+                    "from": row.prev_price,
+                    "to": row.price,
+                    "change_pct": round((row.price - row.prev_price) / row.prev_price * 100, 1)
+                })
 
         result = []
-        for budget in budgets:
-            percentage_used = (
-                budget.current_spent / budget.monthly_limit * 100
-            ) if budget.monthly_limit > 0 else 0
-
-            result.append({
-                "id": budget.id,
-                "category": budget.category,
-                "monthly_limit": budget.monthly_limit,
-                "current_spent": round(budget.current_spent, 2),
-                "percentage_used": round(percentage_used, 1),
-                "remaining": round(budget.monthly_limit - budget.current_spent, 2),
-                "status": "over" if percentage_used > 100 else "warning" if percentage_used > 80 else "ok"
+        for entry in series.values():
+            prices = [p["price"] for p in entry["points"]]
+            entry.update({
+                "min": min(prices),
+                "max": max(prices),
+                "median": round(median(prices), 2),
+                "latest": prices[-1],
+                "count": len(prices)
             })
+            result.append(entry)
 
-        return result
+        return {"series": result, "next_offset": next_offset}
 
 
 analytics_service = AnalyticsService()
\ No newline at end of file
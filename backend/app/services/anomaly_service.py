@@ -0,0 +1,349 @@
+import os
+from datetime import timedelta
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.models.database import Item, Receipt
+
+# Robust z-score (distance from the median in MAD-derived standard deviations)
+# at or above which a value is flagged; 3.5 is Iglewicz and Hoaglin's cut-off
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3.5"))
+# Purchases from the last this-many days (up to the latest one) are checked...
+ANOMALY_LOOKBACK_DAYS = int(os.getenv("ANOMALY_LOOKBACK_DAYS", "30"))
+# ...against baselines over a rolling window this much longer
+ANOMALY_BASELINE_DAYS = int(os.getenv("ANOMALY_BASELINE_DAYS", "365"))
+# Findings kept per kind, highest score first
+ANOMALY_MAX_FINDINGS = int(os.getenv("ANOMALY_MAX_FINDINGS", "5"))
+
+# Fewest observations a baseline needs before anything is judged against it
+MIN_CATEGORY_HISTORY = 8
+MIN_PRODUCT_HISTORY = 4
+MIN_RECEIPT_HISTORY = 8
+MIN_WEEK_HISTORY = 4
+# A store visited at most this many times in the window counts as unusual
+RARE_STORE_VISITS = 2
+# A weekday or hour spike must also be at least this share of a typical week's spend
+SPIKE_MIN_SHARE = 0.25
+
+# MAD / 0.6745 estimates the standard deviation of normal data; when more than
+# half the values are equal (MAD = 0) the mean absolute deviation x 1.2533 is
+# used instead, and the spread never drops below 5% of the median (or one cent)
+MAD_TO_SD = 1 / 0.6745
+MEAN_AD_TO_SD = 1.2533
+MIN_RELATIVE_SPREAD = 0.05
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+DAY = np.timedelta64(1, "D")
+
+
+@dataclass
+class Anomaly:
+    """One flagged value with the baseline it was judged against"""
+    kind: str            # "purchase", "store" or "spike"
+    subject: str         # item name, store name, or the weekday/hour/week that spiked
+    amount: float
+    median: float        # the baseline's typical value
+    spread: float        # the baseline's robust standard deviation
+    observations: int    # values the baseline was built from
+    score: float         # (amount - median) / spread
+    basis: str           # what the baseline covers, e.g. "your Vitamin D purchases"
+    category: Optional[str] = None
+
+    @property
+    def explanation(self) -> str:
+        return (
+            f"${self.amount:.2f} vs a typical ${self.median:.2f} for {self.basis} "
+            f"(median of {self.observations}); {self.score:.1f} standard deviations above normal"
+        )
+
+    def insight(self) -> Dict:
+        """Keyword arguments for insight_service.upsert_insight"""
+        insight_type, title = {
+            "purchase": ("impulse", "Impulse Purchase"),
+            "store": ("store", "Unusual Store Visit"),
+            "spike": ("spike", "Spending Spike"),
+        }[self.kind]
+        return {
+            "insight_type": insight_type,
+            "title": f"{title}: {self.subject}",
+            "description": self.explanation,
+            "category": self.category,
+            "amount": self.amount,
+            "score": self.score,
+        }
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "explanation": self.explanation}
+
+
+@dataclass
+class PurchaseHistory:
+    """A user's line items as parallel arrays; *_codes index into the matching name lists"""
+    price: np.ndarray            # unit price
+    amount: np.ndarray           # price x quantity
+    when: np.ndarray             # datetime64[s]; purchase date, else upload date
+    receipt_codes: np.ndarray
+    category_codes: np.ndarray
+    product_codes: np.ndarray
+    store_codes: np.ndarray      # per receipt code
+    categories: np.ndarray
+    products: np.ndarray         # display name per product
+    stores: np.ndarray
+
+
+def _encode(values) -> Tuple[List, np.ndarray]:
+    """Labels in first-seen order and each value's index into them (hashing, not sorting strings)"""
+    index: Dict = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64)
+    return list(index), codes
+
+
+def load_history(db: Session, user_id: int, days: Optional[int] = None) -> Optional[PurchaseHistory]:
+    """The user's line items, or only those from the `days` days up to their latest purchase"""
+    purchased = func.coalesce(Receipt.purchase_date, Receipt.upload_date)
+    # Core rows rather than ORM ones, and dates per receipt rather than per item:
+    # building Python objects is most of the cost of a large history
+    conn = db.connection()
+    scope = [Receipt.user_id == user_id]
+    if days is not None:
+        latest = conn.execute(select(func.max(purchased)).where(*scope)).scalar()
+        if latest is None:
+            return None
+        scope.append(purchased > latest - timedelta(days=days))
+
+    receipts = conn.execute(
+        select(Receipt.id, Receipt.store_name, purchased).where(*scope).order_by(Receipt.id)
+    ).all()
+    items = conn.execute(
+        select(Item.receipt_id, Item.price, Item.quantity, Item.category, Item.product_id, Item.name)
+        .join(Receipt, Item.receipt_id == Receipt.id)
+        .where(*scope)
+    ).all()
+    if not items:
+        return None
+
+    receipt_ids, stores, dates = zip(*receipts)
+    item_receipts, prices, quantities, categories, product_ids, names = zip(*items)
+    receipt_codes = np.searchsorted(np.asarray(receipt_ids), np.asarray(item_receipts))
+    store_labels, store_codes = _encode(s or "Unknown store" for s in stores)
+    price = np.asarray(prices, dtype=float)
+    amount = price * np.asarray([q or 1 for q in quantities], dtype=float)
+    category_labels, category_codes = _encode(c or "other" for c in categories)
+    # Items linked to the same canonical product share a baseline whatever their spelling
+    product_keys, product_codes = _encode(
+        pid if pid else name.strip().lower() for pid, name in zip(product_ids, names)
+    )
+    first_index = np.zeros(len(product_keys), dtype=np.int64)
+    first_index[product_codes[::-1]] = np.arange(len(product_codes))[::-1]
+
+    return PurchaseHistory(
+        price=price,
+        amount=amount,
+        when=np.asarray(dates, dtype="datetime64[s]")[receipt_codes],
+        receipt_codes=receipt_codes,
+        category_codes=category_codes,
+        product_codes=product_codes,
+        store_codes=store_codes,
+        categories=np.asarray(category_labels, dtype=object),
+        products=np.asarray(names, dtype=object)[first_index],
+        stores=np.asarray(store_labels, dtype=object),
+    )
+
+
+def group_median(values: np.ndarray, groups: np.ndarray, n_groups: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Median and size of each group, from one sort; empty groups get NaN"""
+    counts = np.bincount(groups, minlength=n_groups)
+    medians = np.full(n_groups, np.nan)
+    if len(values) == 0:
+        return medians, counts
+    ordered = values[np.lexsort((values, groups))]
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+    lo = starts[present] + (counts[present] - 1) // 2
+    hi = starts[present] + counts[present] // 2
+    medians[present] = (ordered[lo] + ordered[hi]) / 2
+    return medians, counts
+
+
+def robust_baseline(values: np.ndarray, groups: np.ndarray, n_groups: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per-group (median, robust standard deviation, count)"""
+    medians, counts = group_median(values, groups, n_groups)
+    deviations = np.abs(values - medians[groups])
+    mad, _ = group_median(deviations, groups, n_groups)
+    mean_ad = np.bincount(groups, weights=deviations, minlength=n_groups) / np.maximum(counts, 1)
+    spread = np.where(mad > 0, mad * MAD_TO_SD, mean_ad * MEAN_AD_TO_SD)
+    spread = np.maximum(spread, np.maximum(np.abs(np.nan_to_num(medians)) * MIN_RELATIVE_SPREAD, 0.01))
+    return medians, spread, counts
+
+
+def _top(anomalies: List[Anomaly], limit: int) -> List[Anomaly]:
+    return sorted(anomalies, key=lambda a: -a.score)[:limit]
+
+
+def detect_outlier_purchases(history: PurchaseHistory, window: np.ndarray, recent: np.ndarray,
+                             threshold: float, limit: int) -> List[Anomaly]:
+    """
+    Recent items whose unit price is far above the same product's baseline or, for
+    products bought too rarely to have one, their category's. An item whose category
+    is too thin for a baseline isn't judged: against every item, a routine tank of
+    fuel in a grocery-heavy history looks like a splurge. Unit prices, so buying
+    several of something usual isn't mistaken for a splurge either.
+    """
+    amount = history.price[window]
+    categories, products = history.category_codes[window], history.product_codes[window]
+    cat_median, cat_spread, cat_count = robust_baseline(amount, categories, len(history.categories))
+    prod_median, prod_spread, prod_count = robust_baseline(amount, products, len(history.products))
+
+    candidates = np.flatnonzero(recent[window])
+    c, p, x = categories[candidates], products[candidates], amount[candidates]
+    # The narrowest baseline with enough history: the product, else its category
+    use_product = prod_count[p] >= MIN_PRODUCT_HISTORY
+    use_category = ~use_product & (cat_count[c] >= MIN_CATEGORY_HISTORY)
+    median = np.where(use_product, prod_median[p], cat_median[c])
+    spread = np.where(use_product, prod_spread[p], cat_spread[c])
+    count = np.where(use_product, prod_count[p], cat_count[c])
+    score = np.where(use_product | use_category, (x - median) / spread, 0.0)
+    flagged = (score >= threshold) & (use_product | use_category)
+
+    best: Dict[int, Anomaly] = {}
+    for i in np.flatnonzero(flagged):
+        product = int(p[i])
+        if product in best and best[product].score >= score[i]:
+            continue
+        name = history.products[product]
+        category = history.categories[c[i]]
+        best[product] = Anomaly(
+            kind="purchase",
+            subject=name,
+            amount=round(float(x[i]), 2),
+            median=round(float(median[i]), 2),
+            spread=round(float(spread[i]), 2),
+            observations=int(count[i]),
+            score=round(float(score[i]), 2),
+            basis=f"your {name} purchases" if use_product[i] else f"a {category} item",
+            category=category,
+        )
+    return _top(list(best.values()), limit)
+
+
+def detect_unusual_stores(history: PurchaseHistory, window: np.ndarray, recent: np.ndarray,
+                          threshold: float, limit: int) -> List[Anomaly]:
+    """Recent receipts from rarely visited stores whose total is far above the user's typical receipt"""
+    n_receipts = len(history.store_codes)
+    totals = np.bincount(history.receipt_codes[window], weights=history.amount[window], minlength=n_receipts)
+    in_window = np.bincount(history.receipt_codes[window], minlength=n_receipts) > 0
+    is_recent = np.bincount(history.receipt_codes[recent], minlength=n_receipts) > 0
+    if in_window.sum() < MIN_RECEIPT_HISTORY:
+        return []
+
+    window_totals = totals[in_window]
+    median, spread, _ = robust_baseline(window_totals, np.zeros(len(window_totals), dtype=np.int64), 1)
+    visits = np.bincount(history.store_codes[in_window], minlength=len(history.stores))
+    score = (totals - median[0]) / spread[0]
+    flagged = np.flatnonzero(is_recent & (visits[history.store_codes] <= RARE_STORE_VISITS) & (score >= threshold))
+
+    anomalies = []
+    for receipt in flagged:
+        store = history.stores[history.store_codes[receipt]]
+        times = int(visits[history.store_codes[receipt]])
+        anomalies.append(Anomaly(
+            kind="store",
+            subject=store,
+            amount=round(float(totals[receipt]), 2),
+            median=round(float(median[0]), 2),
+            spread=round(float(spread[0]), 2),
+            observations=int(in_window.sum()),
+            score=round(float(score[receipt]), 2),
+            basis=f"one of your receipts ({times} visit{'s' if times != 1 else ''} to {store} in this period)",
+        ))
+    return _top(anomalies, limit)
+
+
+def detect_spend_spikes(history: PurchaseHistory, window: np.ndarray, latest: np.datetime64,
+                        threshold: float, limit: int) -> List[Anomaly]:
+    """
+    The latest 7 days against every earlier 7-day window, in total and per weekday
+    and (when purchases carry a time of day) per hour.
+    """
+    when, amount = history.when[window], history.amount[window]
+    day = when.astype("datetime64[D]")
+    # Week 0 ends on the latest purchase day, week 1 the seven days before, and so on
+    week = ((latest.astype("datetime64[D]") - day) // DAY).astype(np.int64) // 7
+    # The oldest week is usually cut off by the window; leave it out
+    full = week < max(1, int(week.max()))
+    when, amount, day, week = when[full], amount[full], day[full], week[full]
+    n_weeks = int(week.max()) + 1 if len(week) else 0
+    if n_weeks - 1 < MIN_WEEK_HISTORY:
+        return []
+    # 1970-01-01 was a Thursday
+    weekday = (day.astype(np.int64) + 3) % 7
+    seconds = (when - day).astype("timedelta64[s]").astype(np.int64)
+    hour = seconds // 3600
+
+    # (cell per purchase, number of cells, subject, what the baseline covers)
+    families = [
+        (np.zeros(len(amount), dtype=np.int64), 1, lambda _: "the last 7 days", lambda _: "a 7-day period"),
+        (weekday, 7, lambda cell: f"{WEEKDAYS[cell]}s", lambda cell: f"your {WEEKDAYS[cell]}s"),
+    ]
+    # Dates without a time come back as midnight; hours only mean something otherwise
+    if np.mean(seconds > 0) > 0.5:
+        hours = lambda cell: f"{cell:02d}:00-{(cell + 1) % 24:02d}:00"
+        families.append((hour, 24, hours, lambda cell: f"{hours(cell)} in a week"))
+
+    anomalies = []
+    weekly_median = None
+    for cells, n_cells, subject, basis in families:
+        # Spend per (week, cell), including the weeks where nothing was bought
+        grid = np.bincount(week * n_cells + cells, weights=amount, minlength=n_weeks * n_cells).reshape(n_weeks, n_cells)
+        earlier = grid[1:]
+        groups = np.broadcast_to(np.arange(n_cells), earlier.shape).ravel()
+        median, spread, _ = robust_baseline(earlier.ravel(), groups, n_cells)
+        if weekly_median is None:
+            weekly_median = median[0]
+        else:
+            # An hour that is usually empty has no spread of its own; measure it
+            # against an even share of a typical week instead of a cent
+            spread = np.maximum(spread, weekly_median / n_cells)
+        score = (grid[0] - median) / spread
+        flagged = score >= threshold
+        if n_cells > 1:
+            # A quiet weekday or hour spikes on any purchase; only flag real money
+            flagged &= grid[0] >= SPIKE_MIN_SHARE * weekly_median
+        for cell in np.flatnonzero(flagged):
+            anomalies.append(Anomaly(
+                kind="spike",
+                subject=subject(int(cell)),
+                amount=round(float(grid[0, cell]), 2),
+                median=round(float(median[cell]), 2),
+                spread=round(float(spread[cell]), 2),
+                observations=n_weeks - 1,
+                score=round(float(score[cell]), 2),
+                basis=basis(int(cell)),
+            ))
+    return _top(anomalies, limit)
+
+
+def detect_anomalies(db: Session, user_id: int, threshold: float = ANOMALY_Z_THRESHOLD,
+                     lookback_days: int = ANOMALY_LOOKBACK_DAYS, baseline_days: int = ANOMALY_BASELINE_DAYS,
+                     limit: int = ANOMALY_MAX_FINDINGS) -> Dict[str, List[Anomaly]]:
+    """
+    Flag outlier purchases, unusual store visits and spend spikes in the user's
+    last `lookback_days` of purchases, each judged by a median/MAD baseline over
+    the rolling `lookback_days + baseline_days` window ending at the latest purchase.
+    Medians and MADs resist the outliers themselves, so recent purchases stay in
+    their own baseline. Deterministic; one query plus array work.
+    """
+    history = load_history(db, user_id, lookback_days + baseline_days)
+    if history is None:
+        return {"purchases": [], "stores": [], "spikes": []}
+
+    latest = history.when.max()
+    window = history.when > latest - np.timedelta64(lookback_days + baseline_days, "D")
+    recent = history.when > latest - np.timedelta64(lookback_days, "D")
+    return {
+        "purchases": detect_outlier_purchases(history, window, recent, threshold, limit),
+        "stores": detect_unusual_stores(history, window, recent, threshold, limit),
+        "spikes": detect_spend_spikes(history, window, latest, threshold, limit),
+    }
@@ -1,16 +1,92 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.metrics import QUEUE_REJECTED, track_queue
 from app.models.database import User
+import asyncio
+import math
 import os
+import threading
+import time
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor — hashes stored with any other cost are re-hashed on next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the password hashing queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+class PasswordHashExecutor:
+    """
+    Runs bcrypt on its own small thread pool so login storms can't starve
+    FastAPI's shared threadpool. bcrypt releases the GIL, so threads are enough.
+    Jobs beyond workers + max_queue are rejected instead of queued.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwhash")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._avg_seconds = 0.25  # rough bcrypt cost until we have measurements
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _retry_after(self) -> int:
+        waves = self._in_flight / self.workers
+        return max(1, math.ceil(waves * self._avg_seconds))
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                QUEUE_REJECTED.labels("password_hash").inc()
+                raise PasswordHasherBusy(self._retry_after())
+            self._in_flight += 1
+        try:
+            with track_queue("password_hash"):
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, self._timed, fn, *args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+password_hasher = PasswordHashExecutor(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
 
 
 def hash_password(password: str) -> str:
@@ -21,6 +97,15 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+async def hash_password_async(password: str) -> str:
+    return await password_hasher.run(pwd_context.hash, password)
+
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Returns (valid, new_hash) — new_hash is set when the stored hash uses an outdated cost"""
+    return await password_hasher.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -28,25 +113,33 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(User).filter(User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    return (await db.execute(select(User).where(User.email == email))).scalars().first()
 
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
+async def get_user_by_username(db: AsyncSession, username: str):
+    return (await db.execute(select(User).where(User.username == username))).scalars().first()
 
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = get_user_by_email(db, email)
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await get_user_by_email(db, email)
+    if not user:
         return None
+
+    valid, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not valid:
+        return None
+
+    # Transparently upgrade hashes when BCRYPT_ROUNDS changes
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 
-def create_user(db: Session, email: str, username: str, password: str):
-    hashed = hash_password(password)
+async def create_user(db: AsyncSession, email: str, username: str, password: str):
+    hashed = await hash_password_async(password)
     user = User(email=email, username=username, hashed_password=hashed)
     db.add(user)
-    db.commit()
-    db.refresh(user)
-    return user
\ No newline at end of file
+    await db.commit()
+    return user
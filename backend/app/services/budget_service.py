@@ -0,0 +1,193 @@
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models.database import Budget, BudgetAlert, CategorySpend, Item, Receipt
+
+# Ordered by severity; matches the statuses get_budget_status reports
+BUDGET_STATES = ("ok", "warning", "over")
+
+
+def budget_state(spent: float, monthly_limit: float) -> str:
+    percentage_used = (spent / monthly_limit * 100) if monthly_limit > 0 else 0
+    return "over" if percentage_used > 100 else "warning" if percentage_used > 80 else "ok"
+
+
+def month_of(when: datetime) -> date:
+    return date(when.year, when.month, 1)
+
+
+def current_period() -> date:
+    return month_of(datetime.utcnow())
+
+
+def _spend_by_category(items: Iterable) -> Dict[str, float]:
+    totals = defaultdict(float)
+    for item in items:
+        # Budgets match on category, so uncategorised items can never count against one
+        if item.category:
+            totals[item.category] += item.price * item.quantity
+    return totals
+
+
+async def _add_spend(db: AsyncSession, user_id: int, period: date, category: str, delta: float) -> float:
+    """Add delta to one counter (update first, insert on first use) and return the new amount"""
+    where = (CategorySpend.user_id == user_id, CategorySpend.period == period, CategorySpend.category == category)
+    result = await db.execute(update(CategorySpend).where(*where).values(amount=CategorySpend.amount + delta))
+    if result.rowcount == 0:
+        try:
+            async with db.begin_nested():
+                db.add(CategorySpend(user_id=user_id, period=period, category=category, amount=delta))
+            return delta
+        except IntegrityError:
+            # Another upload created the row first
+            await db.execute(update(CategorySpend).where(*where).values(amount=CategorySpend.amount + delta))
+    return (await db.execute(select(CategorySpend.amount).where(*where))).scalar_one()
+
+
+async def apply_receipt(db: AsyncSession, receipt: Receipt, items: Iterable, sign: int = 1) -> List[BudgetAlert]:
+    """
+    Fold a committed (sign=1) or deleted (sign=-1) receipt into the monthly category
+    counters, keep current_spent of the affected budgets in step, and record an alert
+    for every budget this receipt pushes into a worse state. Runs in the caller's
+    transaction; cost is O(items in the receipt).
+    """
+    if receipt.purchase_date is None or receipt.user_id is None:
+        return []
+    period = month_of(receipt.purchase_date)
+    deltas = _spend_by_category(items)
+    if not deltas:
+        return []
+
+    budgets = {}
+    if period == current_period():
+        budgets = {
+            budget.category: budget
+            for budget in (await db.execute(
+                select(Budget).where(Budget.user_id == receipt.user_id, Budget.category.in_(list(deltas)))
+            )).scalars()
+        }
+
+    alerts = []
+    for category, delta in deltas.items():
+        spent = await _add_spend(db, receipt.user_id, period, category, sign * delta)
+        budget = budgets.get(category)
+        if budget is None:
+            continue
+        before = budget_state(spent - sign * delta, budget.monthly_limit)
+        budget.current_spent = spent
+        budget.last_reset = datetime.utcnow()
+        alert = _transition_alert(budget, before, period, receipt.id if sign > 0 else None)
+        if alert is not None:
+            db.add(alert)
+            alerts.append(alert)
+    return alerts
+
+
+async def apply_budget_limit(db: AsyncSession, budget: Budget, previous_limit: Optional[float]) -> Optional[BudgetAlert]:
+    """Refresh a created/updated budget from this month's counter; alert if the new limit is already crossed"""
+    period = current_period()
+    spent = (await db.execute(select(CategorySpend.amount).where(
+        CategorySpend.user_id == budget.user_id,
+        CategorySpend.period == period,
+        CategorySpend.category == budget.category
+    ))).scalar() or 0.0
+    before = budget_state(spent, previous_limit) if previous_limit else "ok"
+    budget.current_spent = spent
+    budget.last_reset = datetime.utcnow()
+    alert = _transition_alert(budget, before, period, None)
+    if alert is not None:
+        db.add(alert)
+    return alert
+
+
+def _transition_alert(budget: Budget, before: str, period: date, receipt_id: Optional[int]) -> Optional[BudgetAlert]:
+    after = budget_state(budget.current_spent, budget.monthly_limit)
+    if BUDGET_STATES.index(after) <= BUDGET_STATES.index(before):
+        return None
+    return BudgetAlert(
+        user_id=budget.user_id,
+        budget_id=budget.id,
+        receipt_id=receipt_id,
+        category=budget.category,
+        period=period,
+        status=after,
+        spent=round(budget.current_spent, 2),
+        monthly_limit=budget.monthly_limit
+    )
+
+
+def alert_payload(alert: BudgetAlert) -> Dict:
+    return {
+        "id": alert.id,
+        "budget_id": alert.budget_id,
+        "receipt_id": alert.receipt_id,
+        "category": alert.category,
+        "period": alert.period.isoformat(),
+        "status": alert.status,
+        "spent": alert.spent,
+        "monthly_limit": alert.monthly_limit,
+        "created_at": alert.created_at.isoformat() if alert.created_at else None,
+    }
+
+
+def recent_alerts(db: Session, user_id: int, limit: int = 20) -> List[Dict]:
+    alerts = db.execute(
+        select(BudgetAlert)
+        .where(BudgetAlert.user_id == user_id)
+        .order_by(BudgetAlert.created_at.desc(), BudgetAlert.id.desc())
+        .limit(limit)
+    ).scalars()
+    return [alert_payload(alert) for alert in alerts]
+
+
+def current_spend(db: Session, user_id: int) -> Dict[str, float]:
+    """This month's spend per category, straight from the counters"""
+    rows = db.execute(select(CategorySpend.category, CategorySpend.amount).where(
+        CategorySpend.user_id == user_id,
+        CategorySpend.period == current_period()
+    )).all()
+    return {category: amount for category, amount in rows}
+
+
+def rebuild_category_spend(db: Session, user_id: Optional[int] = None) -> int:
+    """Recompute the counters from receipts and items (first install, or after bulk imports)"""
+    query = select(
+        Receipt.user_id, Receipt.purchase_date, Item.category, Item.price, Item.quantity
+    ).join(Item, Item.receipt_id == Receipt.id).where(
+        Receipt.purchase_date.is_not(None), Receipt.user_id.is_not(None), Item.category.is_not(None)
+    )
+    if user_id is not None:
+        query = query.where(Receipt.user_id == user_id)
+
+    totals = defaultdict(float)
+    for owner, purchased, category, price, quantity in db.execute(query):
+        totals[(owner, month_of(purchased), category)] += price * quantity
+
+    clear = delete(CategorySpend)
+    if user_id is not None:
+        clear = clear.where(CategorySpend.user_id == user_id)
+    db.execute(clear)
+    rows = [
+        {"user_id": owner, "period": period, "category": category, "amount": amount}
+        for (owner, period, category), amount in totals.items()
+    ]
+    for start in range(0, len(rows), 5000):
+        db.execute(insert(CategorySpend), rows[start:start + 5000])
+    db.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal, init_db
+
+    init_db()
+    session = SessionLocal()
+    try:
+        count = rebuild_category_spend(session)
+        print(f"✅ Rebuilt {count} category spend counters")
+    finally:
+        session.close()
@@ -0,0 +1,387 @@
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+# memory:// (default) caches inside this process; sqlite:////path/cache.db is shared by
+# the workers on one host; redis://host:6379/1 is shared by every worker that can reach it
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+# Entry cap for the memory and SQLite backends, shared by model responses and dashboards
+# (Redis is bounded by its own maxmemory policy)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+# Longest a Redis worker trusts its copy of a namespace version if a broadcast is missed
+CACHE_VERSION_TTL_SECONDS = float(os.getenv("CACHE_VERSION_TTL_SECONDS", "5"))
+
+
+def _dump(value: Any) -> str:
+    return json.dumps(value, default=str)
+
+
+class CacheBackend:
+    """
+    Key/value cache for JSON-serialisable values with a per-entry TTL. Every backend
+    stores the JSON encoding, so get() returns the caller's own copy with the same
+    types (dicts, lists, strings, numbers) whichever backend is configured. Every
+    namespace has a version: versioned_key() embeds the current one, so bump()
+    orphans everything cached under the old one in every worker at once (the
+    orphans age out by TTL or eviction).
+
+    The async methods are for the event loop and run blocking I/O in a worker
+    thread; the *_sync ones are for code already in the threadpool.
+    """
+
+    def get_sync(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set_sync(self, key: str, value: Any, ttl_seconds: float):
+        raise NotImplementedError
+
+    def delete_sync(self, key: str):
+        raise NotImplementedError
+
+    def clear_sync(self):
+        raise NotImplementedError
+
+    def version_sync(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    def bump_sync(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    def versioned_key_sync(self, namespace: str, key: str) -> str:
+        return f"{namespace}@{self.version_sync(namespace)}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get_sync, key)
+
+    async def set(self, key: str, value: Any, ttl_seconds: float):
+        await asyncio.to_thread(self.set_sync, key, value, ttl_seconds)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self.delete_sync, key)
+
+    async def clear(self):
+        await asyncio.to_thread(self.clear_sync)
+
+    async def version(self, namespace: str) -> int:
+        return await asyncio.to_thread(self.version_sync, namespace)
+
+    async def bump(self, namespace: str) -> int:
+        return await asyncio.to_thread(self.bump_sync, namespace)
+
+    async def versioned_key(self, namespace: str, key: str) -> str:
+        return f"{namespace}@{await self.version(namespace)}:{key}"
+
+
+class MemoryCache(CacheBackend):
+    """
+    TTL + LRU dict in this process (single-worker deployments). Nothing blocks, so
+    the async methods run inline. Versions are an LRU of the same size as the
+    entries; they come from one process-wide sequence, and a namespace without one
+    reads the highest version evicted so far, so a forgotten namespace can never
+    fall back to a version its old entries were cached under.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._sequence = itertools.count(1)
+        self._version_floor = 0
+        self._lock = threading.Lock()
+
+    def get_sync(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        return json.loads(entry[1])
+
+    def set_sync(self, key: str, value: Any, ttl_seconds: float):
+        encoded = _dump(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_seconds, encoded)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_sync(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear_sync(self):
+        with self._lock:
+            self._entries.clear()
+
+    def version_sync(self, namespace: str) -> int:
+        with self._lock:
+            version = self._versions.get(namespace)
+            if version is None:
+                return self._version_floor
+            self._versions.move_to_end(namespace)
+            return version
+
+    def bump_sync(self, namespace: str) -> int:
+        with self._lock:
+            version = next(self._sequence)
+            self._versions[namespace] = version
+            self._versions.move_to_end(namespace)
+            while len(self._versions) > self.max_entries:
+                _, evicted = self._versions.popitem(last=False)
+                self._version_floor = max(self._version_floor, evicted)
+            return version
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self.get_sync(key)
+
+    async def set(self, key: str, value: Any, ttl_seconds: float):
+        self.set_sync(key, value, ttl_seconds)
+
+    async def delete(self, key: str):
+        self.delete_sync(key)
+
+    async def clear(self):
+        self.clear_sync()
+
+    async def version(self, namespace: str) -> int:
+        return self.version_sync(namespace)
+
+    async def bump(self, namespace: str) -> int:
+        return self.bump_sync(namespace)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache in a SQLite file (WAL) that every worker on the host opens. Versions live
+    in the same file, so a bump is visible to all workers on their next lookup.
+    Every TRIM_EVERY writes, expired entries are removed and, over max_entries, the
+    ones nearest expiry (the oldest written) go first.
+    """
+
+    TRIM_EVERY = 100
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_cache_entries_expires ON cache_entries (expires_at)",
+        "CREATE TABLE IF NOT EXISTS cache_versions (namespace TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+    )
+
+    def __init__(self, path: str, max_entries: int = CACHE_MAX_ENTRIES, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        # Every thread that writes shares the trim counter
+        self._writes = itertools.count(1)
+        self._writes_lock = threading.Lock()
+        conn = self._conn()
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads; one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_sync(self, key: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT value FROM cache_entries WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_sync(self, key: str, value: Any, ttl_seconds: float):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, _dump(value), time.time() + ttl_seconds),
+        )
+        with self._writes_lock:
+            writes = next(self._writes)
+        if writes % self.TRIM_EVERY == 0:
+            self._trim(conn)
+
+    def _trim(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (time.time(),))
+        excess = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE key IN "
+                "(SELECT key FROM cache_entries ORDER BY expires_at LIMIT ?)", (excess,)
+            )
+
+    def delete_sync(self, key: str):
+        self._conn().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def clear_sync(self):
+        self._conn().execute("DELETE FROM cache_entries")
+
+    def version_sync(self, namespace: str) -> int:
+        row = self._conn().execute(
+            "SELECT version FROM cache_versions WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump_sync(self, namespace: str) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO cache_versions (namespace, version) VALUES (?, 1) "
+                "ON CONFLICT (namespace) DO UPDATE SET version = version + 1", (namespace,)
+            )
+            version = conn.execute(
+                "SELECT version FROM cache_versions WHERE namespace = ?", (namespace,)
+            ).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return version
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache in Redis (or anything speaking its protocol). Versions are Redis counters;
+    bump() also publishes the new version, and every worker's listener applies it to
+    a local copy, so lookups don't need a round trip for the version. A copy older
+    than CACHE_VERSION_TTL_SECONDS is re-read, which bounds staleness if a message is lost.
+    """
+
+    PREFIX = "shopsense:cache:"
+    VERSION_PREFIX = "shopsense:cache-version:"
+    CHANNEL = "shopsense:cache-versions"
+
+    def __init__(self, url: Optional[str] = None, client=None,
+                 version_ttl_seconds: float = CACHE_VERSION_TTL_SECONDS, max_versions: int = CACHE_MAX_ENTRIES):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.version_ttl_seconds = version_ttl_seconds
+        self.max_versions = max_versions
+        self._versions: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.CHANNEL: self._on_version})
+        self._listener = self._pubsub.run_in_thread(
+            sleep_time=1.0, daemon=True, exception_handler=self._on_listener_error
+        )
+
+    @staticmethod
+    def _on_listener_error(error, pubsub, thread):
+        # Keep listening (redis-py reconnects and resubscribes); meanwhile versions
+        # are re-read once the local copies age out
+        print(f"⚠️ Cache version listener: {error}")
+        time.sleep(1.0)
+
+    def _on_version(self, message):
+        data = message["data"]
+        namespace, _, version = (data.decode() if isinstance(data, bytes) else data).rpartition("\t")
+        self._remember(namespace, int(version))
+
+    def _remember(self, namespace: str, version: int):
+        with self._lock:
+            # Broadcasts can arrive out of order; versions only move forward
+            known = self._versions.get(namespace)
+            if known is None or version >= known[0]:
+                self._versions[namespace] = (version, time.monotonic())
+                self._versions.move_to_end(namespace)
+                # Dropping a copy only costs a re-read from Redis
+                while len(self._versions) > self.max_versions:
+                    self._versions.popitem(last=False)
+
+    def get_sync(self, key: str) -> Optional[Any]:
+        value = self.client.get(self.PREFIX + key)
+        return json.loads(value) if value is not None else None
+
+    def set_sync(self, key: str, value: Any, ttl_seconds: float):
+        self.client.set(self.PREFIX + key, _dump(value), px=max(1, int(ttl_seconds * 1000)))
+
+    def delete_sync(self, key: str):
+        self.client.delete(self.PREFIX + key)
+
+    def clear_sync(self):
+        # Only this app's keys; the database may be shared with other data
+        batch = []
+        for key in self.client.scan_iter(match=self.PREFIX + "*", count=500):
+            batch.append(key)
+            if len(batch) == 500:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+    def _fresh_version(self, namespace: str) -> Optional[int]:
+        with self._lock:
+            known = self._versions.get(namespace)
+        if known is not None and time.monotonic() - known[1] < self.version_ttl_seconds:
+            return known[0]
+        return None
+
+    def version_sync(self, namespace: str) -> int:
+        version = self._fresh_version(namespace)
+        if version is None:
+            version = int(self.client.get(self.VERSION_PREFIX + namespace) or 0)
+            self._remember(namespace, version)
+        return version
+
+    async def version(self, namespace: str) -> int:
+        # Usually answered from the local copy, without a thread hop
+        version = self._fresh_version(namespace)
+        return version if version is not None else await asyncio.to_thread(self.version_sync, namespace)
+
+    def bump_sync(self, namespace: str) -> int:
+        version = self.client.incr(self.VERSION_PREFIX + namespace)
+        self._remember(namespace, version)
+        self.client.publish(self.CHANNEL, f"{namespace}\t{version}")
+        return version
+
+    def close(self):
+        # The listener closes its pubsub connection on the way out
+        self._listener.stop()
+        self._listener.join(timeout=2.0)
+
+
+def build_cache_backend(url: str = CACHE_URL, max_entries: int = CACHE_MAX_ENTRIES) -> CacheBackend:
+    if url.startswith("sqlite:///"):
+        path = url[len("sqlite:///"):]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        print(f"✅ Cache backend: SQLite ({path})")
+        return SQLiteCache(path, max_entries)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            backend = RedisCache(url, max_versions=max_entries)
+            print("✅ Cache backend: Redis")
+            return backend
+        except ImportError:
+            print("⚠️ CACHE_URL is redis:// but the redis package is not installed; using in-process cache")
+    return MemoryCache(max_entries)
+
+
+cache_backend = build_cache_backend()
+
+
+def user_namespace(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+async def invalidate_user(user_id: Optional[int]):
+    """Drop every cached aggregate for a user, in all workers; call after committing a change to their data"""
+    if user_id is not None:
+        await cache_backend.bump(user_namespace(user_id))
@@ -0,0 +1,307 @@
+import asyncio
+import io
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+from PIL import Image
+from PyPDF2 import PdfReader
+from app.services.ai_service import ai_service
+from app.tracing import span
+
+# Image-only pages sent to the model at once (each is a full vision call)
+PDF_EXTRACT_CONCURRENCY = int(os.getenv("PDF_EXTRACT_CONCURRENCY", "3"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "50"))
+# A page with fewer non-blank characters than this is treated as a scan
+MIN_TEXT_CHARS = 20
+
+PRICE_RE = re.compile(r"(-?)\$?\s?(\d{1,3}(?:,\d{3})*|\d+)[.,](\d{2})\s*[A-Z]?$")
+# The whole label, so "Total Savings" or "Total Tax" doesn't close a receipt
+TOTAL_RE = re.compile(r"^(grand\s+total|total(\s+due|\s+amount)?|amount\s+due|balance\s+due)$", re.IGNORECASE)
+NON_ITEM_RE = re.compile(
+    r"\b(sub\s?-?total|tax|vat|change|cash|tender|visa|mastercard|amex|debit|credit|card|"
+    r"payment|paid|tip|gratuity|savings|balance|rounding)\b",
+    re.IGNORECASE,
+)
+FOOTER_RE = re.compile(
+    r"\b(thank|thanks|visit|again|return|policy|survey|www\.|approved|auth|customer copy|"
+    r"member|points|you saved|items sold|signature)", re.IGNORECASE,
+)
+QUANTITY_RE = re.compile(r"^(\d{1,3})\s*(?:x|@)\s+", re.IGNORECASE)
+# "Apples 3 @ 0.99" - the unit price is recomputed from the line total
+UNIT_PRICE_RE = re.compile(r"\s+\d{1,3}\s*@\s*\$?\d+[.,]\d{2}$")
+DATE_PATTERNS = [
+    (re.compile(r"\b(\d{4}-\d{2}-\d{2})\b"), ("%Y-%m-%d",)),
+    (re.compile(r"\b(\d{1,2}/\d{1,2}/\d{4})\b"), ("%m/%d/%Y", "%d/%m/%Y")),
+    (re.compile(r"\b(\d{1,2}/\d{1,2}/\d{2})\b"), ("%m/%d/%y", "%d/%m/%y")),
+    (re.compile(r"\b(\d{1,2}\.\d{1,2}\.\d{4})\b"), ("%d.%m.%Y",)),
+    (re.compile(r"\b([A-Z][a-z]{2,8} \d{1,2},? \d{4})\b"), ("%b %d, %Y", "%b %d %Y", "%B %d, %Y", "%B %d %Y")),
+]
+
+
+class DocumentError(Exception):
+    """The PDF can't be ingested (unreadable, encrypted or too long)"""
+
+
+@dataclass
+class PdfPage:
+    number: int
+    text: str
+    image: Optional[bytes] = None
+    image_ext: str = ".png"
+
+    @property
+    def has_text(self) -> bool:
+        return len(re.sub(r"\s", "", self.text)) >= MIN_TEXT_CHARS
+
+
+# Encoded image streams that are already a standalone image file
+PASSTHROUGH_FILTERS = {"/DCTDecode": ".jpg", "/JPXDecode": ".jp2"}
+RAW_COLOR_MODES = {"/DeviceRGB": "RGB", "/DeviceGray": "L", "/DeviceCMYK": "CMYK"}
+
+
+def _image_xobjects(resources, depth: int = 0):
+    """Image XObjects on a page, including ones wrapped in form XObjects"""
+    xobjects = resources.get("/XObject") if resources else None
+    if not xobjects:
+        return
+    xobjects = xobjects.get_object()
+    for name in xobjects:
+        obj = xobjects[name].get_object()
+        if obj.get("/Subtype") == "/Image":
+            yield obj
+        elif obj.get("/Subtype") == "/Form" and depth < 3:
+            yield from _image_xobjects(obj.get("/Resources"), depth + 1)
+
+
+def _xobject_to_file(obj) -> Optional[tuple]:
+    """(bytes, extension) for an image XObject, or None if its encoding isn't supported"""
+    filters = obj.get("/Filter") or []
+    if not isinstance(filters, list):
+        filters = [filters]
+    last = filters[-1] if filters else None
+    if last in PASSTHROUGH_FILTERS:
+        # get_data() strips the transport filters (ASCII85, Flate) and leaves the JPEG
+        return obj.get_data(), PASSTHROUGH_FILTERS[last]
+
+    color_space = obj.get("/ColorSpace")
+    mode = RAW_COLOR_MODES.get(color_space)
+    bits = obj.get("/BitsPerComponent", 8)
+    if mode is None or bits not in (1, 8):
+        return None
+    size = (int(obj["/Width"]), int(obj["/Height"]))
+    image = Image.frombytes("1" if bits == 1 else mode, size, obj.get_data())
+    out = io.BytesIO()
+    image.convert("RGB" if mode == "CMYK" else image.mode).save(out, "PNG")
+    return out.getvalue(), ".png"
+
+
+def read_pdf_pages(path: str, max_pages: int = PDF_MAX_PAGES) -> List[PdfPage]:
+    """
+    Text layer of every page, plus the largest embedded image of pages without one.
+    Scanned PDFs hold each page as a single embedded image, so that image is the
+    page raster and no PDF renderer is needed. CPU-bound, run off the event loop.
+    """
+    try:
+        reader = PdfReader(path)
+        if reader.is_encrypted and not reader.decrypt(""):
+            raise DocumentError("PDF is password protected")
+        if len(reader.pages) > max_pages:
+            raise DocumentError(f"PDF has more than {max_pages} pages")
+
+        pages = []
+        for number, page in enumerate(reader.pages, start=1):
+            result = PdfPage(number=number, text=page.extract_text() or "")
+            if not result.has_text:
+                images = [f for f in map(_xobject_to_file, _image_xobjects(page.get("/Resources"))) if f]
+                if images:
+                    result.image, result.image_ext = max(images, key=lambda f: len(f[0]))
+            pages.append(result)
+        return pages
+    except DocumentError:
+        raise
+    except Exception as e:
+        raise DocumentError(f"Could not read PDF: {e}")
+
+
+def _parse_price(line: str) -> Optional[float]:
+    match = PRICE_RE.search(line)
+    if not match:
+        return None
+    sign, whole, cents = match.groups()
+    value = float(f"{whole.replace(',', '')}.{cents}")
+    return -value if sign else value
+
+
+def _label(line: str) -> str:
+    return PRICE_RE.sub("", line).strip(" .:-\t")
+
+
+def _parse_date(text: str) -> Optional[str]:
+    for pattern, formats in DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            for fmt in formats:
+                try:
+                    return datetime.strptime(match.group(1), fmt).date().isoformat()
+                except ValueError:
+                    continue
+    return None
+
+
+def parse_receipt_lines(lines: List[str]) -> Dict:
+    """
+    One receipt from its text lines, in the same shape the model extraction returns.
+    Items have no category (None); the caller fills it in from the product catalog.
+    """
+    store_name = None
+    items = []
+    total = None
+    for line in lines:
+        price = _parse_price(line)
+        if price is None:
+            # The store name heads the receipt; never a payment or thank-you line
+            if (store_name is None and not items and re.search(r"[A-Za-z]{2}", line)
+                    and not _parse_date(line) and not _is_footer_line(line)):
+                store_name = line
+            continue
+
+        label = _label(line)
+        if TOTAL_RE.match(label):
+            total = price
+            continue
+        if not label or NON_ITEM_RE.search(label):
+            continue
+
+        # Receipts print line totals; items store the unit price
+        quantity = 1
+        quantity_match = QUANTITY_RE.match(label)
+        unit_match = UNIT_PRICE_RE.search(label)
+        if quantity_match:
+            quantity = int(quantity_match.group(1))
+            label = label[quantity_match.end():]
+        elif unit_match:
+            quantity = int(re.match(r"\s*(\d+)", unit_match.group(0)).group(1))
+            label = label[:unit_match.start()]
+        if not label:
+            continue
+        items.append({
+            "name": label,
+            "price": round(price / quantity, 2) if quantity else price,
+            "quantity": quantity or 1,
+            "category": None,
+        })
+
+    text = "\n".join(lines)
+    return {
+        "store_name": store_name,
+        "purchase_date": _parse_date(text),
+        "items": items,
+        "total_amount": total if total is not None else round(sum(i["price"] * i["quantity"] for i in items), 2),
+        "raw_text": text,
+    }
+
+
+def _is_total_line(line: str) -> bool:
+    return _parse_price(line) is not None and bool(TOTAL_RE.match(_label(line)))
+
+
+def _is_footer_line(line: str) -> bool:
+    if _parse_price(line) is not None:
+        return bool(NON_ITEM_RE.search(_label(line)))
+    return bool(FOOTER_RE.search(line) or NON_ITEM_RE.search(line))
+
+
+def split_text_receipts(pages: List[PdfPage]) -> List[Dict]:
+    """
+    Parse consecutive text pages into receipts. A total line closes a receipt and
+    the payment/thank-you lines after it on the same page stay with it; the first
+    other line starts the next receipt. A receipt with no total yet continues onto
+    the next page.
+    """
+    receipts = []
+    current: List[str] = []
+    for page in pages:
+        lines = [re.sub(r"\s+", " ", line).strip() for line in page.text.splitlines()]
+        in_footer = False
+        for line in filter(None, lines):
+            if in_footer and _is_footer_line(line):
+                receipts[-1].append(line)
+                continue
+            in_footer = False
+            current.append(line)
+            if _is_total_line(line):
+                receipts.append(current)
+                current = []
+                in_footer = True
+    if current:
+        receipts.append(current)
+
+    parsed = [parse_receipt_lines(lines) for lines in receipts]
+    return [r for r in parsed if r["items"] or r["total_amount"]]
+
+
+def _write_file(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _remove_file(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+async def _extract_scanned_page(page: PdfPage, tmp_dir: str, semaphore: asyncio.Semaphore,
+                                user_id: Optional[int]) -> Optional[Dict]:
+    path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}{page.image_ext}")
+    async with semaphore:
+        try:
+            await asyncio.to_thread(_write_file, path, page.image)
+            result = await ai_service.extract_receipt_data(path, user_id=user_id)
+        finally:
+            await asyncio.to_thread(_remove_file, path)
+    # A page the model couldn't read comes back as the empty fallback
+    if not result.get("items") and not result.get("total_amount"):
+        return None
+    return result
+
+
+async def extract_pdf_receipts(path: str, tmp_dir: str, user_id: Optional[int] = None,
+                               concurrency: int = PDF_EXTRACT_CONCURRENCY) -> List[Dict]:
+    """
+    Every receipt in a PDF, in page order. Pages with a text layer are parsed
+    directly (no model call); scanned pages go to the model, `concurrency` at a time.
+    """
+    with span("pdf_read"):
+        pages = await asyncio.to_thread(read_pdf_pages, path)
+
+    # Runs of text pages (lists) are parsed together so a receipt can span pages;
+    # each scanned page (a PdfPage) is its own model call
+    groups: List = []
+    for page in pages:
+        if page.has_text:
+            if groups and isinstance(groups[-1], list):
+                groups[-1].append(page)
+            else:
+                groups.append([page])
+        elif page.image is not None:
+            groups.append(page)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    with span("pdf_extract"):
+        scanned = await asyncio.gather(*(
+            _extract_scanned_page(group, tmp_dir, semaphore, user_id)
+            for group in groups if isinstance(group, PdfPage)
+        ))
+
+    receipts = []
+    scanned_results = iter(scanned)
+    for group in groups:
+        if isinstance(group, PdfPage):
+            result = next(scanned_results)
+            if result is not None:
+                receipts.append(result)
+        else:
+            receipts.extend(split_text_receipts(group))
+    return receipts
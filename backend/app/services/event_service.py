@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncContextManager, Dict, Optional, Set
+from app.database import AsyncSessionLocal
+from app.metrics import EVENT_SUBSCRIBERS, EVENTS_DROPPED, EVENTS_PUBLISHED
+from app.services.analytics_service import analytics_service
+
+# memory:// (default) keeps events inside this process; redis://host:6379/0 fans out across workers
+EVENT_BROKER_URL = os.getenv("EVENT_BROKER_URL", "memory://")
+# Events buffered per open stream before the oldest are dropped
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+
+
+class Subscription:
+    """One open event stream; next() returns the next event or None after `timeout` seconds"""
+
+    async def next(self, timeout: float) -> Optional[Dict]:
+        raise NotImplementedError
+
+
+class EventBroker:
+    """
+    Per-user publish/subscribe. Events are {"event": name, "data": payload}; a
+    subscriber only sees events published for its own user id.
+    """
+
+    async def publish(self, user_id: int, event: str, data: Dict):
+        raise NotImplementedError
+
+    async def has_subscribers(self, user_id: int) -> bool:
+        raise NotImplementedError
+
+    def subscribe(self, user_id: int) -> AsyncContextManager[Subscription]:
+        raise NotImplementedError
+
+
+class _QueueSubscription(Subscription):
+    def __init__(self, max_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+
+    def put(self, message: Dict):
+        if self.queue.full():
+            # A stalled client loses its oldest events rather than growing without bound;
+            # the next event carries fresh aggregates anyway
+            self.queue.get_nowait()
+            EVENTS_DROPPED.inc()
+        self.queue.put_nowait(message)
+
+    async def next(self, timeout: float) -> Optional[Dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessBroker(EventBroker):
+    """Events reach streams held by this worker only (single-process deployments)"""
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[_QueueSubscription]] = {}
+
+    async def publish(self, user_id: int, event: str, data: Dict):
+        EVENTS_PUBLISHED.labels(event).inc()
+        for subscription in list(self._subscribers.get(user_id, ())):
+            subscription.put({"event": event, "data": data})
+
+    async def has_subscribers(self, user_id: int) -> bool:
+        return bool(self._subscribers.get(user_id))
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int):
+        subscription = _QueueSubscription(self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        EVENT_SUBSCRIBERS.inc()
+        try:
+            yield subscription
+        finally:
+            EVENT_SUBSCRIBERS.dec()
+            subscribers = self._subscribers.get(user_id)
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[user_id]
+
+
+class _PubSubSubscription(Subscription):
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def next(self, timeout: float) -> Optional[Dict]:
+        message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        return json.loads(message["data"]) if message else None
+
+
+class RedisBroker(EventBroker):
+    """Events travel over Redis pub/sub (one channel per user), so any worker can publish"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+
+    @staticmethod
+    def channel(user_id: int) -> str:
+        return f"shopsense:events:{user_id}"
+
+    async def publish(self, user_id: int, event: str, data: Dict):
+        EVENTS_PUBLISHED.labels(event).inc()
+        await self.client.publish(self.channel(user_id), json.dumps({"event": event, "data": data}, default=str))
+
+    async def has_subscribers(self, user_id: int) -> bool:
+        counts = await self.client.pubsub_numsub(self.channel(user_id))
+        return any(count for _, count in counts)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int):
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(self.channel(user_id))
+        EVENT_SUBSCRIBERS.inc()
+        try:
+            yield _PubSubSubscription(pubsub)
+        finally:
+            EVENT_SUBSCRIBERS.dec()
+            await pubsub.unsubscribe(self.channel(user_id))
+            await pubsub.close()
+
+
+def build_event_broker(url: str = EVENT_BROKER_URL) -> EventBroker:
+    if url.startswith(("redis://", "rediss://")):
+        try:
+            broker = RedisBroker(url)
+            print("✅ Event broker: Redis pub/sub")
+            return broker
+        except ImportError:
+            print("⚠️ EVENT_BROKER_URL is redis:// but the redis package is not installed; using in-process events")
+    return InProcessBroker()
+
+
+event_broker = build_event_broker()
+
+
+async def publish_update(user_id: Optional[int], event: str, data: Dict,
+                         spending: bool = False, budgets: bool = False):
+    """
+    Publish an event with the aggregates it invalidated, so open dashboards can
+    redraw without re-fetching. Nothing is computed when the user has no open stream.
+    Meant to run as a background task, after the response has been sent.
+    """
+    if user_id is None or not await event_broker.has_subscribers(user_id):
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            sections = (("spending", "categories") if spending else ()) + (("budgets",) if budgets else ())
+            if sections:
+                # Also warms the cache for the dashboard's own re-fetch
+                data.update(await analytics_service.get_dashboard_cached(db, user_id, sections))
+        await event_broker.publish(user_id, event, data)
+    except Exception as e:
+        print(f"⚠️ Could not publish {event} for user {user_id}: {e}")
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import uuid
+from typing import Dict, Tuple
+from urllib.parse import quote
+from PIL import Image, ImageOps
+from app.metrics import track_queue
+
+# variant -> (longest edge in px, WebP quality)
+IMAGE_VARIANTS: Dict[str, Tuple[int, int]] = {
+    "thumb": (256, 70),
+    "preview": (1024, 80),
+}
+
+MEDIA_URL_PREFIX = "/media"
+
+# Stored originals that aren't images get no thumbnail/preview
+DOCUMENT_EXTENSIONS = (".pdf",)
+
+
+def derivative_key(key: str, variant: str) -> str:
+    """Derivatives sit next to the original: receipts/ab/cd/<hash>.thumb.webp"""
+    root, _ = os.path.splitext(key)
+    return f"{root}.{variant}.webp"
+
+
+def has_derivatives(key: str) -> bool:
+    return not key.lower().endswith(DOCUMENT_EXTENSIONS)
+
+
+def media_url(key: str, variant: str = "original") -> str:
+    # Legacy keys are original filenames and may hold spaces, '#' or '?'
+    return f"{MEDIA_URL_PREFIX}/{variant}/{quote(key)}"
+
+
+def probe_image(path: str) -> Dict:
+    """Cheap header read (no full decode) to check an upload is an image before extraction"""
+    try:
+        with Image.open(path) as image:
+            return {"decodable": True, "width": image.width, "height": image.height, "format": image.format}
+    except Exception:
+        return {"decodable": False}
+
+
+def render_derivative(source_path: str, target_path: str, variant: str):
+    """Downscale an image to a WebP derivative (CPU-bound, run off the event loop)"""
+    max_edge, quality = IMAGE_VARIANTS[variant]
+    with Image.open(source_path) as image:
+        # Phone photos carry rotation in EXIF; bake it in before resizing
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+        tmp_path = f"{target_path}.{uuid.uuid4().hex}.part"
+        image.save(tmp_path, "WEBP", quality=quality, method=4)
+        os.replace(tmp_path, target_path)
+
+
+async def ensure_derivative(source_path: str, target_path: str, variant: str):
+    if os.path.exists(target_path):
+        return
+    loop = asyncio.get_running_loop()
+    with track_queue("image_derivatives"):
+        await loop.run_in_executor(None, render_derivative, source_path, target_path, variant)
+
+
+async def generate_derivatives(storage, key: str):
+    """Render every variant for a stored original; failures just mean on-demand rendering later"""
+    if not has_derivatives(key):
+        return
+    source_path = storage.local_path(key)
+    for variant in IMAGE_VARIANTS:
+        try:
+            await ensure_derivative(source_path, storage.local_path(derivative_key(key, variant)), variant)
+        except Exception as e:
+            print(f"⚠️ Could not render {variant} for {key}: {e}")
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import random
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.metrics import INSIGHTS_COMPACTED
+from app.models.database import SpendingInsight
+from app.services.budget_service import month_of
+from app.services.product_service import normalize_item_name
+
+# Insights not refreshed for this many days are pruned (0 keeps them forever)
+INSIGHT_RETENTION_DAYS = int(os.getenv("INSIGHT_RETENTION_DAYS", "180"))
+# Rows handled per transaction, so compaction never holds the write lock for long
+INSIGHT_COMPACTION_BATCH = int(os.getenv("INSIGHT_COMPACTION_BATCH", "500"))
+# Seconds between background compaction runs in each worker (0 disables)
+INSIGHT_COMPACTION_INTERVAL_SECONDS = int(os.getenv("INSIGHT_COMPACTION_INTERVAL_SECONDS", "3600"))
+
+
+def insight_subject(insight_type: str, title: str, category: Optional[str] = None) -> str:
+    """What an insight is about: the category of a trend, what follows "Title:" for a detected anomaly, otherwise its title"""
+    if insight_type == "trend" and category:
+        return category.strip().lower()
+    if insight_type in ("impulse", "store", "spike") and ":" in title:
+        title = title.split(":", 1)[1]
+    return normalize_item_name(title) or title.strip().lower()
+
+
+def _key(user_id: int, insight_type: str, subject: str, period: date):
+    return (SpendingInsight.user_id == user_id, SpendingInsight.insight_type == insight_type,
+            SpendingInsight.subject == subject, SpendingInsight.period == period)
+
+
+async def upsert_insight(db: AsyncSession, user_id: int, insight_type: str, title: str, description: str,
+                         category: Optional[str] = None, amount: Optional[float] = None,
+                         score: Optional[float] = None) -> SpendingInsight:
+    """
+    Write an insight, replacing the user's insight of the same type about the same
+    subject this month (caller commits). A refreshed insight moves to the top of the feed.
+    """
+    now = datetime.utcnow()
+    subject = insight_subject(insight_type, title, category)
+    key = _key(user_id, insight_type, subject, month_of(now))
+    values = {"title": title, "description": description, "category": category, "amount": amount,
+              "score": score, "insight_date": now}
+
+    insight = (await db.execute(select(SpendingInsight).where(*key))).scalar_one_or_none()
+    if insight is None:
+        try:
+            async with db.begin_nested():
+                insight = SpendingInsight(
+                    user_id=user_id, insight_type=insight_type, subject=subject, period=month_of(now), **values
+                )
+                db.add(insight)
+            return insight
+        except IntegrityError:
+            # A concurrent generate inserted it first
+            insight = (await db.execute(select(SpendingInsight).where(*key))).scalar_one()
+
+    for name, value in values.items():
+        setattr(insight, name, value)
+    return insight
+
+
+def _merge_unkeyed(db: Session, batch_size: int) -> int:
+    """
+    Key the rows written before dedup, newest first. A row whose key is already
+    taken (by an upserted row or a newer old one) is a duplicate and is deleted.
+    """
+    merged = 0
+    last_id = None
+    while True:
+        query = select(SpendingInsight).where(SpendingInsight.subject.is_(None))
+        if last_id is not None:
+            query = query.where(SpendingInsight.id < last_id)
+        batch = db.execute(query.order_by(SpendingInsight.id.desc()).limit(batch_size)).scalars().all()
+        if not batch:
+            break
+
+        # Keys given out in this batch aren't flushed yet, so track them here too
+        assigned = set()
+        for insight in batch:
+            subject = insight_subject(insight.insight_type, insight.title, insight.category)
+            period = month_of(insight.insight_date or datetime.utcnow())
+            key = (insight.user_id, insight.insight_type, subject, period)
+            if key in assigned or db.execute(select(SpendingInsight.id).where(*_key(*key))).first():
+                db.delete(insight)
+                merged += 1
+            else:
+                insight.subject, insight.period = subject, period
+                assigned.add(key)
+        last_id = batch[-1].id
+        db.commit()
+
+    return merged
+
+
+def _prune_expired(db: Session, cutoff: datetime, batch_size: int) -> int:
+    pruned = 0
+    while True:
+        ids = db.execute(
+            select(SpendingInsight.id).where(SpendingInsight.insight_date < cutoff).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.execute(delete(SpendingInsight).where(SpendingInsight.id.in_(ids)))
+        db.commit()
+        pruned += len(ids)
+    return pruned
+
+
+def compact_insights(db: Session, retention_days: int = INSIGHT_RETENTION_DAYS,
+                     batch_size: int = INSIGHT_COMPACTION_BATCH) -> Dict[str, int]:
+    """Collapse duplicate insights and prune expired ones, one short transaction per batch"""
+    merged = _merge_unkeyed(db, batch_size)
+    pruned = 0
+    if retention_days > 0:
+        pruned = _prune_expired(db, datetime.utcnow() - timedelta(days=retention_days), batch_size)
+
+    INSIGHTS_COMPACTED.labels("merged").inc(merged)
+    INSIGHTS_COMPACTED.labels("pruned").inc(pruned)
+    return {"merged": merged, "pruned": pruned}
+
+
+def _compact_once() -> Dict[str, int]:
+    from app.database import SessionLocal
+
+    with SessionLocal() as session:
+        return compact_insights(session)
+
+
+async def run_insight_compaction(interval: int = INSIGHT_COMPACTION_INTERVAL_SECONDS):
+    """Compact every `interval` seconds for the life of the worker, off the event loop"""
+    # Spread workers started together so they don't all compact at once
+    await asyncio.sleep(random.uniform(0, min(interval, 60)))
+    while True:
+        try:
+            result = await asyncio.to_thread(_compact_once)
+            if result["merged"] or result["pruned"]:
+                print(f"🧹 Insight compaction: merged {result['merged']}, pruned {result['pruned']}")
+        except Exception as e:
+            # e.g. another worker compacting the same rows; the next run picks up what's left
+            print(f"⚠️ Insight compaction failed: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    from app.database import init_db
+
+    init_db()
+    result = _compact_once()
+    print(f"✅ Merged {result['merged']} duplicate insights, pruned {result['pruned']} expired")
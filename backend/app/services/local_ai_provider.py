@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from statistics import mean
+from typing import AsyncIterator, Dict, List, Optional
+
+# Used for receipts without a sidecar: store -> [(item, base price, category)]
+LOCAL_CATALOG = {
+    "FreshMart": [("Organic Bananas", 1.99, "groceries"), ("Whole Milk", 3.49, "groceries"),
+                  ("Sourdough Bread", 4.99, "groceries"), ("Large Eggs", 3.99, "groceries"),
+                  ("Chicken Breast", 9.99, "groceries"), ("Dish Soap", 3.99, "home")],
+    "Target": [("T-Shirt", 14.99, "clothing"), ("Paper Towels", 12.99, "home"),
+               ("AA Batteries", 9.99, "electronics"), ("Greek Yogurt", 5.49, "groceries")],
+    "CVS": [("Ibuprofen", 8.99, "health"), ("Vitamin D", 10.99, "health"), ("Toothpaste", 4.49, "health")],
+    "Shell": [("Regular Gasoline", 45.00, "transportation"), ("Car Wash", 12.00, "transportation")],
+    "Starbucks": [("Latte", 5.25, "dining"), ("Croissant", 3.45, "dining"), ("Cold Brew", 4.75, "dining")],
+    "AMC Theatres": [("Movie Ticket", 15.99, "entertainment"), ("Popcorn", 8.49, "entertainment")],
+}
+
+# Generated receipts are dated in the 60 days before this, so the same image always
+# gives the same receipt; LOCAL_AI_DATE_ANCHOR moves it (an ISO date, or "today")
+DEFAULT_DATE_ANCHOR = date(2025, 6, 30)
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+class LocalProviderError(Exception):
+    """Injected failure, standing in for a provider timeout or 5xx"""
+
+
+def _digest(payload) -> str:
+    if isinstance(payload, bytes):
+        return hashlib.sha256(payload).hexdigest()
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def receipt_text(data: Dict) -> str:
+    """
+    Plain text of an extracted receipt (store, date, one line per item, total), stored
+    and indexed in place of a model's JSON reply so searches don't match its field names
+    """
+    lines = [data.get("store_name"), data.get("purchase_date")]
+    for item in data.get("items") or []:
+        lines.append(" ".join(str(item[k]) for k in ("name", "quantity", "price") if item.get(k) is not None))
+    lines.append(data.get("total_amount"))
+    return "\n".join(str(line) for line in lines if line not in (None, ""))
+
+
+class LocalAIProvider:
+    """
+    Offline stand-in for Gemini/OpenAI (AI_PROVIDER=local).
+
+    Responses are derived from the input only: receipt extraction reads a sidecar
+    <sha256 of image>.json from LOCAL_AI_FIXTURES_DIR when one exists and otherwise
+    generates a receipt seeded by the image hash; the analysis calls summarise the
+    data they are given. Latency and failures are injected so the rest of the
+    pipeline can be load-tested without quota or network noise.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 fixtures_dir: Optional[str] = None, seed: Optional[int] = None,
+                 date_anchor: Optional[date] = DEFAULT_DATE_ANCHOR):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.fixtures_dir = fixtures_dir
+        # None dates receipts relative to today instead
+        self.date_anchor = date_anchor
+        # Only latency and injected errors use this; responses never do
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def from_env(cls) -> "LocalAIProvider":
+        seed = os.getenv("LOCAL_AI_SEED")
+        anchor = os.getenv("LOCAL_AI_DATE_ANCHOR", "").strip()
+        return cls(
+            latency_ms=float(os.getenv("LOCAL_AI_LATENCY_MS", "0")),
+            jitter_ms=float(os.getenv("LOCAL_AI_LATENCY_JITTER_MS", "0")),
+            error_rate=float(os.getenv("LOCAL_AI_ERROR_RATE", "0")),
+            fixtures_dir=os.getenv("LOCAL_AI_FIXTURES_DIR") or None,
+            seed=int(seed) if seed else None,
+            date_anchor=None if anchor == "today" else date.fromisoformat(anchor) if anchor else DEFAULT_DATE_ANCHOR,
+        )
+
+    def _delay_seconds(self) -> float:
+        # Exponential jitter on top of the floor gives a realistic long tail
+        jitter = self._rng.expovariate(1 / self.jitter_ms) if self.jitter_ms > 0 else 0.0
+        return (self.latency_ms + jitter) / 1000
+
+    def _maybe_fail(self, operation: str):
+        if self.error_rate > 0 and self._rng.random() < self.error_rate:
+            raise LocalProviderError(f"injected {operation} failure")
+
+    async def _simulate(self, operation: str):
+        delay = self._delay_seconds()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._maybe_fail(operation)
+
+    def _simulate_sync(self, operation: str):
+        delay = self._delay_seconds()
+        if delay > 0:
+            time.sleep(delay)
+        self._maybe_fail(operation)
+
+    def _sidecar_text(self, digest: str) -> Optional[str]:
+        if self.fixtures_dir:
+            sidecar = os.path.join(self.fixtures_dir, f"{digest}.json")
+            if os.path.isfile(sidecar):
+                with open(sidecar) as f:
+                    return f.read()
+        return None
+
+    async def extract_receipt(self, image_path: str) -> Dict:
+        await self._simulate("extract")
+        with open(image_path, "rb") as f:
+            digest = _digest(f.read())
+
+        text = self._sidecar_text(digest)
+        if text is not None:
+            result = json.loads(text)
+            result.setdefault("raw_text", receipt_text(result))
+            return result
+        return self._generate_receipt(digest)
+
+    async def stream_receipt(self, image_path: str, chunk_size: int = 48) -> AsyncIterator[str]:
+        """extract_receipt as a token stream: the JSON text in small chunks, paced like a model"""
+        delay = self._delay_seconds()
+        # Roughly a third of the latency before the first token, the rest spread over the output
+        await asyncio.sleep(delay * 0.3)
+        self._maybe_fail("extract")
+        with open(image_path, "rb") as f:
+            digest = _digest(f.read())
+        # Same source as extract_receipt, so both paths return the same receipt
+        text = self._sidecar_text(digest)
+        if text is None:
+            text = json.dumps(self._generate_receipt(digest), indent=2)
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        for chunk in chunks:
+            await asyncio.sleep(delay * 0.7 / len(chunks))
+            yield chunk
+
+    def _generate_receipt(self, digest: str) -> Dict:
+        rng = random.Random(int(digest[:16], 16))
+        store = rng.choice(sorted(LOCAL_CATALOG))
+        purchase_date = (self.date_anchor or date.today()) - timedelta(days=rng.randrange(60))
+
+        items = []
+        for name, base, category in rng.sample(LOCAL_CATALOG[store], rng.randint(1, len(LOCAL_CATALOG[store]))):
+            items.append({
+                "name": name,
+                "price": round(base * rng.uniform(0.9, 1.15), 2),
+                "quantity": 1 if rng.random() < 0.8 else rng.randint(2, 3),
+                "category": category,
+            })
+        total = round(sum(i["price"] * i["quantity"] for i in items), 2)
+
+        lines = [store.upper(), purchase_date.isoformat()]
+        lines += [f"{i['name']} x{i['quantity']} {i['price']:.2f}" for i in items]
+        lines.append(f"TOTAL {total:.2f}")
+        return {
+            "store_name": store,
+            "purchase_date": purchase_date.isoformat(),
+            "items": items,
+            "total_amount": total,
+            "raw_text": "\n".join(lines),
+        }
+
+    async def analyze_spending(self, receipts_data: List[Dict]) -> Dict:
+        await self._simulate("analyze")
+        items = [(r, item) for r in receipts_data for item in r.get("items", [])]
+
+        # Most expensive single non-grocery lines stand in for impulse buys
+        candidates = sorted(
+            ((item.get("price") or 0) * (item.get("quantity") or 1), item.get("name", "Unknown"))
+            for _, item in items if item.get("category") not in ("groceries", "transportation")
+        )
+        impulse_buys = [
+            {"item": name, "reason": "Discretionary purchase well above your usual basket item", "amount": round(amount, 2)}
+            for amount, name in reversed(candidates[-3:])
+        ]
+
+        by_category = defaultdict(list)
+        for receipt, item in items:
+            by_category[item.get("category") or "other"].append(
+                (receipt.get("date") or "", (item.get("price") or 0) * (item.get("quantity") or 1))
+            )
+        top_categories = sorted(by_category, key=lambda c: -sum(a for _, a in by_category[c]))[:3]
+
+        spending_trends = []
+        for category in top_categories:
+            spends = [amount for _, amount in sorted(by_category[category])]
+            half = len(spends) // 2
+            earlier, later = sum(spends[:half]), sum(spends[half:])
+            trend = "stable"
+            if half and later > earlier * 1.1:
+                trend = "increasing"
+            elif half and later < earlier * 0.9:
+                trend = "decreasing"
+            spending_trends.append({
+                "category": category,
+                "trend": trend,
+                "insight": f"${later:.2f} in recent purchases vs ${earlier:.2f} before",
+            })
+
+        days = Counter()
+        for receipt in receipts_data:
+            if receipt.get("date"):
+                days[WEEKDAYS[datetime.fromisoformat(receipt["date"]).weekday()]] += receipt.get("total") or 0
+        peak_spending = {}
+        if days:
+            day, amount = days.most_common(1)[0]
+            peak_spending = {"day": day, "time": "afternoon", "reason": f"${amount:.2f} spent on {day}s"}
+
+        return {
+            "impulse_buys": impulse_buys,
+            "spending_trends": spending_trends,
+            "peak_spending": peak_spending,
+            "top_categories": top_categories,
+        }
+
+    async def generate_recommendations(self, spending_data: Dict) -> List[Dict]:
+        await self._simulate("recommend")
+        # get_category_breakdown shape: {category: {"total": ..., "count": ..., ...}}
+        totals = {
+            category: value["total"] if isinstance(value, dict) else value
+            for category, value in (spending_data.get("categories") or {}).items()
+        }
+        recommendations = []
+        for category, amount in sorted(totals.items(), key=lambda kv: -kv[1])[:3]:
+            recommendations.append({
+                "type": "savings",
+                "title": f"Trim {category} spending",
+                "description": f"You spent ${amount:.2f} on {category}. Cutting 10% would save ${amount * 0.1:.2f}.",
+                "potential_savings": round(amount * 0.1, 2),
+                "category": category,
+            })
+        if spending_data.get("average_transaction"):
+            recommendations.append({
+                "type": "habit",
+                "title": "Consolidate shopping trips",
+                "description": f"Your average receipt is ${spending_data['average_transaction']:.2f}; "
+                               "fewer, planned trips cut impulse spending.",
+                "potential_savings": round(spending_data["average_transaction"] * 0.05, 2),
+                "category": spending_data.get("top_category"),
+            })
+        return recommendations
+
+    def analyze_recurring(self, history: List[Dict]) -> Dict:
+        self._simulate_sync("recurring")
+        visits = defaultdict(list)
+        for receipt in history:
+            visits[receipt["store"] or "Unknown Store"].append((receipt["date"], receipt.get("total") or 0))
+
+        patterns, forecast = [], []
+        monthly = 0.0
+        for store, seen in sorted(visits.items()):
+            if len(seen) < 2:
+                continue
+            seen.sort()
+            dates = [date.fromisoformat(d) for d, _ in seen]
+            gap = mean((b - a).days for a, b in zip(dates, dates[1:]))
+            frequency = "weekly" if gap <= 9 else "biweekly" if gap <= 18 else "monthly" if gap <= 35 else "irregular"
+            average = round(mean(amount for _, amount in seen), 2)
+            next_predicted = (dates[-1] + timedelta(days=round(gap))).isoformat()
+            patterns.append({
+                "type": "store",
+                "name": store,
+                "frequency": frequency,
+                "average_amount": average,
+                "occurrences": len(seen),
+                "last_seen": dates[-1].isoformat(),
+                "next_predicted": next_predicted,
+                "confidence": "high" if len(seen) >= 6 else "medium" if len(seen) >= 3 else "low",
+                "insight": f"You visit {store} about every {round(gap)} days",
+            })
+            forecast.append({"name": store, "predicted_amount": average, "predicted_date": next_predicted})
+            if frequency != "irregular":
+                # Same-week repeat visits shouldn't count as more than weekly
+                monthly += average * 30 / max(gap, 7)
+
+        return {
+            "patterns": patterns,
+            "forecast": forecast,
+            "summary": f"Found {len(patterns)} recurring stores across {len(history)} receipts.",
+            "total_monthly_recurring": round(monthly, 2),
+        }
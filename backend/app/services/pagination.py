@@ -0,0 +1,35 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    """Opaque cursor for the last row of a page"""
+    raw = json.dumps([sort_value.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_before(sort_column, id_column, cursor: Optional[str]):
+    """
+    WHERE clause selecting rows after the cursor for a (sort_column DESC, id DESC) ordering.
+    Returns None when there is no cursor (first page).
+    """
+    if not cursor:
+        return None
+    sort_value, row_id = decode_cursor(cursor)
+    return or_(
+        sort_column < sort_value,
+        and_(sort_column == sort_value, id_column < row_id),
+    )
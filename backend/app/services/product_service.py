@@ -0,0 +1,203 @@
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.database import Item, Product
+
+# Receipt abbreviations the models pass through verbatim
+ABBREVIATIONS = {
+    "org": "organic",
+    "orgnc": "organic",
+    "lg": "large",
+    "sm": "small",
+    "med": "medium",
+    "wht": "white",
+    "whl": "whole",
+    "grn": "green",
+    "chkn": "chicken",
+    "bnls": "boneless",
+    "sknls": "skinless",
+    "brd": "bread",
+    "veg": "vegetable",
+    "choc": "chocolate",
+    "crm": "cream",
+    "chs": "cheese",
+    "frz": "frozen",
+    "pk": "pack",
+}
+
+STOPWORDS = {"the", "and", "of", "with", "a", "an", "&"}
+
+# Sizes, weights and counts ("500g", "1.5l", "12oz", "x2", "6pk") don't identify a product
+MEASURE_RE = re.compile(r"^(x?\d+(\.\d+)?(g|kg|mg|ml|l|oz|lb|lbs|ct|pk|pc|pcs|x)?|\d+x)$")
+
+FUZZY_THRESHOLD = 0.88
+
+
+def _singular(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def _tokens(name: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode().lower()
+    tokens = []
+    for raw in re.findall(r"[a-z0-9.%]+", text):
+        raw = raw.strip(".")
+        if not raw or raw in STOPWORDS or MEASURE_RE.match(raw):
+            continue
+        tokens.append(_singular(ABBREVIATIONS.get(raw, raw)))
+    return tokens
+
+
+def normalize_item_name(name: str) -> str:
+    """
+    Order-insensitive key for an item name:
+    "BANANAS ORG", "Organic Bananas" and "bananas organic 1kg" all map to "banana organic"
+    """
+    return " ".join(sorted(set(_tokens(name))))
+
+
+def canonical_display_name(name: str) -> str:
+    tokens = _tokens(name)
+    return " ".join(dict.fromkeys(tokens)).title() if tokens else name.strip()
+
+
+class ProductCatalog:
+    """
+    In-process index of the products table: exact key lookups plus a token index that
+    narrows fuzzy matching to products sharing at least one word. Products created in
+    a transaction are only indexed once it commits; until then they are visible to
+    that session alone, so a rolled-back insert never leaves a stale id behind.
+    """
+
+    def __init__(self):
+        self._by_key: Dict[str, int] = {}
+        self._keys: Dict[int, str] = {}
+        self._by_token: Dict[str, Set[int]] = defaultdict(set)
+        self._loaded = False
+
+    def _remember(self, product_id: int, key: str):
+        self._by_key[key] = product_id
+        self._keys[product_id] = key
+        for token in key.split():
+            self._by_token[token].add(product_id)
+
+    def _load(self, db: Session):
+        for product_id, key in db.query(Product.id, Product.normalized_key):
+            self._remember(product_id, key)
+        self._loaded = True
+
+    def _pending(self, db: Session) -> Dict[str, int]:
+        """Keys created in the session's open transaction, published on commit, dropped on rollback"""
+        pending = db.info.get("pending_products")
+        if pending is None:
+            pending = db.info["pending_products"] = {}
+
+            @event.listens_for(db, "after_commit")
+            def publish(session):
+                # Savepoint releases fire this too; only the outer commit makes rows real
+                if session.in_nested_transaction():
+                    return
+                for key, product_id in session.info.pop("pending_products", {}).items():
+                    self._remember(product_id, key)
+
+            @event.listens_for(db, "after_rollback")
+            def discard(session):
+                # Conservative on savepoint rollbacks too: a dropped entry is only a cache miss
+                session.info.get("pending_products", {}).clear()
+        return pending
+
+    def _fuzzy_match(self, key: str) -> Optional[int]:
+        candidates = set()
+        for token in key.split():
+            candidates |= self._by_token.get(token, set())
+
+        best_id, best_score = None, FUZZY_THRESHOLD
+        for product_id in candidates:
+            score = SequenceMatcher(None, key, self._keys[product_id]).ratio()
+            if score >= best_score:
+                best_id, best_score = product_id, score
+        return best_id
+
+    def resolve(self, db: Session, name: str, category: Optional[str] = None) -> Optional[int]:
+        """Return the product id for an item name, creating the product if it's new"""
+        if not self._loaded:
+            self._load(db)
+
+        key = normalize_item_name(name)
+        if not key:
+            return None
+
+        pending = self._pending(db)
+        if key in pending:
+            return pending[key]
+        product_id = self._by_key.get(key) or self._fuzzy_match(key)
+        if product_id:
+            self._by_key[key] = product_id
+            return product_id
+
+        # Another worker may have created it since we loaded (or this transaction did,
+        # before a savepoint rollback dropped it from pending)
+        existing = db.query(Product.id).filter(Product.normalized_key == key).scalar()
+        if existing:
+            pending[key] = existing
+            return existing
+
+        product = Product(canonical_name=canonical_display_name(name), normalized_key=key, category=category)
+        try:
+            with db.begin_nested():
+                db.add(product)
+                db.flush()
+        except IntegrityError:
+            # A concurrent transaction committed it first
+            product = db.query(Product).filter(Product.normalized_key == key).one()
+        pending[key] = product.id
+        return product.id
+
+    def resolve_many(self, db: Session, items: List[Dict]) -> List[Optional[int]]:
+        return [self.resolve(db, item["name"], item.get("category")) for item in items]
+
+
+product_catalog = ProductCatalog()
+
+
+def backfill_products(db: Session, batch_size: int = 500) -> int:
+    """Attach products to items that predate the catalog, one committed batch at a time"""
+    updated = 0
+    last_id = 0
+    while True:
+        batch = db.query(Item).filter(
+            Item.product_id.is_(None),
+            Item.id > last_id
+        ).order_by(Item.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        for item in batch:
+            item.product_id = product_catalog.resolve(db, item.name, item.category)
+            if item.product_id:
+                updated += 1
+        last_id = batch[-1].id
+        db.commit()
+
+    return updated
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal, init_db
+
+    init_db()
+    session = SessionLocal()
+    try:
+        count = backfill_products(session)
+        print(f"✅ Linked {count} items to products")
+    finally:
+        session.close()
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+from typing import Any, Optional
+from app.metrics import AI_CACHE_LOOKUPS
+from app.services.cache_service import CacheBackend, cache_backend
+
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", "3600"))
+
+
+class PromptCache:
+    """
+    TTL cache for model responses, keyed by operation, model and a canonical hash
+    of the input. Identical input gives an identical prompt, so a hit is exactly
+    what the provider would be asked again; any change to the data (a new upload,
+    a deleted receipt) changes the key. Entries live in the shared cache backend,
+    so with CACHE_URL set every worker reuses the answers any worker paid for. Size
+    is bounded there, by CACHE_MAX_ENTRIES across all namespaces.
+    """
+
+    NAMESPACE = "prompt"
+
+    def __init__(self, backend: CacheBackend, ttl_seconds: int):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    @staticmethod
+    def key(operation: str, model: str, payload: Any) -> str:
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        digest = hashlib.sha256(canonical.encode()).hexdigest()
+        return f"{operation}:{model}:{digest}"
+
+    def _record(self, key: str, value: Optional[Any]):
+        AI_CACHE_LOOKUPS.labels(key.split(":", 1)[0], "miss" if value is None else "hit").inc()
+
+    async def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        # The backend hands out copies, so mutating a response can't poison the cache
+        value = await self.backend.get(await self.backend.versioned_key(self.NAMESPACE, key))
+        self._record(key, value)
+        return value
+
+    async def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        await self.backend.set(await self.backend.versioned_key(self.NAMESPACE, key), value, self.ttl_seconds)
+
+    async def clear(self):
+        await self.backend.bump(self.NAMESPACE)
+
+    def get_sync(self, key: str) -> Optional[Any]:
+        """get() for sync callers (the recurring analysis runs in the threadpool)"""
+        if not self.enabled:
+            return None
+        value = self.backend.get_sync(self.backend.versioned_key_sync(self.NAMESPACE, key))
+        self._record(key, value)
+        return value
+
+    def set_sync(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        self.backend.set_sync(self.backend.versioned_key_sync(self.NAMESPACE, key), value, self.ttl_seconds)
+
+prompt_cache = PromptCache(cache_backend, AI_CACHE_TTL_SECONDS)
@@ -3,8 +3,14 @@ import json
 import os
 from sqlalchemy.orm import Session
 from app.models.database import Receipt, Item
+from app.metrics import track_ai_call
+from app.services.ai_service import LOCAL_MODEL, ai_service, estimate_tokens, record_gemini_usage, strip_code_fence
+from app.services.prompt_cache import prompt_cache
+from app.services.usage_service import record_usage_sync
 from datetime import datetime
 
+RECURRING_MODEL = 'models/gemini-2.5-flash'
+
 def get_user_receipt_history(db: Session, user_id: int):
     """Fetch all receipts and items for a user to send to Gemini"""
     receipts = db.query(Receipt).filter(Receipt.user_id == user_id).order_by(Receipt.purchase_date).all()
@@ -44,6 +50,8 @@ def analyze_recurring_expenses(db: Session, user_id: int):
             "total_monthly_recurring": 0
         }
     
+    today = datetime.now().strftime("%Y-%m-%d")
+    
     # Build prompt for Gemini
     prompt = f"""
     You are a financial analyst. Analyze this shopping receipt history and detect recurring expense patterns.
@@ -51,7 +59,7 @@ def analyze_recurring_expenses(db: Session, user_id: int):
     Receipt History:
     {json.dumps(history, indent=2)}
     
-    Today's date: {datetime.now().strftime("%Y-%m-%d")}
+    Today's date: {today}
     
     Analyze and identify:
     1. Stores visited repeatedly (same store appearing multiple times)
@@ -89,19 +97,32 @@ def analyze_recurring_expenses(db: Session, user_id: int):
     }}
     """
     
+    use_local = ai_service.provider == "local" and ai_service.local_provider
+    provider, model_name = ("local", LOCAL_MODEL) if use_local else ("gemini", RECURRING_MODEL)
+    # The prompt embeds today's date, so cached answers roll over daily
+    cache_key = prompt_cache.key("recurring", model_name, {"history": history, "today": today})
+    cached = prompt_cache.get_sync(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(prompt)
-        
-        # Clean response — strip markdown if present
-        text = response.text.strip()
-        if text.startswith("```"):
-            text = text.split("```")[1]
-            if text.startswith("json"):
-                text = text[4:]
-        text = text.strip()
-        
-        result = json.loads(text)
+        if use_local:
+            with track_ai_call(provider, model_name, "recurring") as call:
+                result = ai_service.local_provider.analyze_recurring(history)
+                call.prompt_tokens = estimate_tokens(prompt)
+                call.completion_tokens = estimate_tokens(result)
+        else:
+            with track_ai_call(provider, model_name, "recurring") as call:
+                model = genai.GenerativeModel(RECURRING_MODEL)
+                response = model.generate_content(prompt)
+                record_gemini_usage(response, call)
+            
+                result = json.loads(strip_code_fence(response.text))
+        try:
+            record_usage_sync(db, user_id, "recurring", provider, model_name, call.prompt_tokens, call.completion_tokens)
+        except Exception as e:
+            print(f"⚠️ Failed to record AI usage: {e}")
+        prompt_cache.set_sync(cache_key, result)
         return result
         
     except Exception as e:
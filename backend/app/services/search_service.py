@@ -0,0 +1,221 @@
+import re
+from typing import Dict, List
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+# One search document per receipt: store name, all item names and the extracted text.
+# Triggers keep it in sync on receipt changes and item edits/deletes. Inserted items
+# are not triggered per row (that re-aggregates the receipt's names once per item);
+# whoever inserts them calls refresh_search_document() once afterwards.
+
+SQLITE_ITEM_NAMES = "(SELECT group_concat(name, ' ') FROM items WHERE receipt_id = {ref})"
+
+SQLITE_SEARCH_DDL = [
+    "DROP TRIGGER IF EXISTS receipt_search_items_ai",
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS receipt_search USING fts5(
+        store_name, item_names, extracted_text,
+        tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS receipt_search_ai AFTER INSERT ON receipts BEGIN
+        INSERT INTO receipt_search(rowid, store_name, item_names, extracted_text)
+        VALUES (new.id, new.store_name, {SQLITE_ITEM_NAMES.format(ref="new.id")}, new.extracted_text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS receipt_search_au AFTER UPDATE OF store_name, extracted_text ON receipts BEGIN
+        UPDATE receipt_search SET store_name = new.store_name, extracted_text = new.extracted_text
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS receipt_search_ad AFTER DELETE ON receipts BEGIN
+        DELETE FROM receipt_search WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS receipt_search_items_au AFTER UPDATE OF name, receipt_id ON items BEGIN
+        UPDATE receipt_search SET item_names = {SQLITE_ITEM_NAMES.format(ref="old.receipt_id")}
+        WHERE rowid = old.receipt_id;
+        UPDATE receipt_search SET item_names = {SQLITE_ITEM_NAMES.format(ref="new.receipt_id")}
+        WHERE rowid = new.receipt_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS receipt_search_items_ad AFTER DELETE ON items BEGIN
+        UPDATE receipt_search SET item_names = {SQLITE_ITEM_NAMES.format(ref="old.receipt_id")}
+        WHERE rowid = old.receipt_id;
+    END
+    """,
+]
+
+SQLITE_SEARCH_BACKFILL = f"""
+    INSERT INTO receipt_search(rowid, store_name, item_names, extracted_text)
+    SELECT r.id, r.store_name, {SQLITE_ITEM_NAMES.format(ref="r.id")}, r.extracted_text
+    FROM receipts r
+"""
+
+SQLITE_SEARCH_REFRESH = f"""
+    UPDATE receipt_search SET item_names = {SQLITE_ITEM_NAMES.format(ref="receipt_search.rowid")}
+    WHERE rowid = :receipt_id
+"""
+
+SQLITE_SEARCH_QUERY = """
+    SELECT r.id, r.store_name, r.purchase_date, r.total_amount,
+           bm25(receipt_search, 4.0, 2.0, 1.0) AS score,
+           snippet(receipt_search, -1, '<mark>', '</mark>', '…', 12) AS snippet
+    FROM receipt_search
+    JOIN receipts r ON r.id = receipt_search.rowid
+    WHERE receipt_search MATCH :query AND r.user_id = :user_id
+    ORDER BY score
+    LIMIT :limit OFFSET :offset
+"""
+
+# Postgres: a side table with a weighted tsvector, GIN-indexed and refreshed by one trigger function
+PG_SEARCH_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS receipt_search (
+        receipt_id INTEGER PRIMARY KEY REFERENCES receipts(id) ON DELETE CASCADE,
+        document TSVECTOR NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_receipt_search_document ON receipt_search USING GIN (document)",
+    """
+    CREATE OR REPLACE FUNCTION receipt_search_refresh(rid INTEGER) RETURNS VOID AS $$
+    BEGIN
+        INSERT INTO receipt_search (receipt_id, document)
+        SELECT r.id,
+               setweight(to_tsvector('english', coalesce(r.store_name, '')), 'A') ||
+               setweight(to_tsvector('english', coalesce(
+                   (SELECT string_agg(i.name, ' ') FROM items i WHERE i.receipt_id = r.id), '')), 'B') ||
+               setweight(to_tsvector('english', coalesce(r.extracted_text, '')), 'C')
+        FROM receipts r WHERE r.id = rid
+        ON CONFLICT (receipt_id) DO UPDATE SET document = EXCLUDED.document;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION receipt_search_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_TABLE_NAME = 'receipts' THEN
+            IF TG_OP <> 'DELETE' THEN PERFORM receipt_search_refresh(NEW.id); END IF;
+        ELSE
+            IF TG_OP <> 'INSERT' THEN PERFORM receipt_search_refresh(OLD.receipt_id); END IF;
+            IF TG_OP <> 'DELETE' THEN PERFORM receipt_search_refresh(NEW.receipt_id); END IF;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS receipt_search_receipts ON receipts",
+    """
+    CREATE TRIGGER receipt_search_receipts AFTER INSERT OR UPDATE OF store_name, extracted_text ON receipts
+    FOR EACH ROW EXECUTE FUNCTION receipt_search_trigger()
+    """,
+    "DROP TRIGGER IF EXISTS receipt_search_items ON items",
+    """
+    CREATE TRIGGER receipt_search_items AFTER UPDATE OR DELETE ON items
+    FOR EACH ROW EXECUTE FUNCTION receipt_search_trigger()
+    """,
+]
+
+PG_SEARCH_BACKFILL = """
+    SELECT receipt_search_refresh(r.id) FROM receipts r
+    WHERE NOT EXISTS (SELECT 1 FROM receipt_search s WHERE s.receipt_id = r.id)
+"""
+
+PG_SEARCH_REFRESH = "SELECT receipt_search_refresh(:receipt_id)"
+
+PG_SEARCH_QUERY = """
+    SELECT r.id, r.store_name, r.purchase_date, r.total_amount,
+           ts_rank_cd(s.document, q) AS score,
+           ts_headline('english',
+               coalesce(r.store_name, '') || ' ' ||
+               coalesce((SELECT string_agg(i.name, ' ') FROM items i WHERE i.receipt_id = r.id), '') || ' ' ||
+               coalesce(r.extracted_text, ''),
+               q, 'StartSel=<mark>, StopSel=</mark>, MaxWords=24, MinWords=8') AS snippet
+    FROM receipt_search s
+    JOIN receipts r ON r.id = s.receipt_id,
+         websearch_to_tsquery('english', :query) q
+    WHERE s.document @@ q AND r.user_id = :user_id
+    ORDER BY score DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def install_search_index(engine: Engine):
+    """Create the full-text index and its sync triggers, backfilling existing receipts once"""
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'receipt_search'"
+            )).first()
+            for statement in SQLITE_SEARCH_DDL:
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text(SQLITE_SEARCH_BACKFILL))
+        elif engine.dialect.name == "postgresql":
+            for statement in PG_SEARCH_DDL:
+                conn.execute(text(statement))
+            conn.execute(text(PG_SEARCH_BACKFILL))
+        else:
+            print(f"⚠️ Full-text search is not supported on {engine.dialect.name}")
+
+
+async def refresh_search_document(db: AsyncSession, receipt_id: int):
+    """Index a receipt's item names once, after all its items are inserted (caller commits)"""
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        await db.execute(text(SQLITE_SEARCH_REFRESH), {"receipt_id": receipt_id})
+    elif dialect == "postgresql":
+        await db.execute(text(PG_SEARCH_REFRESH), {"receipt_id": receipt_id})
+
+
+def rebuild_search_index(db: Session):
+    """Re-index every receipt, for bulk loads that insert rows directly (caller commits)"""
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        db.execute(text("DELETE FROM receipt_search"))
+        db.execute(text(SQLITE_SEARCH_BACKFILL))
+    elif dialect == "postgresql":
+        db.execute(text("SELECT receipt_search_refresh(r.id) FROM receipts r"))
+
+
+def _fts5_query(query: str) -> str:
+    """Turn free text into an FTS5 query: every term must match, each as a prefix"""
+    terms = re.findall(r"\w+", query, flags=re.UNICODE)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+async def search_receipts(db: AsyncSession, user_id: int, query: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+    """Ranked full-text search over a user's receipts"""
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        match = _fts5_query(query)
+        if not match:
+            return []
+        sql, params = SQLITE_SEARCH_QUERY, {"query": match}
+    elif dialect == "postgresql":
+        sql, params = PG_SEARCH_QUERY, {"query": query}
+    else:
+        return []
+
+    params.update({"user_id": user_id, "limit": limit, "offset": offset})
+    rows = (await db.execute(text(sql), params)).mappings().all()
+
+    return [
+        {
+            "receipt_id": row["id"],
+            "store_name": row["store_name"],
+            "purchase_date": row["purchase_date"],
+            "total_amount": row["total_amount"],
+            # bm25 is lower-is-better; flip it so higher always means more relevant
+            "score": round(-row["score"] if dialect == "sqlite" else row["score"], 6),
+            "snippet": row["snippet"],
+        }
+        for row in rows
+    ]
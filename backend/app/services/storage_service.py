@@ -0,0 +1,287 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Set
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.exceptions import HTTPException
+from app.database import AsyncSessionLocal
+from app.models.database import StoredFile
+from app.services.image_service import IMAGE_VARIANTS, derivative_key
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+# How long an upload's claim on its content protects an unreferenced blob; only
+# matters when a worker died between storing an upload and committing its receipt
+STORAGE_CLAIM_GRACE_SECONDS = int(os.getenv("STORAGE_CLAIM_GRACE_SECONDS", "600"))
+# Directories under UPLOAD_DIR that are never served
+PRIVATE_UPLOAD_DIRS = (".tmp", "exports")
+
+
+class UploadTooLarge(Exception):
+    """Raised while streaming once an upload passes MAX_UPLOAD_SIZE"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"File exceeds the {limit / (1024 * 1024):.1f}MB upload limit")
+        self.limit = limit
+
+
+@dataclass
+class StoredUpload:
+    key: str
+    size: int
+    content_type: Optional[str]
+    created: bool  # False when identical content was already stored
+
+
+class StorageBackend:
+    """
+    Where blobs live. Keys are relative paths like "receipts/ab/cd/<sha256>.jpg".
+    A local S3 stand-in only needs to implement these five methods.
+    """
+
+    async def put_file(self, key: str, source_path: str) -> bool:
+        """Move a finished temp file to its key; False (source dropped) if the key was already stored"""
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> str:
+        """Filesystem path readers (image decoding, AI extraction) can open"""
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        raise NotImplementedError
+
+
+class LocalStorageBackend(StorageBackend):
+    def __init__(self, root: str, url_prefix: str = "/uploads"):
+        self.root = root
+        self.url_prefix = url_prefix
+        os.makedirs(root, exist_ok=True)
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def url(self, key: str) -> str:
+        return f"{self.url_prefix}/{key}"
+
+    async def put_file(self, key: str, source_path: str) -> bool:
+        target = self.local_path(key)
+        await aiofiles.os.makedirs(os.path.dirname(target), exist_ok=True)
+        # A hard link on the same filesystem is atomic and, unlike a rename, refuses to
+        # overwrite, so of two concurrent identical uploads exactly one stores the blob
+        try:
+            await aiofiles.os.link(source_path, target)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            await aiofiles.os.remove(source_path)
+
+    async def exists(self, key: str) -> bool:
+        return await aiofiles.os.path.exists(self.local_path(key))
+
+    async def delete(self, key: str):
+        path = self.local_path(key)
+        if await aiofiles.os.path.exists(path):
+            await aiofiles.os.remove(path)
+
+
+class ReceiptStorage:
+    """Content-addressed, reference-counted storage for uploaded receipt files"""
+
+    def __init__(self, backend: StorageBackend, tmp_dir: str, max_size: int = MAX_UPLOAD_SIZE):
+        self.backend = backend
+        self.tmp_dir = tmp_dir
+        self.max_size = max_size
+        self._pending_removals: Set[asyncio.Task] = set()
+        os.makedirs(tmp_dir, exist_ok=True)
+
+    @staticmethod
+    def key_for(digest: str, filename: Optional[str]) -> str:
+        ext = os.path.splitext(filename or "")[1].lower()[:8]
+        # Two levels of 256-way sharding keeps every directory small
+        return f"receipts/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+    async def save_upload(self, file: UploadFile) -> StoredUpload:
+        """Stream an upload to a temp file while hashing it, then move it to its content address"""
+        tmp_path = os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        size = 0
+        claimed = None
+        try:
+            async with aiofiles.open(tmp_path, "wb") as out:
+                while chunk := await file.read(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise UploadTooLarge(self.max_size)
+                    digest.update(chunk)
+                    await out.write(chunk)
+
+            key = self.key_for(digest.hexdigest(), file.filename)
+            # Claim the content before looking for it, so a pending remove() either
+            # finishes first (and the blob is written again) or sees the claim and waits
+            await self._claim(key, size, file.content_type)
+            claimed = StoredUpload(key=key, size=size, content_type=file.content_type, created=False)
+            if await self.backend.exists(key):
+                await aiofiles.os.remove(tmp_path)
+                return claimed
+
+            claimed.created = await self.backend.put_file(key, tmp_path)
+            return claimed
+        except BaseException:
+            if await aiofiles.os.path.exists(tmp_path):
+                await aiofiles.os.remove(tmp_path)
+            if claimed is not None:
+                await self.discard(claimed)
+            raise
+
+    async def _claim(self, key: str, size: int, content_type: Optional[str]):
+        """Record an upload in flight for this content (creating the row unreferenced), committed at once"""
+        claim = update(StoredFile).where(StoredFile.key == key).values(
+            pending_claims=func.coalesce(StoredFile.pending_claims, 0) + 1, claimed_at=datetime.utcnow()
+        )
+        async with AsyncSessionLocal() as db:
+            if (await db.execute(claim)).rowcount == 0:
+                try:
+                    async with db.begin_nested():
+                        db.add(StoredFile(key=key, size=size, content_type=content_type,
+                                          ref_count=0, pending_claims=1, claimed_at=datetime.utcnow()))
+                except IntegrityError:
+                    # A concurrent upload of the same content claimed it first
+                    await db.execute(claim)
+            await db.commit()
+
+    @staticmethod
+    def _settle_claim():
+        return case((StoredFile.pending_claims > 0, StoredFile.pending_claims - 1), else_=0)
+
+    async def retain(self, db: AsyncSession, stored: StoredUpload):
+        """
+        Count one more receipt referencing this blob, settling the upload's claim
+        (commits with the caller's transaction). A PDF's receipts retain it once each.
+        """
+        increment = update(StoredFile).where(StoredFile.key == stored.key).values(
+            ref_count=StoredFile.ref_count + 1, pending_claims=self._settle_claim()
+        )
+        if (await db.execute(increment)).rowcount == 0:
+            try:
+                async with db.begin_nested():
+                    db.add(StoredFile(
+                        key=stored.key,
+                        size=stored.size,
+                        content_type=stored.content_type,
+                        ref_count=1
+                    ))
+            except IntegrityError:
+                # Another upload of the same content inserted the row first
+                await db.execute(increment)
+
+    async def release(self, db: AsyncSession, key: str) -> int:
+        """Drop one reference; returns the references left (0 means the blob can be removed)"""
+        stored = (await db.execute(
+            select(StoredFile).where(StoredFile.key == key)
+        )).scalar_one_or_none()
+        if stored is None:
+            # Files from before content addressing were never shared
+            return 0
+
+        # The row stays at zero; remove() deletes it together with the file
+        stored.ref_count = max(0, stored.ref_count - 1)
+        return stored.ref_count
+
+    async def discard(self, stored: StoredUpload):
+        """Give up an upload that won't become a receipt: drop its claim and the blob if now unused"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(StoredFile).where(StoredFile.key == stored.key).values(pending_claims=self._settle_claim())
+            )
+            await db.commit()
+        await self.remove(stored.key)
+
+    async def remove(self, key: str):
+        """
+        Delete a blob nothing references. The row is deleted and the file unlinked in
+        one transaction, so an upload claiming the same content waits on the row and
+        then finds the file gone. A blob with an upload still in flight is left to
+        that upload; a claim older than the grace period is checked again once it lapses.
+        """
+        async with AsyncSessionLocal() as db:
+            stored = (await db.execute(select(StoredFile).where(StoredFile.key == key))).scalar_one_or_none()
+            if stored is None and key.startswith("receipts/"):
+                # Already removed (and possibly re-uploaded since): not ours to delete
+                return
+            if stored is not None:
+                cutoff = datetime.utcnow() - timedelta(seconds=STORAGE_CLAIM_GRACE_SECONDS)
+                deleted = await db.execute(
+                    delete(StoredFile).where(
+                        StoredFile.key == key,
+                        StoredFile.ref_count <= 0,
+                        (func.coalesce(StoredFile.pending_claims, 0) <= 0) | (StoredFile.claimed_at < cutoff),
+                    )
+                )
+                if deleted.rowcount == 0:
+                    # Whoever holds the claim retains or discards it; check again in
+                    # case its worker died before doing either
+                    in_flight = stored.ref_count <= 0 and (stored.pending_claims or 0) > 0
+                    await db.rollback()
+                    if in_flight:
+                        self._remove_later(key)
+                    return
+            try:
+                await self.backend.delete(key)
+                for variant in IMAGE_VARIANTS:
+                    await self.backend.delete(derivative_key(key, variant))
+            except OSError as e:
+                print(f"⚠️ Failed to remove stored file {key}: {e}")
+            await db.commit()
+
+    def _remove_later(self, key: str):
+        async def retry():
+            await asyncio.sleep(STORAGE_CLAIM_GRACE_SECONDS)
+            await self.remove(key)
+
+        task = asyncio.create_task(retry())
+        self._pending_removals.add(task)
+        task.add_done_callback(self._pending_removals.discard)
+
+    def local_path(self, key: str) -> str:
+        return self.backend.local_path(key)
+
+    def url(self, key: str) -> str:
+        return self.backend.url(key)
+
+
+def is_private_upload(path: str) -> bool:
+    """In-progress uploads and exports live under UPLOAD_DIR but must never be served"""
+    first = path.replace("\\", "/").lstrip("/").split("/", 1)[0]
+    return first in PRIVATE_UPLOAD_DIRS or first.startswith(".")
+
+
+class UploadStaticFiles(StaticFiles):
+    """Serves UPLOAD_DIR, except in-progress uploads and other users' exports"""
+
+    async def get_response(self, path: str, scope):
+        if is_private_upload(path):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+
+receipt_storage = ReceiptStorage(
+    LocalStorageBackend(UPLOAD_DIR),
+    tmp_dir=os.path.join(UPLOAD_DIR, ".tmp")
+)
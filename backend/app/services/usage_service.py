@@ -0,0 +1,130 @@
+import json
+import os
+from datetime import date, timedelta
+from typing import Dict, Optional
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.metrics import AI_COST
+from app.models.database import AIUsage
+
+# USD per 1M (prompt, completion) tokens; longest matching model prefix wins.
+# Override with AI_PRICING='{"gpt-4o": [2.5, 10]}' when list prices change.
+MODEL_PRICING: Dict[str, tuple] = {
+    "gpt-4o": (5.00, 15.00),
+    "models/gemini-2.5-flash": (0.30, 2.50),
+    "models/gemini-2.0-flash": (0.10, 0.40),
+    "models/gemini-flash-latest": (0.30, 2.50),
+    "models/gemini-pro-latest": (1.25, 10.00),
+    "local": (0.0, 0.0),
+}
+MODEL_PRICING.update({k: tuple(v) for k, v in json.loads(os.getenv("AI_PRICING", "{}")).items()})
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    matches = [name for name in MODEL_PRICING if model and model.startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price = MODEL_PRICING[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def _rollup_filter(user_id: Optional[int], day: date, operation: str, provider: str, model: str):
+    user_clause = AIUsage.user_id.is_(None) if user_id is None else AIUsage.user_id == user_id
+    return (user_clause, AIUsage.day == day, AIUsage.operation == operation,
+            AIUsage.provider == provider, AIUsage.model == model)
+
+
+def _increment(user_id, day, operation, provider, model, prompt_tokens, completion_tokens, cost):
+    return (
+        update(AIUsage)
+        .where(*_rollup_filter(user_id, day, operation, provider, model))
+        .values(
+            requests=AIUsage.requests + 1,
+            prompt_tokens=AIUsage.prompt_tokens + prompt_tokens,
+            completion_tokens=AIUsage.completion_tokens + completion_tokens,
+            cost_usd=AIUsage.cost_usd + cost,
+        )
+    )
+
+
+def _new_rollup(user_id, day, operation, provider, model, prompt_tokens, completion_tokens, cost):
+    return AIUsage(user_id=user_id, day=day, operation=operation, provider=provider, model=model,
+                   requests=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cost_usd=cost)
+
+
+async def record_usage(db: AsyncSession, user_id: Optional[int], operation: str, provider: str,
+                       model: Optional[str], prompt_tokens: int, completion_tokens: int):
+    """Add one provider call to today's rollup row (update first, insert on the first call of the day)"""
+    model = model or "unknown"
+    cost = estimate_cost(model, prompt_tokens, completion_tokens)
+    AI_COST.labels(provider, model, operation).inc(cost)
+    args = (user_id, date.today(), operation, provider, model, prompt_tokens, completion_tokens, cost)
+
+    result = await db.execute(_increment(*args))
+    if result.rowcount == 0:
+        try:
+            async with db.begin_nested():
+                db.add(_new_rollup(*args))
+        except IntegrityError:
+            # Another worker inserted today's row first
+            await db.execute(_increment(*args))
+    await db.commit()
+
+
+def record_usage_sync(db: Session, user_id: Optional[int], operation: str, provider: str,
+                      model: Optional[str], prompt_tokens: int, completion_tokens: int):
+    """record_usage for sync callers (the recurring analysis runs in the threadpool)"""
+    model = model or "unknown"
+    cost = estimate_cost(model, prompt_tokens, completion_tokens)
+    AI_COST.labels(provider, model, operation).inc(cost)
+    args = (user_id, date.today(), operation, provider, model, prompt_tokens, completion_tokens, cost)
+
+    if db.execute(_increment(*args)).rowcount == 0:
+        try:
+            with db.begin_nested():
+                db.add(_new_rollup(*args))
+        except IntegrityError:
+            db.execute(_increment(*args))
+    db.commit()
+
+
+def get_usage_summary(db: Session, user_id: int, days: int = 30) -> Dict:
+    """Calls, tokens and estimated cost per operation over the last `days` days"""
+    since = date.today() - timedelta(days=days - 1)
+    rows = db.execute(
+        select(
+            AIUsage.operation,
+            AIUsage.provider,
+            AIUsage.model,
+            func.sum(AIUsage.requests),
+            func.sum(AIUsage.prompt_tokens),
+            func.sum(AIUsage.completion_tokens),
+            func.sum(AIUsage.cost_usd),
+        )
+        .where(AIUsage.user_id == user_id, AIUsage.day >= since)
+        .group_by(AIUsage.operation, AIUsage.provider, AIUsage.model)
+        .order_by(func.sum(AIUsage.cost_usd).desc())
+    ).all()
+
+    operations = [
+        {
+            "operation": operation,
+            "provider": provider,
+            "model": model,
+            "requests": requests,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": round(cost, 6),
+        }
+        for operation, provider, model, requests, prompt_tokens, completion_tokens, cost in rows
+    ]
+    return {
+        "since": since.isoformat(),
+        "requests": sum(o["requests"] for o in operations),
+        "prompt_tokens": sum(o["prompt_tokens"] for o in operations),
+        "completion_tokens": sum(o["completion_tokens"] for o in operations),
+        "cost_usd": round(sum(o["cost_usd"] for o in operations), 6),
+        "operations": operations,
+    }
@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+# Opt-in: structured per-request log lines (one JSON object per request) on stdout
+TRACE_LOG = os.getenv("TRACE_LOG", "false").lower() in ("1", "true", "yes")
+# Optional OpenTelemetry export: "otlp" (local collector), "file" or unset
+OTEL_TRACES_EXPORTER = os.getenv("OTEL_TRACES_EXPORTER", "").lower()
+OTEL_TRACES_FILE = os.getenv("OTEL_TRACES_FILE", "traces.jsonl")
+
+logger = logging.getLogger("shopsense.trace")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def _build_otel_tracer():
+    if OTEL_TRACES_EXPORTER not in ("otlp", "file"):
+        return None
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        if OTEL_TRACES_EXPORTER == "otlp":
+            # Honours OTEL_EXPORTER_OTLP_ENDPOINT (default http://localhost:4318)
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter()
+        else:
+            exporter = ConsoleSpanExporter(
+                out=open(OTEL_TRACES_FILE, "a"),
+                formatter=lambda span: span.to_json(indent=None) + "\n",
+            )
+    except ImportError as e:
+        print(f"⚠️ OpenTelemetry export disabled ({e})")
+        return None
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "shopsense-api"}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    print(f"✅ OpenTelemetry tracing enabled ({OTEL_TRACES_EXPORTER})")
+    return trace.get_tracer("shopsense")
+
+
+otel_tracer = _build_otel_tracer()
+
+
+class Span:
+    __slots__ = ("name", "start", "duration_ms")
+
+    def __init__(self, name: str, start: float):
+        self.name = name
+        self.start = start
+        self.duration_ms = 0.0
+
+
+class RequestTrace:
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+
+    def server_timing(self) -> str:
+        """Server-Timing value; repeated stages (e.g. one per item) are summed"""
+        totals = {}
+        for s in self.spans:
+            totals[s.name] = totals.get(s.name, 0.0) + s.duration_ms
+        entries = [f"{name};dur={ms:.1f}" for name, ms in totals.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+@contextmanager
+def span(name: str):
+    """Time one pipeline stage of the current request; a no-op outside a request"""
+    trace = _current_trace.get()
+    if trace is None and otel_tracer is None:
+        yield
+        return
+
+    record = Span(name, time.perf_counter())
+    otel_context = otel_tracer.start_as_current_span(name) if otel_tracer else None
+    otel_span = otel_context.__enter__() if otel_context else None
+    try:
+        yield
+    finally:
+        record.duration_ms = (time.perf_counter() - record.start) * 1000
+        if trace is not None:
+            trace.spans.append(record)
+        if otel_context:
+            if trace is not None:
+                otel_span.set_attribute("request.id", trace.request_id)
+            otel_context.__exit__(*sys.exc_info())
+
+
+def start_trace(request_id: Optional[str] = None) -> RequestTrace:
+    trace = RequestTrace(request_id or uuid.uuid4().hex)
+    _current_trace.set(trace)
+    return trace
+
+
+def log_trace(trace: RequestTrace, method: str, path: str, status: int):
+    if not TRACE_LOG:
+        return
+    logger.info(json.dumps({
+        "event": "request",
+        "request_id": trace.request_id,
+        "method": method,
+        "path": path,
+        "status": status,
+        "duration_ms": round((time.perf_counter() - trace.started) * 1000, 1),
+        "spans": [
+            {"name": s.name, "offset_ms": round((s.start - trace.started) * 1000, 1), "duration_ms": round(s.duration_ms, 1)}
+            for s in sorted(trace.spans, key=lambda s: s.start)
+        ],
+    }))
@@ -0,0 +1,221 @@
+"""
+Backend benchmark suite: analytics, budgets, receipt history, CSV export and PDF
+generation against synthetic datasets at several scales.
+
+Each operation reports p50/p95/p99 latency, queries issued per call and peak
+Python memory. --save writes a JSON baseline; --compare prints the change against
+one, so regressions show up as diffs.
+
+    cd backend
+    python -m benchmarks.bench_backend --scales small,medium --save benchmarks/baseline.json
+    python -m benchmarks.bench_backend --compare benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Keep exports, temp uploads and the database out of the working tree
+WORKDIR = tempfile.mkdtemp(prefix="shopsense-bench-")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(WORKDIR, "uploads"))
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+from app.database import build_engine
+from app.models.database import Base
+from app.services.analytics_service import analytics_service
+from app.services.anomaly_service import detect_anomalies
+from app.services.recurring_service import get_user_receipt_history
+from app.services.search_service import install_search_index
+from benchmarks.synthetic_data import DatasetSpec, generate_dataset
+
+SCALES = {
+    "small": DatasetSpec(users=1, receipts_per_user=100, items_per_receipt=8),
+    "medium": DatasetSpec(users=3, receipts_per_user=1000, items_per_receipt=10),
+    "large": DatasetSpec(users=5, receipts_per_user=5000, items_per_receipt=12),
+}
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+@contextmanager
+def chdir(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(fn, counter: QueryCounter, iterations: int) -> dict:
+    fn()  # warm caches and lazy imports
+    latencies = []
+    queries = []
+    tracemalloc.start()
+    for _ in range(iterations):
+        before = counter.count
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count - before)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "queries": round(statistics.mean(queries), 1),
+        "peak_mem_kb": round(peak / 1024, 1),
+    }
+
+
+def operations(db, user_id: int):
+    from app.routers.exports import export_receipts_csv
+
+    def spending():
+        return analytics_service.calculate_spending_analytics(db, user_id)
+
+    def categories():
+        return analytics_service.get_category_breakdown(db, user_id)
+
+    def budgets():
+        return analytics_service.get_budget_status(db, user_id)
+
+    def dashboard():
+        return analytics_service.get_dashboard(db, user_id)
+
+    def anomalies():
+        return detect_anomalies(db, user_id)
+
+    def receipt_history():
+        return get_user_receipt_history(db, user_id)
+
+    def csv_export():
+        return asyncio.run(export_receipts_csv(db))
+
+    ops = {
+        "calculate_spending_analytics": spending,
+        "get_category_breakdown": categories,
+        "get_budget_status": budgets,
+        "get_dashboard": dashboard,
+        "detect_anomalies": anomalies,
+        "get_user_receipt_history": receipt_history,
+        "csv_export": csv_export,
+    }
+
+    try:
+        from app.services.pdf_service import pdf_service
+    except ImportError as e:
+        print(f"⚠️ Skipping PDF benchmark ({e})")
+        return ops
+
+    pdf_dir = os.path.join(WORKDIR, "pdf")
+    os.makedirs(os.path.join(pdf_dir, "uploads"), exist_ok=True)
+
+    def pdf_report():
+        # pdf_service writes chart images to ./uploads
+        with chdir(pdf_dir):
+            pdf_service.generate_monthly_report(
+                analytics=spending().__dict__,
+                categories=categories(),
+                budgets=budgets(),
+                insights=[],
+                output_path="report.pdf"
+            )
+
+    ops["pdf_report"] = pdf_report
+    return ops
+
+
+def run_scale(name: str, spec: DatasetSpec, iterations: int) -> dict:
+    db_path = os.path.join(WORKDIR, f"{name}.db")
+    engine = build_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    install_search_index(engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+
+    started = time.perf_counter()
+    dataset = generate_dataset(db, spec)
+    print(f"[{name}] generated {dataset['receipts']:,} receipts / {dataset['items']:,} items "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    counter = QueryCounter(engine)
+    user_id = dataset["user_ids"][0]
+    results = {}
+    for op_name, fn in operations(db, user_id).items():
+        # Heavy operations get fewer iterations at larger scales
+        runs = iterations if op_name != "pdf_report" else max(3, iterations // 5)
+        results[op_name] = measure(fn, counter, runs)
+        r = results[op_name]
+        print(f"  {op_name:<30} p50 {r['p50_ms']:>9.2f} ms  p95 {r['p95_ms']:>9.2f} ms  "
+              f"p99 {r['p99_ms']:>9.2f} ms  {r['queries']:>7} queries  {r['peak_mem_kb']:>10,.0f} KB")
+
+    db.close()
+    engine.dispose()
+    return {
+        "dataset": {k: v for k, v in dataset.items() if k != "user_ids"},
+        "operations": results,
+    }
+
+
+def compare(current: dict, baseline: dict):
+    print("\nChange vs baseline (p50 latency, queries):")
+    for scale, data in current["scales"].items():
+        base_scale = baseline.get("scales", {}).get(scale)
+        if not base_scale:
+            continue
+        for op, result in data["operations"].items():
+            base = base_scale["operations"].get(op)
+            if not base:
+                continue
+            delta = (result["p50_ms"] - base["p50_ms"]) / base["p50_ms"] * 100 if base["p50_ms"] else 0
+            flag = "  ⚠️ REGRESSION" if delta > 20 or result["queries"] > base["queries"] else ""
+            print(f"  [{scale}] {op:<30} {base['p50_ms']:>9.2f} -> {result['p50_ms']:>9.2f} ms "
+                  f"({delta:+.0f}%)  queries {base['queries']} -> {result['queries']}{flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="small,medium", help=f"comma-separated: {', '.join(SCALES)}")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--save", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="compare against a saved JSON baseline")
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "iterations": args.iterations,
+        "scales": {},
+    }
+    for scale in args.scales.split(","):
+        report["scales"][scale] = run_scale(scale, SCALES[scale], args.iterations)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\n✅ Baseline saved to {args.save}")
@@ -0,0 +1,126 @@
+"""
+Serialization and wire-size benchmark for a 500-receipt listing.
+
+Compares the two default paths (jsonable_encoder for routes returning plain dicts,
+pydantic's JSON-mode dump for routes with a response_model, both rendered by stdlib
+json) with FAST_JSON (orjson via ORJSONResponse), then measures bytes on the wire
+with each encoding CompressionMiddleware can negotiate.
+
+    cd backend
+    python -m benchmarks.bench_serialization --receipts 500 --items 8
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from app.middleware.compression import _Encoder, brotli
+from app.models.schemas import ReceiptPage, ReceiptResponse, ItemResponse
+
+CATEGORIES = ["groceries", "dining", "electronics", "clothing", "health", "home", "transportation", "other"]
+STORES = ["Whole Foods", "Target", "Costco", "Trader Joe's", "CVS", "Shell", "Best Buy", "Chipotle"]
+WORDS = ["organic", "bananas", "milk", "bread", "chicken", "coffee", "rice", "eggs", "cheese", "apples",
+         "pasta", "yogurt", "spinach", "batteries", "shampoo", "detergent", "salmon", "tomatoes"]
+
+
+def build_page(receipts: int, items: int, seed: int = 42) -> ReceiptPage:
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    page = []
+    item_id = 1
+    for receipt_id in range(1, receipts + 1):
+        receipt_items = []
+        for _ in range(rng.randint(max(1, items // 2), items * 2)):
+            receipt_items.append(ItemResponse(
+                id=item_id,
+                receipt_id=receipt_id,
+                name=" ".join(rng.sample(WORDS, 2)).title(),
+                price=round(rng.uniform(0.5, 40), 2),
+                quantity=rng.randint(1, 3),
+                category=rng.choice(CATEGORIES)
+            ))
+            item_id += 1
+        digest = f"{rng.getrandbits(256):064x}"
+        page.append(ReceiptResponse(
+            id=receipt_id,
+            filename=f"receipts/{digest[:2]}/{digest[2:4]}/{digest}.jpg",
+            original_filename="receipt.jpg",
+            upload_date=start + timedelta(hours=receipt_id),
+            store_name=rng.choice(STORES),
+            purchase_date=start + timedelta(hours=receipt_id - 2),
+            total_amount=round(sum(i.price * i.quantity for i in receipt_items), 2),
+            items=receipt_items
+        ))
+    return ReceiptPage(receipts=page, next_cursor="WyIyMDI1LTAxLTAxVDAwOjAwOjAwIiwxXQ")
+
+
+def timed(fn, repeat: int):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(samples)
+
+
+def run(receipts: int, items: int, repeat: int) -> dict:
+    page = build_page(receipts, items)
+
+    def encoder_path():
+        return JSONResponse(jsonable_encoder(page)).body
+
+    def model_path():
+        return JSONResponse(page.model_dump(mode="json")).body
+
+    def fast_path():
+        return ORJSONResponse(page.model_dump(mode="json")).body
+
+    default_body, default_ms = timed(encoder_path, repeat)
+    _, model_ms = timed(model_path, repeat)
+    fast_body, fast_ms = timed(fast_path, repeat)
+
+    wire = {"identity": len(fast_body)}
+    for encoding in ["gzip"] + (["br"] if brotli is not None else []):
+        encoder = _Encoder(encoding, gzip_level=6, brotli_quality=4)
+        compressed, ms = timed(lambda: encoder.compress(fast_body) + encoder.flush(), 1)
+        wire[encoding] = len(compressed)
+        wire[f"{encoding}_ms"] = round(ms, 2)
+
+    return {
+        "receipts": receipts,
+        "items": sum(len(r.items) for r in page.receipts),
+        "default_ms": round(default_ms, 2),
+        "default_bytes": len(default_body),
+        "response_model_ms": round(model_ms, 2),
+        "fast_json_ms": round(fast_ms, 2),
+        "fast_json_bytes": len(fast_body),
+        "speedup": round(default_ms / fast_ms, 1) if fast_ms else None,
+        "speedup_vs_response_model": round(model_ms / fast_ms, 1) if fast_ms else None,
+        "wire_bytes": wire,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--receipts", type=int, default=500)
+    parser.add_argument("--items", type=int, default=8, help="average items per receipt")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    result = run(args.receipts, args.items, args.repeat)
+    print(f"Listing: {result['receipts']} receipts, {result['items']} items")
+    print(f"  jsonable_encoder + json:      {result['default_ms']:8.2f} ms  {result['default_bytes']:>10,} bytes")
+    print(f"  response_model dump + json:   {result['response_model_ms']:8.2f} ms")
+    print(f"  FAST_JSON (dump + orjson):    {result['fast_json_ms']:8.2f} ms  {result['fast_json_bytes']:>10,} bytes")
+    print(f"  speedup: {result['speedup']}x vs jsonable_encoder, "
+          f"{result['speedup_vs_response_model']}x vs response_model + json")
+    print("Bytes on the wire:")
+    for encoding in ("identity", "gzip", "br"):
+        if encoding in result["wire_bytes"]:
+            size = result["wire_bytes"][encoding]
+            ratio = result["wire_bytes"]["identity"] / size
+            extra = f"  ({result['wire_bytes'][encoding + '_ms']} ms to compress)" if encoding != "identity" else ""
+            print(f"  {encoding:<9} {size:>10,} bytes  {ratio:5.1f}x{extra}")
@@ -0,0 +1,266 @@
+"""
+HTTP load test modelling real sessions against a running backend.
+
+Each virtual user registers and logs in, uploads a batch of receipts, then polls
+the dashboard (spending, categories, budgets, receipt list) with think time,
+occasionally generating insights, fetching recommendations and recurring
+expenses, and exporting CSV. Users ramp up to each concurrency stage in turn;
+every stage reports throughput, per-endpoint p50/p95/p99 and error rates, so the
+knee of the curve shows up as the stage where p95 climbs while throughput flattens.
+
+Start the server with the offline AI provider so only our own pipeline is measured:
+
+    cd backend
+    AI_PROVIDER=local BCRYPT_ROUNDS=10 uvicorn app.main:app --workers 4
+    python -m benchmarks.loadtest --stages 10,25,50,100 --duration 60
+
+or let the harness start (and stop) uvicorn itself:
+
+    python -m benchmarks.loadtest --spawn --workers 4 --database-url sqlite:///./load.db
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+from PIL import Image, ImageDraw
+
+# (weight, method, path) for the occasional heavier actions between dashboard polls
+ACTIONS = [
+    (0.10, "POST", "/api/insights/generate"),
+    (0.10, "GET", "/api/insights/recommendations"),
+    (0.05, "GET", "/api/recurring/analyze"),
+    (0.05, "GET", "/api/exports/receipts-csv"),
+    (0.10, "GET", "/api/receipts/search?q=milk"),
+]
+DASHBOARD = [
+    "/api/analytics/dashboard",
+    "/api/receipts/?summary=true&limit=20",
+]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.status: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name: str, seconds: float, status: Optional[int]):
+        self.latencies[name].append(seconds * 1000)
+        if status is None or status >= 400:
+            self.errors[name] += 1
+        self.status[name][status or 0] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(len(v) for v in self.latencies.values())
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def receipt_image(rng: random.Random) -> bytes:
+    """A small, unique receipt-like JPEG so content-addressed storage can't dedupe uploads"""
+    image = Image.new("RGB", (320, 480), "white")
+    draw = ImageDraw.Draw(image)
+    for line in range(12):
+        draw.text((16, 16 + line * 36), f"ITEM {rng.randint(1000, 9999)}  {rng.uniform(1, 40):6.2f}", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=70)
+    return buffer.getvalue()
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, stats: Stats, args, seed: int):
+        self.client = client
+        self.stats = stats
+        self.args = args
+        self.rng = random.Random(seed)
+        self.headers = {}
+
+    async def request(self, name: str, method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=self.headers, **kwargs)
+            # Read the whole body so downloads count toward latency
+            await response.aread()
+        except httpx.HTTPError:
+            self.stats.record(name, time.perf_counter() - started, None)
+            return None
+        self.stats.record(name, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def think(self):
+        await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time) if self.args.think_time > 0 else 0)
+
+    async def login(self) -> bool:
+        tag = uuid.uuid4().hex[:12]
+        credentials = {"email": f"load-{tag}@example.com", "password": "load-test-password"}
+        await self.request("POST /api/auth/register", "POST", "/api/auth/register",
+                           json={**credentials, "username": f"load-{tag}"})
+        response = await self.request("POST /api/auth/login", "POST", "/api/auth/login", json=credentials)
+        if response is None or response.status_code != 200:
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return True
+
+    async def run(self, deadline: float):
+        if not await self.login():
+            return
+
+        await self.request("POST /api/analytics/budgets", "POST", "/api/analytics/budgets",
+                           json={"category": "groceries", "monthly_limit": 400})
+        for _ in range(self.args.uploads):
+            files = {"file": ("receipt.jpg", receipt_image(self.rng), "image/jpeg")}
+            await self.request("POST /api/receipts/upload", "POST", "/api/receipts/upload", files=files)
+            if time.monotonic() >= deadline:
+                return
+
+        while time.monotonic() < deadline:
+            for path in DASHBOARD:
+                await self.request(f"GET {path.split('?')[0]}", "GET", path)
+            for weight, method, path in ACTIONS:
+                if self.rng.random() < weight:
+                    await self.request(f"{method} {path.split('?')[0]}", method, path)
+            await self.think()
+
+
+async def run_stage(args, concurrency: int) -> dict:
+    stats = Stats()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        started = time.monotonic()
+        deadline = started + args.ramp + args.duration
+        tasks = []
+        for i in range(concurrency):
+            # Spread arrivals evenly over the ramp
+            delay = args.ramp * i / concurrency
+            user = VirtualUser(client, stats, args, seed=args.seed * 100003 + concurrency * 1009 + i)
+            tasks.append(asyncio.create_task(_delayed(delay, user.run(deadline))))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+    endpoints = {}
+    for name, samples in sorted(stats.latencies.items()):
+        endpoints[name] = {
+            "requests": len(samples),
+            "errors": stats.errors[name],
+            "error_rate": round(stats.errors[name] / len(samples), 4),
+            "p50_ms": round(statistics.median(samples), 1),
+            "p95_ms": round(percentile(samples, 95), 1),
+            "p99_ms": round(percentile(samples, 99), 1),
+            "status": dict(stats.status[name]),
+        }
+    all_samples = [s for samples in stats.latencies.values() for s in samples]
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 1),
+        "requests": stats.total,
+        "throughput_rps": round(stats.total / elapsed, 1) if elapsed else 0,
+        "error_rate": round(sum(stats.errors.values()) / stats.total, 4) if stats.total else 0,
+        "p50_ms": round(statistics.median(all_samples), 1) if all_samples else None,
+        "p95_ms": round(percentile(all_samples, 95), 1) if all_samples else None,
+        "p99_ms": round(percentile(all_samples, 99), 1) if all_samples else None,
+        "endpoints": endpoints,
+    }
+
+
+async def _delayed(delay: float, coro):
+    await asyncio.sleep(delay)
+    await coro
+
+
+def print_stage(result: dict):
+    print(f"\n=== {result['concurrency']} users: {result['requests']:,} requests in {result['elapsed_s']}s, "
+          f"{result['throughput_rps']} req/s, errors {result['error_rate']:.2%}, "
+          f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms")
+    print(f"  {'endpoint':<42} {'reqs':>7} {'err%':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, e in result["endpoints"].items():
+        print(f"  {name:<42} {e['requests']:>7} {e['error_rate']:>7.2%} "
+              f"{e['p50_ms']:>9} {e['p95_ms']:>9} {e['p99_ms']:>9}")
+
+
+def spawn_server(args) -> subprocess.Popen:
+    workdir = tempfile.mkdtemp(prefix="shopsense-load-")
+    env = {
+        **os.environ,
+        "AI_PROVIDER": "local",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+    }
+    port = args.url.rsplit(":", 1)[-1].strip("/")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", port, "--workers", str(args.workers),
+         "--log-level", "warning"],
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    for _ in range(120):
+        try:
+            if httpx.get(f"{args.url}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("uvicorn did not become healthy")
+
+
+async def main(args):
+    results = []
+    for concurrency in args.stages:
+        result = await run_stage(args, concurrency)
+        print_stage(result)
+        results.append(result)
+
+    print("\nSummary (look for the stage where p95 climbs and throughput stops growing):")
+    print(f"  {'users':>6} {'req/s':>9} {'err%':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for r in results:
+        print(f"  {r['concurrency']:>6} {r['throughput_rps']:>9} {r['error_rate']:>7.2%} "
+              f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"url": args.url, "workers": args.workers, "stages": results}, f, indent=2)
+        print(f"\n✅ Results saved to {args.save}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--stages", default="10,25,50", help="comma-separated concurrency levels")
+    parser.add_argument("--ramp", type=float, default=10.0, help="seconds to reach each stage's concurrency")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to hold each stage after ramp-up")
+    parser.add_argument("--uploads", type=int, default=5, help="receipts uploaded per session")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds between dashboard polls")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write per-stage results as JSON")
+    parser.add_argument("--spawn", action="store_true", help="start uvicorn with AI_PROVIDER=local for the run")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when --spawn is used")
+    parser.add_argument("--database-url", help="DATABASE_URL for the spawned server (default: temp SQLite)")
+    parser.add_argument("--bcrypt-rounds", type=int, default=10, help="BCRYPT_ROUNDS for the spawned server")
+    args = parser.parse_args()
+    args.stages = [int(s) for s in args.stages.split(",")]
+
+    server = spawn_server(args) if args.spawn else None
+    try:
+        asyncio.run(main(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
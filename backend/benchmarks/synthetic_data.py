@@ -0,0 +1,162 @@
+"""
+Deterministic synthetic dataset: N users x M receipts x ~K items.
+
+Stores have their own category mix, products have per-category base prices with
+lognormal noise and slow inflation, and purchase times follow weekday/hour weights,
+so the analytics see shapes close to real uploads. The same seed always produces
+the same rows.
+"""
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+from app.models.database import User, Receipt, Item, Budget
+from app.services.budget_service import rebuild_category_spend
+from app.services.product_service import product_catalog
+from app.services.search_service import rebuild_search_index
+
+# store -> (visit weight, {category: share})
+STORES: Dict[str, Tuple[float, Dict[str, float]]] = {
+    "FreshMart": (5.0, {"groceries": 0.85, "home": 0.1, "health": 0.05}),
+    "Whole Foods": (2.5, {"groceries": 0.9, "health": 0.1}),
+    "Costco": (1.5, {"groceries": 0.6, "home": 0.2, "electronics": 0.1, "clothing": 0.1}),
+    "Target": (2.0, {"home": 0.3, "clothing": 0.3, "groceries": 0.2, "electronics": 0.1, "health": 0.1}),
+    "CVS": (1.2, {"health": 0.8, "groceries": 0.2}),
+    "Shell": (1.5, {"transportation": 0.9, "groceries": 0.1}),
+    "Best Buy": (0.3, {"electronics": 1.0}),
+    "Chipotle": (1.8, {"dining": 1.0}),
+    "Starbucks": (2.2, {"dining": 1.0}),
+    "AMC Theatres": (0.4, {"entertainment": 0.8, "dining": 0.2}),
+}
+
+# category -> [(product name, base price)]
+PRODUCTS: Dict[str, List[Tuple[str, float]]] = {
+    "groceries": [("Organic Bananas", 1.99), ("Whole Milk", 3.49), ("Sourdough Bread", 4.99),
+                  ("Large Eggs", 3.99), ("Chicken Breast", 9.99), ("Baby Spinach", 3.49),
+                  ("Greek Yogurt", 5.49), ("Cheddar Cheese", 4.29), ("Jasmine Rice", 6.99),
+                  ("Ground Coffee", 11.99), ("Pasta", 1.79), ("Tomatoes", 2.99), ("Salmon Fillet", 12.99),
+                  ("Apples", 4.49), ("Orange Juice", 4.99), ("Avocados", 3.99)],
+    "home": [("Paper Towels", 12.99), ("Laundry Detergent", 14.99), ("Dish Soap", 3.99),
+             ("Trash Bags", 9.99), ("Light Bulbs", 8.99)],
+    "health": [("Ibuprofen", 8.99), ("Vitamin D", 10.99), ("Toothpaste", 4.49), ("Shampoo", 6.99)],
+    "electronics": [("USB-C Cable", 14.99), ("AA Batteries", 9.99), ("Headphones", 79.99),
+                    ("Phone Charger", 24.99)],
+    "clothing": [("T-Shirt", 14.99), ("Socks", 9.99), ("Jeans", 39.99), ("Hoodie", 34.99)],
+    "dining": [("Burrito Bowl", 11.50), ("Latte", 5.25), ("Chips & Guac", 4.95), ("Cold Brew", 4.75),
+               ("Croissant", 3.45)],
+    "transportation": [("Regular Gasoline", 45.00), ("Car Wash", 12.00)],
+    "entertainment": [("Movie Ticket", 15.99), ("Popcorn", 8.49)],
+}
+
+WEEKDAY_WEIGHTS = [0.8, 0.8, 0.9, 1.0, 1.3, 1.6, 1.4]  # Monday..Sunday
+HOUR_WEIGHTS = [0, 0, 0, 0, 0, 0, 0.1, 0.4, 0.8, 1.0, 1.1, 1.4, 1.9, 1.5, 1.1, 1.0, 1.3, 1.9, 2.2, 1.7, 1.0, 0.6, 0.2, 0]
+
+BENCHMARK_PASSWORD_HASH = "$2b$04$benchmarkbenchmarkbenuT0p8dYJ8g3y5e9o3pG2v2nq0vU0F1K"
+
+
+@dataclass
+class DatasetSpec:
+    users: int
+    receipts_per_user: int
+    items_per_receipt: int
+    days: int = 730
+    seed: int = 1234
+
+
+def _weighted(rng: random.Random, weights: Dict[str, float]) -> str:
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _purchase_time(rng: random.Random, end: datetime, days: int) -> datetime:
+    while True:
+        day = end - timedelta(days=rng.randrange(days))
+        if rng.random() * max(WEEKDAY_WEIGHTS) <= WEEKDAY_WEIGHTS[day.weekday()]:
+            break
+    hour = rng.choices(range(24), weights=HOUR_WEIGHTS)[0]
+    return day.replace(hour=hour, minute=rng.randrange(60), second=0, microsecond=0)
+
+
+def generate_dataset(db: Session, spec: DatasetSpec, end: datetime = datetime(2026, 1, 1)) -> Dict[str, int]:
+    """Insert the dataset with bulk inserts; returns row counts and the generated user ids"""
+    rng = random.Random(spec.seed)
+    store_names = list(STORES)
+    store_weights = [STORES[s][0] for s in store_names]
+
+    # Resolve each product name once instead of per item row
+    product_ids = {
+        name: product_catalog.resolve(db, name, category)
+        for category, products in PRODUCTS.items()
+        for name, _ in products
+    }
+    db.commit()
+
+    next_user = (db.query(func.max(User.id)).scalar() or 0) + 1
+    next_receipt = (db.query(func.max(Receipt.id)).scalar() or 0) + 1
+
+    users, receipts, items, budgets = [], [], [], []
+    for u in range(spec.users):
+        user_id = next_user + u
+        users.append({
+            "id": user_id,
+            "email": f"bench{user_id}@example.com",
+            "username": f"bench{user_id}",
+            "hashed_password": BENCHMARK_PASSWORD_HASH,
+            "is_active": True,
+            "created_at": end - timedelta(days=spec.days),
+        })
+        for category, limit in (("groceries", 600.0), ("dining", 250.0), ("entertainment", 80.0)):
+            budgets.append({"user_id": user_id, "category": category, "monthly_limit": limit,
+                            "current_spent": 0.0, "last_reset": end})
+
+        for _ in range(spec.receipts_per_user):
+            receipt_id = next_receipt
+            next_receipt += 1
+            store = rng.choices(store_names, weights=store_weights)[0]
+            purchased = _purchase_time(rng, end, spec.days)
+            # ~3%/year inflation relative to the end of the window
+            inflation = 1 - 0.03 * (end - purchased).days / 365
+
+            total = 0.0
+            for _ in range(max(1, int(rng.expovariate(1 / spec.items_per_receipt)) + 1)):
+                category = _weighted(rng, STORES[store][1])
+                name, base = rng.choice(PRODUCTS[category])
+                price = round(base * inflation * rng.lognormvariate(0, 0.12), 2)
+                quantity = 1 if rng.random() < 0.8 else rng.randint(2, 4)
+                total += price * quantity
+                items.append({
+                    "receipt_id": receipt_id,
+                    "name": name,
+                    "price": price,
+                    "quantity": quantity,
+                    "category": category,
+                    "product_id": product_ids[name],
+                })
+
+            receipts.append({
+                "id": receipt_id,
+                "user_id": user_id,
+                "filename": f"synthetic/{receipt_id}.jpg",
+                "upload_date": purchased + timedelta(hours=rng.randint(0, 48)),
+                "store_name": store,
+                "purchase_date": purchased,
+                "total_amount": round(total, 2),
+                "extracted_text": None,
+            })
+
+    for table, rows in ((User, users), (Budget, budgets), (Receipt, receipts), (Item, items)):
+        for start in range(0, len(rows), 5000):
+            db.execute(insert(table), rows[start:start + 5000])
+    db.commit()
+    # Bulk inserts skip the ingest path, so rebuild the budget counters and search index from the rows
+    rebuild_category_spend(db)
+    rebuild_search_index(db)
+    db.commit()
+
+    return {
+        "users": len(users),
+        "receipts": len(receipts),
+        "items": len(items),
+        "user_ids": [u["id"] for u in users],
+    }
@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+
+# Settings are read at import time, so point the app at a scratch database and
+# upload directory before anything from app/ is imported
+_scratch = tempfile.mkdtemp(prefix="shopsense-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_scratch, 'test.db')}")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_scratch, "uploads"))
+os.environ.setdefault("AI_PROVIDER", "local")
+os.environ.setdefault("TRACE_LOG", "false")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("CACHE_URL", "memory://")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import init_db  # noqa: E402
+
+init_db()
@@ -0,0 +1,17 @@
+import json
+
+import pytest
+
+from app.services.ai_service import strip_code_fence
+
+BODY = {"items": [{"name": "Milk", "price": 3.49}]}
+
+
+@pytest.mark.parametrize("reply", [
+    json.dumps(BODY),
+    "```json\n" + json.dumps(BODY) + "\n```",
+    "```\n" + json.dumps(BODY) + "\n```",
+    "  ```json\n" + json.dumps(BODY) + "\n```\nHope this helps!",
+])
+def test_strip_code_fence_returns_the_json(reply):
+    assert json.loads(strip_code_fence(reply)) == BODY
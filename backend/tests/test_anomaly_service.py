@@ -0,0 +1,65 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database import SessionLocal
+from app.models.database import Item, Receipt, User
+from app.services.anomaly_service import detect_anomalies
+
+LATEST = datetime(2025, 6, 30)
+GROCERIES = [("Whole Milk", 3.49), ("Sourdough Bread", 4.99), ("Large Eggs", 3.99), ("Organic Bananas", 1.99),
+             ("Greek Yogurt", 5.49), ("Dish Soap", 3.99), ("Apples", 4.29), ("Rice", 2.79)]
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def _user(db) -> int:
+    name = uuid.uuid4().hex[:8]
+    user = User(email=f"{name}@example.com", username=name, hashed_password="x")
+    db.add(user)
+    db.flush()
+    return user.id
+
+
+def _receipt(db, user_id: int, days_ago: int, store: str, items):
+    receipt = Receipt(user_id=user_id, filename=f"{uuid.uuid4().hex}.jpg", store_name=store,
+                      purchase_date=LATEST - timedelta(days=days_ago))
+    db.add(receipt)
+    db.flush()
+    for name, price, category in items:
+        db.add(Item(receipt_id=receipt.id, name=name, price=price, quantity=1, category=category))
+
+
+def _grocery_history(db, user_id: int):
+    # 16 routine grocery items over two months: two receipts of eight
+    for days_ago in (55, 20):
+        _receipt(db, user_id, days_ago, "FreshMart", [(n, p, "groceries") for n, p in GROCERIES])
+
+
+def test_thin_category_is_not_judged_against_every_item(db):
+    user_id = _user(db)
+    _grocery_history(db, user_id)
+    # The 17th item: the user's first fuel purchase, priced far above any grocery
+    _receipt(db, user_id, 0, "Shell", [("Regular Gasoline", 45.00, "transportation")])
+    db.commit()
+
+    findings = detect_anomalies(db, user_id)
+    assert [a.subject for a in findings["purchases"]] == []
+
+
+def test_outlier_within_a_sampled_category_is_flagged(db):
+    user_id = _user(db)
+    _grocery_history(db, user_id)
+    _receipt(db, user_id, 0, "FreshMart", [("Wagyu Steak", 64.00, "groceries")])
+    db.commit()
+
+    purchases = detect_anomalies(db, user_id)["purchases"]
+    assert [a.subject for a in purchases] == ["Wagyu Steak"]
+    assert purchases[0].basis == "a groceries item"
+    assert purchases[0].observations == 17
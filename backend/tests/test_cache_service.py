@@ -0,0 +1,139 @@
+import asyncio
+import datetime
+import time
+
+import pytest
+
+from app.services.cache_service import MemoryCache, RedisCache, SQLiteCache
+from app.services.prompt_cache import PromptCache
+
+fakeredis = pytest.importorskip("fakeredis")
+
+VALUE = {"pair": (1, 2), "day": datetime.date(2025, 1, 2), "amount": 1.5}
+# What every backend hands back for VALUE: its JSON round trip
+DECODED = {"pair": [1, 2], "day": "2025-01-02", "amount": 1.5}
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_workers(redis_server):
+    """Two RedisCache instances on one server, standing in for two app workers"""
+    workers = []
+
+    def make(**kwargs):
+        worker = RedisCache(client=fakeredis.FakeRedis(server=redis_server), **kwargs)
+        workers.append(worker)
+        return worker
+
+    yield make
+    for worker in workers:
+        worker.close()
+
+
+def _wait_for(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path, redis_workers):
+    if request.param == "memory":
+        return MemoryCache(16)
+    if request.param == "sqlite":
+        return SQLiteCache(str(tmp_path / "cache.db"), 16)
+    return redis_workers()
+
+
+def test_backends_return_the_same_types(backend):
+    async def scenario():
+        key = await backend.versioned_key("user:1", "dashboard")
+        await backend.set(key, VALUE, 60)
+        first = await backend.get(key)
+        first["pair"].append(3)
+        return first, await backend.get(key)
+
+    first, second = asyncio.run(scenario())
+    assert second == DECODED
+    assert first["pair"] == [1, 2, 3]
+
+
+def test_bump_orphans_entries_and_ttl_expires(backend):
+    async def scenario():
+        key = await backend.versioned_key("user:1", "dashboard")
+        await backend.set(key, {"total": 1}, 60)
+        await backend.bump("user:1")
+        await backend.set("short", 1, 0.05)
+        await asyncio.sleep(0.1)
+        return await backend.get(await backend.versioned_key("user:1", "dashboard")), await backend.get("short")
+
+    assert asyncio.run(scenario()) == (None, None)
+
+
+def test_redis_bump_reaches_other_workers_through_pubsub(redis_workers):
+    # A trusts its local version copy for an hour, so only the broadcast can move it
+    a = redis_workers(version_ttl_seconds=3600)
+    b = redis_workers(version_ttl_seconds=3600)
+    key = a.versioned_key_sync("user:7", "dashboard")
+    a.set_sync(key, {"total": 10}, 60)
+    assert b.get_sync(b.versioned_key_sync("user:7", "dashboard")) == {"total": 10}
+
+    assert b.bump_sync("user:7") == 1
+    assert _wait_for(lambda: a.version_sync("user:7") == 1)
+    assert a.get_sync(a.versioned_key_sync("user:7", "dashboard")) is None
+
+
+def test_redis_rereads_versions_when_a_broadcast_is_missed(redis_workers, redis_server):
+    a = redis_workers(version_ttl_seconds=0.1)
+    assert a.version_sync("user:8") == 0
+    # Incremented without a publish, as if the message was lost
+    fakeredis.FakeRedis(server=redis_server).incr(RedisCache.VERSION_PREFIX + "user:8")
+    assert a.version_sync("user:8") == 0
+    time.sleep(0.15)
+    assert asyncio.run(a.version("user:8")) == 1
+
+
+def test_redis_clear_leaves_versions_and_foreign_keys(redis_workers, redis_server):
+    a = redis_workers()
+    other = fakeredis.FakeRedis(server=redis_server)
+    other.set("someone-else", "x")
+    a.bump_sync("user:9")
+    a.set_sync("entry", 1, 60)
+    a.clear_sync()
+    assert a.get_sync("entry") is None
+    assert other.get("someone-else") == b"x"
+    assert a.version_sync("user:9") == 1
+
+
+def test_memory_versions_are_bounded_without_reviving_stale_entries():
+    cache = MemoryCache(max_entries=2)
+    cache.bump_sync("user:1")
+    stale = cache.versioned_key_sync("user:1", "dashboard")
+    cache.set_sync(stale, "old", 60)
+    for user in range(2, 6):
+        cache.bump_sync(f"user:{user}")
+    assert len(cache._versions) == 2
+    # user:1's version was evicted; it must not read a version it cached under
+    assert cache.versioned_key_sync("user:1", "dashboard") != stale
+
+
+def test_prompt_cache_is_shared_between_redis_workers(redis_workers):
+    a = PromptCache(redis_workers(), ttl_seconds=60)
+    b = PromptCache(redis_workers(), ttl_seconds=60)
+    key = PromptCache.key("analyze", "model", {"receipts": [1, 2]})
+
+    async def scenario():
+        await a.set(key, {"top_categories": ["groceries"]})
+        hit = await b.get(key)
+        await b.clear()
+        return hit
+
+    assert asyncio.run(scenario()) == {"top_categories": ["groceries"]}
+    assert _wait_for(lambda: a.get_sync(key) is None)
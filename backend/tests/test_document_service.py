@@ -0,0 +1,78 @@
+import asyncio
+import io
+import json
+import time
+
+from PIL import Image
+
+from app.services import document_service
+from app.services.ai_service import ai_service
+from app.services.document_service import PdfPage, extract_pdf_receipts
+
+LATENCY = 0.3
+# At most 4 at once: the default thread pool has min(32, cpus + 4) workers
+PAGES = 4
+
+
+class SlowGeminiModel:
+    """Stands in for the Gemini SDK: a blocking call that takes LATENCY seconds"""
+
+    def generate_content(self, parts):
+        time.sleep(LATENCY)
+        body = {"store_name": "Scan Mart", "purchase_date": "2025-01-02", "total_amount": 2.5,
+                "items": [{"name": "Apples", "price": 2.5, "quantity": 1, "category": "groceries"}]}
+        return type("Response", (), {"text": "```json\n" + json.dumps(body) + "\n```"})()
+
+
+def _png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _run(monkeypatch, tmp_path, concurrency):
+    image = _png()
+    pages = [PdfPage(number=n, text="", image=image, image_ext=".png") for n in range(1, PAGES + 1)]
+    monkeypatch.setattr(document_service, "read_pdf_pages", lambda path: pages)
+    monkeypatch.setattr(ai_service, "provider", "gemini")
+    monkeypatch.setattr(ai_service, "gemini_vision_model", SlowGeminiModel(), raising=False)
+    monkeypatch.setattr(ai_service, "gemini_model_name", "fake-gemini", raising=False)
+
+    async def scenario():
+        # Longest the event loop went without running this ticker
+        stalls = []
+
+        async def ticker():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                stalls.append(now - last)
+                last = now
+
+        ticking = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        receipts = await extract_pdf_receipts("unused.pdf", str(tmp_path), concurrency=concurrency)
+        elapsed = time.perf_counter() - started
+        ticking.cancel()
+        return receipts, elapsed, max(stalls)
+
+    return asyncio.run(scenario())
+
+
+def test_scanned_pages_overlap_up_to_the_concurrency_limit(monkeypatch, tmp_path):
+    receipts, elapsed, stall = _run(monkeypatch, tmp_path, concurrency=2)
+    assert len(receipts) == PAGES
+    assert all(r["store_name"] == "Scan Mart" for r in receipts)
+    # Two waves of two, not four calls in a row
+    assert elapsed < LATENCY * 2 + 0.25
+    # The blocking SDK call ran in a worker thread, so the loop kept serving
+    assert stall < LATENCY / 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_wall_time_follows_concurrency_not_page_count(monkeypatch, tmp_path):
+    _, serial, _ = _run(monkeypatch, tmp_path, concurrency=1)
+    _, parallel, _ = _run(monkeypatch, tmp_path, concurrency=PAGES)
+    assert serial >= LATENCY * PAGES
+    assert parallel < LATENCY + 0.25
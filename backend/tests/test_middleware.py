@@ -0,0 +1,22 @@
+from app.main import app
+from app.middleware.metrics import MetricsMiddleware
+
+
+def test_metrics_middleware_is_outermost():
+    # Starlette runs the last-added middleware first
+    assert app.user_middleware[0].cls is MetricsMiddleware
+
+
+def test_trace_log_skips_scrapes_and_event_streams(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.middleware import tracing as tracing_middleware
+
+    logged = []
+    monkeypatch.setattr(tracing_middleware, "log_trace", lambda trace, method, path, status: logged.append(path))
+    client = TestClient(app)
+    response = client.get("/metrics")
+    client.get("/api/events/anything")
+    client.get("/health")
+
+    assert response.headers["X-Request-ID"]
+    assert logged == ["/health"]
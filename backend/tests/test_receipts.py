@@ -0,0 +1,28 @@
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def _client():
+    client = TestClient(app)
+    name = uuid.uuid4().hex[:8]
+    client.post("/api/auth/register", json={"email": f"{name}@example.com", "username": name, "password": "pw"})
+    token = client.post("/api/auth/login", json={"email": f"{name}@example.com", "password": "pw"}).json()["access_token"]
+    client.headers["Authorization"] = f"Bearer {token}"
+    return client
+
+
+def test_summary_listing_matches_full_listing_fields():
+    client = _client()
+    upload = client.post("/api/receipts/upload", files={"file": ("corner-shop.jpg", uuid.uuid4().bytes, "image/jpeg")})
+    assert upload.status_code == 200
+
+    full = client.get("/api/receipts/").json()["receipts"][0]
+    summary = client.get("/api/receipts/", params={"summary": "true"}).json()["receipts"][0]
+
+    assert summary["original_filename"] == full["original_filename"] == "corner-shop.jpg"
+    assert summary["item_count"] == len(full["items"])
+    for field in ("id", "filename", "store_name", "purchase_date", "total_amount", "image_url"):
+        assert summary[field] == full[field]
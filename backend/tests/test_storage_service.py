@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import io
+import os
+import uuid
+
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from starlette.datastructures import Headers
+
+from app.database import AsyncSessionLocal
+from app.models.database import StoredFile
+from app.services.storage_service import LocalStorageBackend, ReceiptStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return ReceiptStorage(LocalStorageBackend(str(tmp_path / "uploads")), tmp_dir=str(tmp_path / "uploads" / ".tmp"))
+
+
+def _content() -> bytes:
+    # Unique per test, so each works on its own content address
+    return b"receipt-" + uuid.uuid4().bytes
+
+
+def _upload(data: bytes) -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename="receipt.jpg", headers=Headers({"content-type": "image/jpeg"}))
+
+
+async def _row(key: str):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(StoredFile).where(StoredFile.key == key))).scalar_one_or_none()
+
+
+async def _commit_receipt(storage: ReceiptStorage, stored):
+    """What _persist_receipt does to the blob, committed like the upload route"""
+    async with AsyncSessionLocal() as db:
+        await storage.retain(db, stored)
+        await db.commit()
+
+
+async def _delete_receipt(storage: ReceiptStorage, key: str):
+    """What delete_receipt does: release, commit, then remove once unreferenced"""
+    async with AsyncSessionLocal() as db:
+        remaining = await storage.release(db, key)
+        await db.commit()
+    if remaining == 0:
+        await storage.remove(key)
+
+
+def test_concurrent_identical_uploads_share_one_blob(storage):
+    data = _content()
+
+    async def scenario():
+        first, second = await asyncio.gather(storage.save_upload(_upload(data)), storage.save_upload(_upload(data)))
+        claimed = await _row(first.key)
+        await asyncio.gather(_commit_receipt(storage, first), _commit_receipt(storage, second))
+        return first, second, claimed, await _row(first.key)
+
+    first, second, claimed, committed = asyncio.run(scenario())
+    assert first.key == second.key
+    assert sorted([first.created, second.created]) == [False, True]
+    assert (claimed.ref_count, claimed.pending_claims) == (0, 2)
+    assert (committed.ref_count, committed.pending_claims) == (2, 0)
+    assert os.path.isfile(storage.local_path(first.key))
+
+
+class _RacingBackend(LocalStorageBackend):
+    """Both uploads look before either has written, the window the exclusive write closes"""
+
+    async def exists(self, key: str) -> bool:
+        return False
+
+
+def test_identical_uploads_racing_past_exists_store_once(tmp_path):
+    storage = ReceiptStorage(_RacingBackend(str(tmp_path / "uploads")), tmp_dir=str(tmp_path / "uploads" / ".tmp"))
+    data = _content()
+
+    async def scenario():
+        return await asyncio.gather(storage.save_upload(_upload(data)), storage.save_upload(_upload(data)))
+
+    first, second = asyncio.run(scenario())
+    assert sorted([first.created, second.created]) == [False, True]
+    with open(storage.local_path(first.key), "rb") as f:
+        assert f.read() == data
+    assert os.listdir(tmp_path / "uploads" / ".tmp") == []
+
+
+def test_delete_during_pending_claim_keeps_the_blob(storage):
+    data = _content()
+
+    async def scenario():
+        first = await storage.save_upload(_upload(data))
+        await _commit_receipt(storage, first)
+        # A second upload of the same bytes is still extracting when the first receipt is deleted
+        second = await storage.save_upload(_upload(data))
+        await _delete_receipt(storage, first.key)
+        during = await _row(first.key), os.path.isfile(storage.local_path(first.key))
+        await _commit_receipt(storage, second)
+        return first, second, during, await _row(first.key)
+
+    first, second, (during_row, during_file), after = asyncio.run(scenario())
+    assert second.created is False
+    assert (during_row.ref_count, during_row.pending_claims) == (0, 1)
+    assert during_file
+    assert (after.ref_count, after.pending_claims) == (1, 0)
+    assert os.path.isfile(storage.local_path(first.key))
+
+
+def test_delete_then_discarded_claim_removes_the_blob(storage):
+    data = _content()
+
+    async def scenario():
+        first = await storage.save_upload(_upload(data))
+        await _commit_receipt(storage, first)
+        second = await storage.save_upload(_upload(data))
+        await _delete_receipt(storage, first.key)
+        # The second upload's extraction fails: nothing references the blob any more
+        await storage.discard(second)
+        return first, await _row(first.key)
+
+    first, row = asyncio.run(scenario())
+    assert row is None
+    assert not os.path.exists(storage.local_path(first.key))
+
+
+def test_discard_after_failed_extraction(storage):
+    fresh, shared = _content(), _content()
+
+    async def scenario():
+        # New content: the blob and its row go
+        new = await storage.save_upload(_upload(fresh))
+        await storage.discard(new)
+        # Content another receipt already uses: only the claim goes
+        kept = await storage.save_upload(_upload(shared))
+        await _commit_receipt(storage, kept)
+        duplicate = await storage.save_upload(_upload(shared))
+        await storage.discard(duplicate)
+        return new, await _row(new.key), kept, await _row(kept.key)
+
+    new, new_row, kept, kept_row = asyncio.run(scenario())
+    assert new.created and new_row is None
+    assert not os.path.exists(storage.local_path(new.key))
+    assert (kept_row.ref_count, kept_row.pending_claims) == (1, 0)
+    assert os.path.isfile(storage.local_path(kept.key))
+    assert os.listdir(storage.tmp_dir) == []
+
+
+def test_upload_route_discards_when_extraction_fails(monkeypatch):
+    from app.main import app
+    from app.services.ai_service import ai_service
+    from app.services.storage_service import receipt_storage
+
+    client = TestClient(app)
+    name = uuid.uuid4().hex[:8]
+    client.post("/api/auth/register", json={"email": f"{name}@example.com", "username": name, "password": "pw"})
+    token = client.post("/api/auth/login", json={"email": f"{name}@example.com", "password": "pw"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    data = _content()
+
+    kept = client.post("/api/receipts/upload", files={"file": ("a.jpg", data, "image/jpeg")}, headers=headers)
+    assert kept.status_code == 200
+    key = kept.json()["filename"]
+
+    async def failing_extraction(*args, **kwargs):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(ai_service, "extract_receipt_data", failing_extraction)
+    duplicate = client.post("/api/receipts/upload", files={"file": ("b.jpg", data, "image/jpeg")}, headers=headers)
+    fresh_data = _content()
+    fresh = client.post("/api/receipts/upload", files={"file": ("c.jpg", fresh_data, "image/jpeg")}, headers=headers)
+    assert duplicate.status_code == 500 and fresh.status_code == 500
+
+    row = asyncio.run(_row(key))
+    assert (row.ref_count, row.pending_claims) == (1, 0)
+    assert os.path.isfile(receipt_storage.local_path(key))
+    fresh_key = ReceiptStorage.key_for(hashlib.sha256(fresh_data).hexdigest(), "c.jpg")
+    assert asyncio.run(_row(fresh_key)) is None
+    assert not os.path.exists(receipt_storage.local_path(fresh_key))
+    assert os.listdir(receipt_storage.tmp_dir) == []
@@ -3,7 +3,7 @@ import { motion } from 'framer-motion';
 import { Link } from 'react-router-dom';
 import { FiDollarSign, FiShoppingCart, FiTrendingUp, FiPackage, FiAlertTriangle, FiDownload } from 'react-icons/fi';
 import { LineChart, Line, BarChart, Bar, PieChart, Pie, Cell, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
-import { getSpendingAnalytics, getCategoryBreakdown, getBudgets } from '../services/api';
+import { getDashboard, subscribeToEvents } from '../services/api';
 import BudgetAlert from './BudgetAlert';
 import RecurringExpenses from './RecurringExpenses';
 
@@ -18,16 +18,21 @@ const Dashboard = () => {
 
   useEffect(() => {
     loadData();
+    // Other tabs and uploads push fresh aggregates; apply them instead of re-fetching
+    return subscribeToEvents((event, data) => {
+      if (data.spending) setAnalytics(data.spending);
+      if (data.categories) setCategories(data.categories);
+      if (data.budgets) {
+        setBudgets(data.budgets);
+        checkBudgetAlerts(data.budgets);
+      }
+    });
   }, []);
 
   const loadData = async () => {
     try {
-      const [analyticsData, categoriesData, budgetsData] = await Promise.all([
-        getSpendingAnalytics(),
-        getCategoryBreakdown(),
-        getBudgets()
-      ]);
-      setAnalytics(analyticsData);
+      const { spending, categories: categoriesData, budgets: budgetsData } = await getDashboard();
+      setAnalytics(spending);
       setCategories(categoriesData);
       setBudgets(budgetsData);
       
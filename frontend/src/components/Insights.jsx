@@ -1,16 +1,21 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { motion } from 'framer-motion';
-import { FiZap, FiTrendingUp, FiRefreshCw } from 'react-icons/fi';
-import { getInsights, getRecommendations, generateInsights } from '../services/api';
+import { FiZap, FiTrendingUp, FiRefreshCw, FiMapPin, FiActivity } from 'react-icons/fi';
+import { getInsights, getRecommendations, generateInsights, subscribeToEvents } from '../services/api';
 
 const Insights = () => {
   const [insights, setInsights] = useState([]);
   const [recommendations, setRecommendations] = useState([]);
   const [generating, setGenerating] = useState(false);
   const [loading, setLoading] = useState(true);
+  // This tab reloads after its own generate call; only react to insights made elsewhere
+  const generatingRef = useRef(false);
 
   useEffect(() => {
     loadData();
+    return subscribeToEvents((event) => {
+      if (event === 'insights_ready' && !generatingRef.current) loadData();
+    });
   }, []);
 
   const loadData = async () => {
@@ -19,7 +24,7 @@ const Insights = () => {
         getInsights(),
         getRecommendations()
       ]);
-      setInsights(insightsData);
+      setInsights(insightsData.insights);
       setRecommendations(recsData);
     } catch (error) {
       console.error('Error loading insights:', error);
@@ -30,6 +35,7 @@ const Insights = () => {
 
   const handleGenerate = async () => {
     setGenerating(true);
+    generatingRef.current = true;
     try {
       await generateInsights();
       await loadData();
@@ -37,6 +43,7 @@ const Insights = () => {
       console.error('Error generating insights:', error);
     } finally {
       setGenerating(false);
+      generatingRef.current = false;
     }
   };
 
@@ -44,6 +51,8 @@ const Insights = () => {
     switch (type) {
       case 'impulse': return FiZap;
       case 'trend': return FiTrendingUp;
+      case 'store': return FiMapPin;
+      case 'spike': return FiActivity;
       default: return FiZap;
     }
   };
@@ -145,6 +154,9 @@ const Insights = () => {
                       {insight.amount && (
                         <p className="text-sm text-white/50 mt-2">Amount: ${insight.amount.toFixed(2)}</p>
                       )}
+                      {insight.score != null && (
+                        <p className="text-xs text-white/40 mt-1">Anomaly score: {insight.score.toFixed(1)}</p>
+                      )}
                     </div>
                   </div>
                 </motion.div>
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { FiX, FiShoppingCart, FiCalendar, FiDollarSign, FiPackage, FiLoader } from 'react-icons/fi';
-import { getReceiptDetail } from '../services/api';
+import { getReceiptDetail, mediaUrl } from '../services/api';
 
 const CATEGORY_COLORS = {
   groceries: 'bg-green-500/20 text-green-400',
@@ -81,6 +81,18 @@ const ReceiptDetailModal = ({ receiptId, onClose }) => {
           {receipt && !loading && (
             <div className="space-y-6">
 
+              {/* Receipt Image — 1024px preview, full original on click */}
+              {receipt.preview_url && (
+                <a href={mediaUrl(receipt.image_url)} target="_blank" rel="noreferrer">
+                  <img
+                    src={mediaUrl(receipt.preview_url)}
+                    alt="Receipt"
+                    className="w-full max-h-80 object-contain rounded-xl bg-black/20"
+                    onError={(e) => { e.currentTarget.style.display = 'none'; }}
+                  />
+                </a>
+              )}
+
               {/* Receipt Info Cards */}
               <div className="grid grid-cols-1 md:grid-cols-3 gap-4">
                 <div className="bg-white/5 rounded-xl p-4 flex items-center gap-3">
@@ -176,7 +188,7 @@ const ReceiptDetailModal = ({ receiptId, onClose }) => {
 
               {/* Footer */}
               <div className="flex justify-between items-center pt-2 border-t border-white/10 text-xs text-white/40">
-                <span>File: {receipt.filename}</span>
+                <span>File: {receipt.original_filename || receipt.filename}</span>
                 <span>Uploaded: {new Date(receipt.upload_date).toLocaleDateString()}</span>
               </div>
 
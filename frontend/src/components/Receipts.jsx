@@ -1,13 +1,16 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef, useCallback } from 'react';
 import { motion } from 'framer-motion';
 import { FiFile, FiTrash2, FiCalendar, FiDollarSign, FiEye } from 'react-icons/fi';
-import { getReceipts, deleteReceipt } from '../services/api';
+import { getReceipts, deleteReceipt, mediaUrl } from '../services/api';
 import ReceiptDetailModal from './ReceiptDetailModal';
 
 const Receipts = () => {
   const [receipts, setReceipts] = useState([]);
   const [loading, setLoading] = useState(true);
   const [selectedReceiptId, setSelectedReceiptId] = useState(null); // 👈 added
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const sentinelRef = useRef(null);
 
   useEffect(() => {
     loadReceipts();
@@ -16,7 +19,8 @@ const Receipts = () => {
   const loadReceipts = async () => {
     try {
       const data = await getReceipts();
-      setReceipts(data);
+      setReceipts(data.receipts);
+      setNextCursor(data.next_cursor);
     } catch (error) {
       console.error('Error loading receipts:', error);
     } finally {
@@ -24,6 +28,31 @@ const Receipts = () => {
     }
   };
 
+  // Each page is fetched by cursor, so deep scrolling costs the same as the first page
+  const loadMore = useCallback(async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const data = await getReceipts(nextCursor);
+      setReceipts(prev => [...prev, ...data.receipts]);
+      setNextCursor(data.next_cursor);
+    } catch (error) {
+      console.error('Error loading more receipts:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [nextCursor, loadingMore]);
+
+  useEffect(() => {
+    const sentinel = sentinelRef.current;
+    if (!sentinel || !nextCursor) return;
+    const observer = new IntersectionObserver(entries => {
+      if (entries[0].isIntersecting) loadMore();
+    }, { rootMargin: '400px' });
+    observer.observe(sentinel);
+    return () => observer.disconnect();
+  }, [loadMore, nextCursor]);
+
   const handleDelete = async (e, id) => {
     e.stopPropagation(); // 👈 prevent modal opening when clicking delete
     if (!confirm('Are you sure you want to delete this receipt?')) return;
@@ -67,15 +96,25 @@ const Receipts = () => {
               key={receipt.id}
               initial={{ opacity: 0, y: 20 }}
               animate={{ opacity: 1, y: 0 }}
-              transition={{ delay: index * 0.05 }}
+              transition={{ delay: (index % 20) * 0.05 }}
               onClick={() => setSelectedReceiptId(receipt.id)} // 👈 open modal on click
               className="glass-card p-6 hover:scale-102 cursor-pointer hover:bg-white/15 transition-all" // 👈 cursor pointer
             >
               <div className="flex items-start justify-between">
                 <div className="flex-1">
                   <div className="flex items-center gap-3 mb-3">
-                    <div className="w-12 h-12 rounded-xl bg-gradient-to-br from-blue-500/30 to-cyan-500/30 flex items-center justify-center">
-                      <FiFile className="text-2xl" />
+                    <div className="w-12 h-12 rounded-xl bg-gradient-to-br from-blue-500/30 to-cyan-500/30 flex items-center justify-center overflow-hidden">
+                      {receipt.thumbnail_url ? (
+                        <img
+                          src={mediaUrl(receipt.thumbnail_url)}
+                          alt=""
+                          loading="lazy"
+                          className="w-full h-full object-cover"
+                          onError={(e) => { e.currentTarget.style.display = 'none'; }}
+                        />
+                      ) : (
+                        <FiFile className="text-2xl" />
+                      )}
                     </div>
                     <div>
                       <h3 className="font-bold text-lg">{receipt.store_name || 'Unknown Store'}</h3>
@@ -139,6 +178,13 @@ const Receipts = () => {
               </div>
             </motion.div>
           ))}
+          {/* Infinite scroll sentinel */}
+          <div ref={sentinelRef} className="h-1" />
+          {loadingMore && (
+            <div className="flex justify-center py-4">
+              <div className="animate-spin rounded-full h-8 w-8 border-4 border-white/20 border-t-white"></div>
+            </div>
+          )}
         </div>
       )}
 
@@ -1,12 +1,22 @@
 import React, { useState, useCallback } from 'react';
 import { useDropzone } from 'react-dropzone';
 import { FiUpload, FiCheckCircle, FiAlertCircle } from 'react-icons/fi';
-import { uploadReceipt } from '../services/api';
+import { uploadReceiptStream, uploadReceiptPdf } from '../services/api';
 import { motion } from 'framer-motion';
 
+const STAGES = [
+  { event: 'stored', label: 'Uploaded' },
+  { event: 'preprocessed', label: 'Image checked' },
+  { event: 'extraction_started', label: 'Reading receipt' },
+  { event: 'extracted', label: 'Extracted' },
+  { event: 'persisted', label: 'Saved' },
+];
+
 const Upload = ({ onUploadSuccess }) => {
   const [uploading, setUploading] = useState(false);
   const [uploadStatus, setUploadStatus] = useState(null);
+  const [stage, setStage] = useState(null);
+  const [items, setItems] = useState([]);
 
   const onDrop = useCallback(async (acceptedFiles) => {
     if (acceptedFiles.length === 0) return;
@@ -14,9 +24,25 @@ const Upload = ({ onUploadSuccess }) => {
     const file = acceptedFiles[0];
     setUploading(true);
     setUploadStatus(null);
+    setStage(null);
+    setItems([]);
 
     try {
-      const result = await uploadReceipt(file);
+      if (file.type === 'application/pdf') {
+        const receipts = await uploadReceiptPdf(file);
+        setUploadStatus({
+          type: 'success',
+          message: receipts.length === 1 ? 'Receipt uploaded successfully!' : `${receipts.length} receipts imported from PDF!`
+        });
+        if (onUploadSuccess) receipts.forEach(onUploadSuccess);
+        setTimeout(() => setUploadStatus(null), 3000);
+        return;
+      }
+
+      const result = await uploadReceiptStream(file, (event, data) => {
+        if (event === 'item') setItems((prev) => [...prev, data]);
+        else if (STAGES.some((s) => s.event === event)) setStage(event);
+      });
       setUploadStatus({ type: 'success', message: 'Receipt uploaded successfully!' });
       if (onUploadSuccess) onUploadSuccess(result);
       
@@ -25,7 +51,7 @@ const Upload = ({ onUploadSuccess }) => {
     } catch (error) {
       setUploadStatus({ 
         type: 'error', 
-        message: error.response?.data?.detail || 'Failed to upload receipt' 
+        message: error.response?.data?.detail || error.message || 'Failed to upload receipt' 
       });
     } finally {
       setUploading(false);
@@ -35,7 +61,8 @@ const Upload = ({ onUploadSuccess }) => {
   const { getRootProps, getInputProps, isDragActive } = useDropzone({
     onDrop,
     accept: {
-      'image/*': ['.png', '.jpg', '.jpeg', '.gif', '.webp']
+      'image/*': ['.png', '.jpg', '.jpeg', '.gif', '.webp'],
+      'application/pdf': ['.pdf']
     },
     multiple: false
   });
@@ -66,7 +93,36 @@ const Upload = ({ onUploadSuccess }) => {
             <div className="space-y-4">
               <div className="animate-spin rounded-full h-12 w-12 mx-auto border-4 border-white/20 border-t-white"></div>
               <p className="text-xl font-semibold">Processing receipt...</p>
-              <p className="text-white/70">AI is extracting your shopping data</p>
+              <div className="flex justify-center gap-2 flex-wrap text-sm">
+                {STAGES.map((s, i) => {
+                  const reached = stage && i <= STAGES.findIndex((x) => x.event === stage);
+                  return (
+                    <span
+                      key={s.event}
+                      className={`px-3 py-1 rounded-full ${reached ? 'bg-purple-500/40 text-white' : 'bg-white/10 text-white/50'}`}
+                    >
+                      {s.label}
+                    </span>
+                  );
+                })}
+              </div>
+              {items.length > 0 ? (
+                <ul className="text-left max-w-sm mx-auto space-y-1">
+                  {items.map((item, i) => (
+                    <motion.li
+                      key={i}
+                      initial={{ opacity: 0, x: -10 }}
+                      animate={{ opacity: 1, x: 0 }}
+                      className="flex justify-between text-white/80"
+                    >
+                      <span>{item.name}</span>
+                      <span>${Number(item.price).toFixed(2)}</span>
+                    </motion.li>
+                  ))}
+                </ul>
+              ) : (
+                <p className="text-white/70">AI is extracting your shopping data</p>
+              )}
             </div>
           ) : (
             <div className="space-y-4">
@@ -74,10 +130,10 @@ const Upload = ({ onUploadSuccess }) => {
                 {isDragActive ? 'Drop your receipt here!' : 'Upload Receipt'}
               </h3>
               <p className="text-white/70 text-lg">
-                Drag & drop a receipt image, or click to browse
+                Drag & drop a receipt image or PDF, or click to browse
               </p>
               <p className="text-white/50 text-sm">
-                Supports: PNG, JPG, JPEG, GIF, WEBP
+                Supports: PNG, JPG, JPEG, GIF, WEBP, PDF
               </p>
             </div>
           )}
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { motion } from 'framer-motion';
 import { FiPlus, FiTrash2, FiDollarSign } from 'react-icons/fi';
-import { getBudgets, createBudget, deleteBudget, getCategoryBreakdown } from '../services/api';
+import { getBudgets, createBudget, deleteBudget, getCategoryBreakdown, subscribeToEvents } from '../services/api';
 
 const Budgets = () => {
   const [budgets, setBudgets] = useState([]);
@@ -19,6 +19,9 @@ const Budgets = () => {
   useEffect(() => {
     loadBudgets();
     loadCategories();
+    return subscribeToEvents((event, data) => {
+      if (data.budgets) setBudgets(data.budgets);
+    });
   }, []);
 
   const loadBudgets = async () => {
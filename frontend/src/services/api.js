@@ -18,6 +18,9 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// Receipt images are served from the API host (thumbnail_url, preview_url, image_url)
+export const mediaUrl = (path) => (path ? `${API_BASE_URL}${path}` : null);
+
 // Receipts
 export const uploadReceipt = async (file) => {
   const formData = new FormData();
@@ -28,8 +31,99 @@ export const uploadReceipt = async (file) => {
   return response.data;
 };
 
-export const getReceipts = async () => {
-  const response = await api.get('/api/receipts/');
+// PDF e-receipts/invoices; resolves with every receipt found in the document
+export const uploadReceiptPdf = async (file) => {
+  const formData = new FormData();
+  formData.append('file', file);
+  const response = await api.post('/api/receipts/upload/pdf', formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+  });
+  return response.data;
+};
+
+// Parses a text/event-stream body, calling onFrame(event, data) with JSON-decoded data.
+// Comment frames (keepalives) are skipped.
+const readEventStream = async (response, onFrame) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = 'message';
+      let data = '';
+      for (const line of frame.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      if (data) onFrame(event, JSON.parse(data));
+    }
+  }
+};
+
+// Same upload, but reports progress: onEvent(event, data) fires for each server-sent
+// stage (stored, preprocessed, extraction_started, item, extracted, persisted, error).
+// Resolves with the saved receipt from the "persisted" event.
+export const uploadReceiptStream = async (file, onEvent) => {
+  const formData = new FormData();
+  formData.append('file', file);
+  const token = localStorage.getItem('token');
+  // axios can't read a response body incrementally in the browser, so use fetch here
+  const response = await fetch(`${API_BASE_URL}/api/receipts/upload/stream`, {
+    method: 'POST',
+    body: formData,
+    headers: token ? { Authorization: `Bearer ${token}` } : {},
+  });
+  if (!response.ok) {
+    const body = await response.json().catch(() => ({}));
+    throw new Error(body.detail || 'Failed to upload receipt');
+  }
+
+  let receipt = null;
+  await readEventStream(response, (event, payload) => {
+    if (onEvent) onEvent(event, payload);
+    if (event === 'error') throw new Error(payload?.detail || 'Failed to process receipt');
+    if (event === 'persisted') receipt = payload;
+  });
+  if (!receipt) throw new Error('Upload ended before the receipt was saved');
+  return receipt;
+};
+
+// Live dashboard events for the logged-in user (receipt_added, receipt_deleted,
+// budget_changed, insights_ready). Reconnects after drops; call the returned
+// function to close the stream.
+export const subscribeToEvents = (onEvent, { retryMs = 5000 } = {}) => {
+  const controller = new AbortController();
+  const connect = async () => {
+    while (!controller.signal.aborted) {
+      try {
+        const token = localStorage.getItem('token');
+        const response = await fetch(`${API_BASE_URL}/api/events`, {
+          headers: token ? { Authorization: `Bearer ${token}` } : {},
+          signal: controller.signal,
+        });
+        if (response.status === 401) return;
+        if (response.ok) await readEventStream(response, onEvent);
+      } catch (error) {
+        if (controller.signal.aborted) return;
+      }
+      await new Promise((resolve) => setTimeout(resolve, retryMs));
+    }
+  };
+  connect();
+  return () => controller.abort();
+};
+
+// Returns { receipts, next_cursor } — pass next_cursor back to fetch the following page
+export const getReceipts = async (cursor = null, { limit = 20, summary = false } = {}) => {
+  const response = await api.get('/api/receipts/', {
+    params: { limit, summary, ...(cursor ? { cursor } : {}) },
+  });
   return response.data;
 };
 
@@ -49,6 +143,14 @@ export const getSpendingAnalytics = async () => {
   return response.data;
 };
 
+// Several analytics sections in one request; fields is any of 'spending', 'categories', 'budgets'
+export const getDashboard = async (fields = null) => {
+  const response = await api.get('/api/analytics/dashboard', {
+    params: fields ? { fields: fields.join(',') } : {},
+  });
+  return response.data;
+};
+
 export const getCategoryBreakdown = async () => {
   const response = await api.get('/api/analytics/categories');
   return response.data;
@@ -75,8 +177,11 @@ export const generateInsights = async () => {
   return response.data;
 };
 
-export const getInsights = async () => {
-  const response = await api.get('/api/insights/');
+// Returns { insights, next_cursor }
+export const getInsights = async (cursor = null, limit = 20) => {
+  const response = await api.get('/api/insights/', {
+    params: { limit, ...(cursor ? { cursor } : {}) },
+  });
   return response.data;
 };
 